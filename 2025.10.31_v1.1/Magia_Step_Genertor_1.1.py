@@ -4,17 +4,383 @@ from collections import defaultdict
 import re
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
-    QFileDialog, QTabWidget, QGroupBox, QCheckBox, QScrollArea, QTableWidget,
-    QTableWidgetItem, QMessageBox, QHeaderView, QDoubleSpinBox, QAbstractItemView, QAbstractScrollArea, QLineEdit
+    QFileDialog, QCheckBox, QTableWidget,
+    QTableWidgetItem, QMessageBox, QHeaderView, QDoubleSpinBox, QAbstractItemView, QAbstractScrollArea, QLineEdit,
+    QDialog, QGridLayout, QDialogButtonBox, QTreeView, QComboBox
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex, QSortFilterProxyModel
+import fnmatch
 from PyQt5.QtGui import QFont, QPalette, QColor
 from PyQt5.QtWidgets import QStyleFactory
 
 '''
 优化了GUI界面布局，精修步骤窗口独立显示，原子参数分类显示，字体优化，背景深色
+
+参数勾选区改为单个树形视图（QTreeView + 自定义模型），勾选状态保存在模型的集合中，不再为每个参数创建QCheckBox，
+支持按名称筛选、按通配符批量勾选（如phase2的 *_Biso），适用于原子数很多、背底点很多的参数库
+
+新增自动生成步骤：按常规Rietveld顺序（标度因子 -> 零点/仪器 -> 背底 -> 晶胞 -> 峰型 -> 不对称/择优
+-> 原子坐标 -> B值 -> 占位率）生成步骤，可按phase和参数组勾选，参数逐步累积释放
 '''
 
+# 自动生成步骤的阶段顺序：(阶段, 步骤名后缀, 是否属于phase)
+PLAN_STAGES = [
+    ("scale", "Scale", True),
+    ("zero", "Zero", False),
+    ("instrument", "Instrument", False),
+    ("background", "Background", False),
+    ("cell", "Cell", True),
+    ("profile", "Profile", True),
+    ("asym_pref", "Asym_Pref", True),
+    ("absorption", "Absorption", True),
+    ("positions", "XYZ", True),
+    ("biso", "Biso", True),
+    ("occ", "Occ", True),
+]
+PLAN_STAGE_LABELS = {
+    "scale": "标度因子", "zero": "零点", "instrument": "其他仪器参数", "background": "背底",
+    "cell": "晶胞参数", "profile": "峰型参数", "asym_pref": "不对称与择优参数",
+    "absorption": "吸收矫正参数", "positions": "原子坐标", "biso": "B值", "occ": "占位率",
+}
+PLAN_DEFAULT_OFF = {"absorption"}
+PLAN_DEFAULT_EXCLUDE = "Lambda, alpha, beta, gamma"
+
+
+def code_value(order, step_length):
+    # 第order个精修参数的码值：11.00, 21.00, 31.00 ...（整数部分为参数序号*10，小数部分为步长）
+    int_part = (order + 1) * 10
+    return float(f"{int_part + step_length:.2f}")
+
+
+def param_base_name(p):
+    # 加载参数库时非原子参数会被加上 _<phase> 后缀，这里取回原始名称
+    name = p.get("name", "")
+    phase = p.get("phase")
+    if phase is not None and p.get("group") != "原子参数" and name.endswith(f"_{phase}"):
+        return name[:-len(f"_{phase}")]
+    return name
+
+
+def plan_stage_of(p):
+    """参数所属的自动生成阶段，不参与自动生成的参数返回None"""
+    name = param_base_name(p)
+    group = p.get("group")
+    if "phase" not in p and group is None:
+        if name.startswith("BG") or name.startswith("d_"):
+            return "background"
+        return "zero" if name == "Zero" else "instrument"
+    if group == "全局参数":
+        if name == "Scale":
+            return "scale"
+        return "profile" if name == "Shape1" else None
+    if group == "峰型参数":
+        return "profile"
+    if group == "晶胞参数":
+        return "cell"
+    if group == "不对称与择优参数":
+        return "asym_pref"
+    if group == "吸收矫正参数":
+        return "absorption"
+    if group == "原子参数":
+        suffix = name.split("_")[-1]
+        if suffix in ("X", "Y", "Z"):
+            return "positions"
+        if suffix == "Biso" or re.match(r"^B\d\d$", suffix):
+            return "biso"
+        if suffix == "Occ":
+            return "occ"
+    return None
+
+
+def generate_step_plan(param_lib, enabled, exclude=(), cumulative=True, step_length=1.00, start=1):
+    """根据参数库生成步骤列表
+    enabled: {(阶段, phase或None): bool}，仪器/背底阶段的phase为None
+    exclude: 不参与自动生成的参数原始名称（如 Lambda、alpha）
+    cumulative: True时后续步骤保留之前已释放的参数，False时每步只精修本阶段参数
+    start: 第一个步骤的序号（追加到已有步骤之后时为已有步骤数+1，避免步骤名重复）"""
+    exclude = {e.strip() for e in exclude if e.strip()}
+    stage_ids = defaultdict(list)
+    for p in param_lib:
+        if "id" not in p or param_base_name(p) in exclude:
+            continue
+        stage = plan_stage_of(p)
+        if stage is not None and enabled.get((stage, p.get("phase")), False):
+            stage_ids[stage].append(p["id"])
+    steps = []
+    released = []
+    for stage, suffix, _ in PLAN_STAGES:
+        new_ids = [pid for pid in stage_ids.get(stage, []) if pid not in released]
+        if not new_ids:
+            continue
+        released = released + new_ids if cumulative else new_ids
+        steps.append({
+            "name": f"Step{start + len(steps)}_{suffix}",
+            "active_params": [{"id": pid, "value": code_value(i, step_length)} for i, pid in enumerate(released)]
+        })
+    return steps
+
+
+class PlanConfigDialog(QDialog):
+    """自动生成步骤的配置：行为阶段，列为仪器/背底及各phase"""
+    def __init__(self, phases, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("自动生成步骤")
+        self.phases = list(phases)
+        layout = QVBoxLayout(self)
+        grid = QGridLayout()
+        grid.addWidget(QLabel("阶段"), 0, 0)
+        grid.addWidget(QLabel("仪器/背底"), 0, 1)
+        for col, phase in enumerate(self.phases, start=2):
+            grid.addWidget(QLabel(f"phase{phase}"), 0, col)
+        self.checkboxes = {}
+        for row, (stage, _, per_phase) in enumerate(PLAN_STAGES, start=1):
+            grid.addWidget(QLabel(PLAN_STAGE_LABELS[stage]), row, 0)
+            keys = [(stage, phase, col) for col, phase in enumerate(self.phases, start=2)] if per_phase else [(stage, None, 1)]
+            for st, phase, col in keys:
+                cb = QCheckBox()
+                cb.setChecked(stage not in PLAN_DEFAULT_OFF)
+                self.checkboxes[(st, phase)] = cb
+                grid.addWidget(cb, row, col)
+        layout.addLayout(grid)
+        exclude_layout = QHBoxLayout()
+        exclude_layout.addWidget(QLabel("不参与的参数:"))
+        self.exclude_edit = QLineEdit(PLAN_DEFAULT_EXCLUDE)
+        self.exclude_edit.setPlaceholderText("参数原始名称，逗号分隔")
+        exclude_layout.addWidget(self.exclude_edit)
+        layout.addLayout(exclude_layout)
+        self.cumulative_cb = QCheckBox("累积释放参数（后续步骤保留前面已精修的参数）")
+        self.cumulative_cb.setChecked(True)
+        layout.addWidget(self.cumulative_cb)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def get_config(self):
+        return {
+            "enabled": {key: cb.isChecked() for key, cb in self.checkboxes.items()},
+            "exclude": self.exclude_edit.text().split(","),
+            "cumulative": self.cumulative_cb.isChecked(),
+        }
+
+PHASE_GROUP_ORDER = ["全局参数", "峰型参数", "晶胞参数", "不对称与择优参数", "吸收矫正参数", "原子参数"]
+ATOM_PARAM_TYPES = ["X", "Y", "Z", "Biso", "Occ"]
+
+
+class ParamNode:
+    __slots__ = ("name", "pid", "phase", "parent", "children", "row", "n_leaves", "n_checked")
+
+    def __init__(self, name, parent=None, pid=None, phase=None):
+        self.name = name
+        self.pid = pid
+        self.phase = phase
+        self.parent = parent
+        self.children = []
+        self.row = 0
+        self.n_leaves = 1 if pid is not None else 0
+        self.n_checked = 0
+        if parent is not None:
+            self.row = len(parent.children)
+            parent.children.append(self)
+
+
+class ParamTreeModel(QAbstractItemModel):
+    """参数树：仪器参数 / 背底参数 / phase -> 参数组 -> (原子参数: 元素 -> 原子) -> 参数
+    勾选状态只保存为参数id集合，父节点记录已勾选叶子数以显示半选状态；视图只请求可见行"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.root = ParamNode("")
+        self.checked = set()
+        self.leaf_order = []  # 叶子参数id的树序，保证勾选顺序与界面一致
+        self.leaf_nodes = {}
+
+    def build(self, instrument_params, bg_params, phase_group_dict):
+        self.beginResetModel()
+        self.root = ParamNode("")
+        self.checked = set()
+        self.leaf_order = []
+        self.leaf_nodes = {}
+        for title, params in (("仪器参数", instrument_params), ("背底参数", bg_params)):
+            if params:
+                node = ParamNode(title, self.root)
+                for p in params:
+                    self._add_leaf(node, p, None)
+        for phase in sorted(phase_group_dict.keys()):
+            phase_node = ParamNode(f"phase{phase}", self.root, phase=phase)
+            group_dict = phase_group_dict[phase]
+            for group in PHASE_GROUP_ORDER:
+                if group not in group_dict:
+                    continue
+                group_node = ParamNode(group, phase_node, phase=phase)
+                if group != "原子参数":
+                    for p in group_dict[group]:
+                        self._add_leaf(group_node, p, phase)
+                    continue
+                atom_groups = defaultdict(lambda: defaultdict(list))  # element -> atom_label -> params
+                for param in group_dict[group]:
+                    name = param.get("name", "")
+                    if "_" in name and name.split("_")[-1] in ATOM_PARAM_TYPES:
+                        atom_label = "_".join(name.split("_")[:-1])
+                        match = re.match(r'^([A-Za-z]+)', atom_label)
+                        element = match.group(1) if match else "Unknown"
+                        atom_groups[element][atom_label].append(param)
+                for element in sorted(atom_groups.keys()):
+                    element_node = ParamNode(element, group_node, phase=phase)
+                    for atom_label in sorted(atom_groups[element].keys()):
+                        atom_node = ParamNode(atom_label, element_node, phase=phase)
+                        for p in atom_groups[element][atom_label]:
+                            self._add_leaf(atom_node, p, phase)
+        self._count_leaves(self.root)
+        self.endResetModel()
+
+    def _add_leaf(self, parent, p, phase):
+        node = ParamNode(p.get("name", ""), parent, pid=p.get("id", None), phase=phase)
+        self.leaf_order.append(node.pid)
+        self.leaf_nodes[node.pid] = node
+
+    def _count_leaves(self, node):
+        if node.children:
+            node.n_leaves = sum(self._count_leaves(c) for c in node.children)
+        return node.n_leaves
+
+    def leaves(self, node):
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n.pid is not None:
+                yield n
+            else:
+                stack.extend(reversed(n.children))
+
+    # ---- QAbstractItemModel ----
+    def index(self, row, column, parent=QModelIndex()):
+        node = parent.internalPointer() if parent.isValid() else self.root
+        if column != 0 or not (0 <= row < len(node.children)):
+            return QModelIndex()
+        return self.createIndex(row, 0, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        p = index.internalPointer().parent
+        if p is None or p is self.root:
+            return QModelIndex()
+        return self.createIndex(p.row, 0, p)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        node = parent.internalPointer() if parent.isValid() else self.root
+        return len(node.children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.DisplayRole:
+            if node.pid is None:
+                return f"{node.name} ({node.n_checked}/{node.n_leaves})"
+            return node.name
+        if role == Qt.UserRole:
+            return node.name
+        if role == Qt.CheckStateRole:
+            if node.pid is not None:
+                return Qt.Checked if node.pid in self.checked else Qt.Unchecked
+            if node.n_checked == 0:
+                return Qt.Unchecked
+            return Qt.Checked if node.n_checked == node.n_leaves else Qt.PartiallyChecked
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or not index.isValid():
+            return False
+        # 点击父节点即勾选/取消其下所有参数
+        pids = [n.pid for n in self.leaves(index.internalPointer())]
+        self.set_checked(pids, int(value) == Qt.Checked)
+        return True
+
+    # ---- 勾选操作 ----
+    def set_checked(self, pids, checked):
+        touched = set()
+        delta = 1 if checked else -1
+        for pid in pids:
+            node = self.leaf_nodes.get(pid)
+            if node is None or (pid in self.checked) == checked:
+                continue
+            if checked:
+                self.checked.add(pid)
+            else:
+                self.checked.discard(pid)
+            touched.add(node)
+            node = node.parent
+            while node is not self.root:
+                node.n_checked += delta
+                touched.add(node)
+                node = node.parent
+        # 按父节点合并 dataChanged 通知
+        rows_by_parent = defaultdict(list)
+        for node in touched:
+            rows_by_parent[node.parent].append(node.row)
+        for parent, rows in rows_by_parent.items():
+            first = self.createIndex(min(rows), 0, parent.children[min(rows)])
+            last = self.createIndex(max(rows), 0, parent.children[max(rows)])
+            self.dataChanged.emit(first, last, [Qt.CheckStateRole, Qt.DisplayRole])
+
+    def match_pattern(self, pattern, phase=None):
+        """通配符匹配参数名（不区分大小写），phase为None时匹配所有phase及仪器/背底参数"""
+        pattern = pattern.strip().lower()
+        return [
+            n.pid for n in self.leaves(self.root)
+            if fnmatch.fnmatchcase(n.name.lower(), pattern) and (phase is None or n.phase == phase)
+        ]
+
+    def checked_ids(self):
+        return [pid for pid in self.leaf_order if pid in self.checked]
+
+    def clear_checked(self):
+        self.set_checked(list(self.checked), False)
+
+
+class ParamFilterProxy(QSortFilterProxyModel):
+    """参数树筛选：节点名匹配时其全部子节点一并显示（如筛选 phase2 显示该phase下所有参数），
+    子节点匹配时由递归筛选显示其父节点；点击父节点只勾选/取消当前显示出来的参数"""
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if super().filterAcceptsRow(source_row, source_parent):
+            return True
+        parent = source_parent
+        while parent.isValid():
+            if super().filterAcceptsRow(parent.row(), parent.parent()):
+                return True
+            parent = parent.parent()
+        return False
+
+    def visible_leaves(self, index):
+        stack = [index]
+        while stack:
+            idx = stack.pop()
+            node = self.mapToSource(idx).internalPointer()
+            if node.pid is not None:
+                yield node.pid
+            else:
+                stack.extend(self.index(r, 0, idx) for r in range(self.rowCount(idx)))
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or not index.isValid():
+            return super().setData(index, value, role)
+        self.sourceModel().set_checked(list(self.visible_leaves(index)), int(value) == Qt.Checked)
+        return True
+
+
 class StepTableWindow(QWidget):
     def __init__(self, parent):
         super().__init__()
@@ -76,7 +442,7 @@ class StepConfigGUI(QWidget):
         QPushButton:hover {
             background-color: #555;
         }
-        QLineEdit, QDoubleSpinBox, QTabWidget, QTableWidget, QScrollArea {
+        QLineEdit, QDoubleSpinBox, QTabWidget, QTableWidget, QScrollArea, QTreeView, QComboBox {
             background-color: #2C2F33;
             color: #F0F0F0;
             border: 1px solid #444;
@@ -168,25 +534,55 @@ class StepConfigGUI(QWidget):
         self.add_step_btn.clicked.connect(self.add_step)
         top_layout.addWidget(self.add_step_btn)
 
+        self.auto_plan_btn = QPushButton("自动生成步骤")
+        self.auto_plan_btn.clicked.connect(self.auto_generate_steps)
+        top_layout.addWidget(self.auto_plan_btn)
+
         self.reset_all_btn = QPushButton("重置所有参数")
         self.reset_all_btn.clicked.connect(self.reset_all_params)
         top_layout.addWidget(self.reset_all_btn)
 
         main_layout.addLayout(top_layout)
 
-        # 仪器参数和背底参数勾选区（加滚动区和固定高度）
-        self.inst_bg_scroll = QScrollArea()
-        self.inst_bg_scroll.setWidgetResizable(True)
-        self.inst_bg_scroll.setFixedHeight(200)
-        self.inst_bg_widget = QWidget()
-        self.inst_bg_layout = QHBoxLayout(self.inst_bg_widget)
-        self.inst_bg_layout.setContentsMargins(0, 0, 0, 0)
-        self.inst_bg_scroll.setWidget(self.inst_bg_widget)
-        main_layout.addWidget(self.inst_bg_scroll)
-
-        # 参数库tab
-        self.tab_widget = QTabWidget()
-        main_layout.addWidget(self.tab_widget, stretch=2)
+        # 参数树：筛选与按通配符批量勾选
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("筛选:"))
+        self.param_filter_edit = QLineEdit()
+        self.param_filter_edit.setPlaceholderText("按名称筛选，如 Biso、phase2")
+        self.param_filter_edit.textChanged.connect(self.on_param_filter_changed)
+        filter_layout.addWidget(self.param_filter_edit)
+        filter_layout.addWidget(QLabel("批量勾选:"))
+        self.pattern_phase_combo = QComboBox()
+        self.pattern_phase_combo.addItem("全部phase", None)
+        filter_layout.addWidget(self.pattern_phase_combo)
+        self.pattern_edit = QLineEdit()
+        self.pattern_edit.setPlaceholderText("通配符，如 *_Biso、BG*、Li*_Occ")
+        filter_layout.addWidget(self.pattern_edit)
+        self.pattern_check_btn = QPushButton("勾选")
+        self.pattern_check_btn.clicked.connect(lambda: self.apply_pattern_selection(True))
+        filter_layout.addWidget(self.pattern_check_btn)
+        self.pattern_uncheck_btn = QPushButton("取消勾选")
+        self.pattern_uncheck_btn.clicked.connect(lambda: self.apply_pattern_selection(False))
+        filter_layout.addWidget(self.pattern_uncheck_btn)
+        self.expand_btn = QPushButton("展开")
+        self.expand_btn.clicked.connect(lambda: self.param_tree.expandAll())
+        filter_layout.addWidget(self.expand_btn)
+        self.collapse_btn = QPushButton("折叠")
+        self.collapse_btn.clicked.connect(lambda: self.param_tree.collapseAll())
+        filter_layout.addWidget(self.collapse_btn)
+        main_layout.addLayout(filter_layout)
+
+        self.param_model = ParamTreeModel(self)
+        self.param_proxy = ParamFilterProxy(self)
+        self.param_proxy.setSourceModel(self.param_model)
+        self.param_proxy.setFilterRole(Qt.UserRole)
+        self.param_proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.param_proxy.setRecursiveFilteringEnabled(True)
+        self.param_tree = QTreeView()
+        self.param_tree.setHeaderHidden(True)
+        self.param_tree.setUniformRowHeights(True)
+        self.param_tree.setModel(self.param_proxy)
+        main_layout.addWidget(self.param_tree, stretch=2)
 
     def export_step_table_to_txt(self):
         file_path, _ = QFileDialog.getSaveFileName(self, "导出表格内容", "", "Text Files (*.txt)")
@@ -287,229 +683,41 @@ class StepConfigGUI(QWidget):
             if "id" in p:
                 self.param_id_map[p["id"]] = p
 
-        self.refresh_inst_bg_checkboxes()
-        self.refresh_param_tabs()
+        self.refresh_param_tree()
         self.refresh_step_table()
 
-    def refresh_inst_bg_checkboxes(self):
-        # 清空
-        for i in reversed(range(self.inst_bg_layout.count())):
-            widget = self.inst_bg_layout.itemAt(i).widget()
-            if widget:
-                widget.setParent(None)
-        # 仪器参数
-        self.inst_checkboxes = {}
-        inst_group = QGroupBox("仪器参数")
-        inst_layout = QVBoxLayout()
-        btn_layout = QHBoxLayout()
-        select_btn = QPushButton("全选")
-        select_btn.clicked.connect(lambda: self.select_group_checkboxes(self.inst_checkboxes))
-        reset_btn = QPushButton("重置")
-        reset_btn.clicked.connect(lambda: self.reset_group_checkboxes(self.inst_checkboxes))
-        btn_layout.addWidget(select_btn)
-        btn_layout.addWidget(reset_btn)
-        btn_layout.addStretch()
-        inst_layout.addLayout(btn_layout)
-        for p in self.instrument_params:
-            cb = QCheckBox(p.get("name", ""))
-            cb.param_id = p.get("id", None)
-            self.inst_checkboxes[p.get("id", None)] = cb
-            inst_layout.addWidget(cb)
-        inst_group.setLayout(inst_layout)
-        self.inst_bg_layout.addWidget(inst_group)
-        # 背底参数
-        self.bg_checkboxes = {}
-        bg_group = QGroupBox("背底参数")
-        bg_layout = QVBoxLayout()
-        btn_layout2 = QHBoxLayout()
-        select_btn2 = QPushButton("全选")
-        select_btn2.clicked.connect(lambda: self.select_group_checkboxes(self.bg_checkboxes))
-        reset_btn2 = QPushButton("重置")
-        reset_btn2.clicked.connect(lambda: self.reset_group_checkboxes(self.bg_checkboxes))
-        btn_layout2.addWidget(select_btn2)
-        btn_layout2.addWidget(reset_btn2)
-        btn_layout2.addStretch()
-        bg_layout.addLayout(btn_layout2)
-        for p in self.bg_params:
-            cb = QCheckBox(p.get("name", ""))
-            cb.param_id = p.get("id", None)
-            self.bg_checkboxes[p.get("id", None)] = cb
-            bg_layout.addWidget(cb)
-        bg_group.setLayout(bg_layout)
-        self.inst_bg_layout.addWidget(bg_group)
-
-    def refresh_param_tabs(self):
-        self.tab_widget.clear()
-        self.phase_checkboxes = defaultdict(lambda: defaultdict(dict))  # phase -> group -> varies
+    def refresh_param_tree(self):
+        self.param_model.build(self.instrument_params, self.bg_params, self.phase_group_dict)
+        self.pattern_phase_combo.clear()
+        self.pattern_phase_combo.addItem("全部phase", None)
         for phase in sorted(self.phase_group_dict.keys()):
-            tab = QWidget()
-            tab_layout = QVBoxLayout()
-            group_dict = self.phase_group_dict[phase]
-            for group in ["全局参数", "峰型参数", "晶胞参数", "不对称与择优参数", "吸收矫正参数", "原子参数"]:
-                if group not in group_dict:
-                    continue
-                group_box = QGroupBox(group)
-                group_layout = QVBoxLayout()
-                btn_layout = QHBoxLayout()
-                select_btn = QPushButton("全选")
-                select_btn.setMaximumWidth(60)
-                select_btn.clicked.connect(lambda _, ph=phase, gr=group: self.select_phase_group_checkboxes(ph, gr))
-                reset_btn = QPushButton("重置")
-                reset_btn.setMaximumWidth(60)
-                reset_btn.clicked.connect(lambda _, ph=phase, gr=group: self.reset_phase_group_checkboxes(ph, gr))
-                btn_layout.addWidget(select_btn)
-                btn_layout.addWidget(reset_btn)
-                btn_layout.addStretch()
-                group_layout.addLayout(btn_layout)
-
-                if group == "原子参数":
-                    atom_groups = defaultdict(lambda: defaultdict(list))  # element -> atom_label -> params
-                    for param in group_dict[group]:
-                        name = param.get("name", "")
-                        if "_" in name:
-                            parts = name.split("_")
-                            atom_label = "_".join(parts[:-1])
-                            param_type = parts[-1]
-                            match = re.match(r'^([A-Za-z]+)', atom_label)
-                            element = match.group(1) if match else "Unknown"
-                            atom_groups[element][atom_label].append(param)
-                    self.phase_checkboxes[phase][group] = defaultdict(lambda: defaultdict(dict))
-                    for element in sorted(atom_groups.keys()):
-                        element_box = QGroupBox(element)
-                        element_layout = QVBoxLayout()
-                        for atom_label in sorted(atom_groups[element].keys()):
-                            sub_group_box = QGroupBox(atom_label)
-                            sub_layout = QVBoxLayout()
-                            sub_btn_layout = QHBoxLayout()
-                            sub_select_btn = QPushButton("全选")
-                            sub_select_btn.setMaximumWidth(60)
-                            sub_select_btn.clicked.connect(lambda _, ph=phase, gr=group, el=element, at=atom_label: self.select_atom_checkboxes(ph, gr, el, at))
-                            sub_reset_btn = QPushButton("重置")
-                            sub_reset_btn.setMaximumWidth(60)
-                            sub_reset_btn.clicked.connect(lambda _, ph=phase, gr=group, el=element, at=atom_label: self.reset_atom_checkboxes(ph, gr, el, at))
-                            sub_btn_layout.addWidget(sub_select_btn)
-                            sub_btn_layout.addWidget(sub_reset_btn)
-                            sub_btn_layout.addStretch()
-                            sub_layout.addLayout(sub_btn_layout)
-
-                            # 添加原子标签标题
-                            label = QLabel(atom_label)
-                            label.setStyleSheet("font-weight: bold;")
-                            sub_layout.addWidget(label)
-
-                            # 添加 X, Y, Z, Biso, Occ 参数
-                            for param in atom_groups[element][atom_label]:
-                                pname = param.get("name", "")
-                                if pname.split("_")[-1] in ["X", "Y", "Z", "Biso", "Occ"]:
-                                    cb = QCheckBox(pname)
-                                    cb.param_id = param.get("id", None)
-                                    self.phase_checkboxes[phase][group][element][atom_label][param.get("id", None)] = cb
-                                    sub_layout.addWidget(cb)
-                            sub_group_box.setLayout(sub_layout)
-                            element_layout.addWidget(sub_group_box)
-                        element_box.setLayout(element_layout)
-                        group_layout.addWidget(element_box)
-                else:
-                    for param in group_dict[group]:
-                        cb = QCheckBox(param.get("name", ""))
-                        cb.param_id = param.get("id", None)
-                        self.phase_checkboxes[phase][group][param.get("id", None)] = cb
-                        group_layout.addWidget(cb)
-                group_box.setLayout(group_layout)
-                tab_layout.addWidget(group_box)
-            tab_layout.addStretch()
-            scroll = QScrollArea()
-            scroll.setWidgetResizable(True)
-            tab_content = QWidget()
-            tab_content.setLayout(tab_layout)
-            scroll.setWidget(tab_content)
-            self.tab_widget.addTab(scroll, f"phase{phase}")
-
-    def select_group_checkboxes(self, checkbox_dict):
-        for cb in checkbox_dict.values():
-            cb.setChecked(True)
-
-    def reset_group_checkboxes(self, checkbox_dict):
-        for cb in checkbox_dict.values():
-            if cb.isChecked():
-                cb.setChecked(False)
-
-    def select_phase_group_checkboxes(self, phase, group):
-        group_dict = self.phase_checkboxes[phase][group]
-        if group == "原子参数":
-            for element in group_dict:
-                for atom_label in group_dict[element]:
-                    for cb in group_dict[element][atom_label].values():
-                        cb.setChecked(True)
-        else:
-            for cb in group_dict.values():
-                cb.setChecked(True)
-
-    def reset_phase_group_checkboxes(self, phase, group):
-        group_dict = self.phase_checkboxes[phase][group]
-        if group == "原子参数":
-            for element in group_dict:
-                for atom_label in group_dict[element]:
-                    for cb in group_dict[element][atom_label].values():
-                        if cb.isChecked():
-                            cb.setChecked(False)
-        else:
-            for cb in group_dict.values():
-                if cb.isChecked():
-                    cb.setChecked(False)
-
-    def select_atom_checkboxes(self, phase, group, element, atom_label):
-        for cb in self.phase_checkboxes[phase][group][element][atom_label].values():
-            cb.setChecked(True)
-
-    def reset_atom_checkboxes(self, phase, group, element, atom_label):
-        for cb in self.phase_checkboxes[phase][group][element][atom_label].values():
-            if cb.isChecked():
-                cb.setChecked(False)
+            self.pattern_phase_combo.addItem(f"phase{phase}", phase)
+        # 默认只展开第一层，原子等深层节点按需展开
+        self.param_tree.collapseAll()
+        for row in range(self.param_proxy.rowCount()):
+            self.param_tree.expand(self.param_proxy.index(row, 0))
+
+    def on_param_filter_changed(self, text):
+        self.param_proxy.setFilterFixedString(text.strip())
+        if text.strip():
+            self.param_tree.expandAll()
+
+    def apply_pattern_selection(self, checked):
+        pattern = self.pattern_edit.text().strip()
+        if not pattern:
+            QMessageBox.warning(self, "提示", "请输入通配符，如 *_Biso")
+            return
+        pids = self.param_model.match_pattern(pattern, self.pattern_phase_combo.currentData())
+        if not pids:
+            QMessageBox.warning(self, "提示", f"没有匹配 {pattern} 的参数")
+            return
+        self.param_model.set_checked(pids, checked)
 
     def reset_all_params(self):
-        for cb in self.inst_checkboxes.values():
-            if cb.isChecked():
-                cb.setChecked(False)
-        for cb in self.bg_checkboxes.values():
-            if cb.isChecked():
-                cb.setChecked(False)
-        for phase in self.phase_checkboxes:
-            for group in self.phase_checkboxes[phase]:
-                group_dict = self.phase_checkboxes[phase][group]
-                if group == "原子参数":
-                    for element in group_dict:
-                        for atom_label in group_dict[element]:
-                            for cb in group_dict[element][atom_label].values():
-                                if cb.isChecked():
-                                    cb.setChecked(False)
-                else:
-                    for cb in group_dict.values():
-                        if cb.isChecked():
-                            cb.setChecked(False)
+        self.param_model.clear_checked()
 
     def get_checked_param_ids(self):
-        checked_ids = []
-        for pid, cb in self.inst_checkboxes.items():
-            if cb.isChecked():
-                checked_ids.append(pid)
-        for pid, cb in self.bg_checkboxes.items():
-            if cb.isChecked():
-                checked_ids.append(pid)
-        for phase in self.phase_checkboxes:
-            for group in self.phase_checkboxes[phase]:
-                group_dict = self.phase_checkboxes[phase][group]
-                if group == "原子参数":
-                    for element in group_dict:
-                        for atom_label in group_dict[element]:
-                            for pid, cb in group_dict[element][atom_label].items():
-                                if cb.isChecked():
-                                    checked_ids.append(pid)
-                else:
-                    for pid, cb in group_dict.items():
-                        if cb.isChecked():
-                            checked_ids.append(pid)
-        return checked_ids
+        return self.param_model.checked_ids()
 
     def add_step(self):
         checked_ids = self.get_checked_param_ids()
@@ -527,9 +735,37 @@ class StepConfigGUI(QWidget):
         self.refresh_step_table()
 
     def generate_value(self, order, step_length):
-        int_part = (order + 1) * 10
-        value = float(f"{int_part + step_length:.2f}")
-        return value
+        return code_value(order, step_length)
+
+    def auto_generate_steps(self):
+        if not self.param_lib:
+            QMessageBox.warning(self, "提示", "请先加载参数库")
+            return
+        dialog = PlanConfigDialog(sorted(self.phase_group_dict.keys()), self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        cfg = dialog.get_config()
+
+        def make_plan(start=1):
+            return generate_step_plan(
+                self.param_lib, cfg["enabled"], exclude=cfg["exclude"],
+                cumulative=cfg["cumulative"], step_length=self.current_step_length, start=start
+            )
+        plan = make_plan()
+        if not plan:
+            QMessageBox.warning(self, "提示", "所选阶段中没有可精修的参数")
+            return
+        if self.steps:
+            reply = QMessageBox.question(
+                self, "自动生成步骤", "是否替换现有步骤？（选择“否”则追加到末尾）",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.Yes
+            )
+            if reply == QMessageBox.Cancel:
+                return
+            if reply == QMessageBox.No:
+                plan = self.steps + make_plan(start=len(self.steps) + 1)
+        self.steps = plan
+        self.refresh_step_table()
 
     def on_step_length_changed(self, val):
         self.current_step_length = float(val)
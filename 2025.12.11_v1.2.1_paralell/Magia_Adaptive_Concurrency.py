@@ -0,0 +1,196 @@
+'''2026.01
+并行精修的自适应并行数控制：
+- 主机压力：/proc/loadavg 运行队列、/proc/stat 的iowait比例、/proc/diskstats 的磁盘繁忙度
+  （非Linux系统有psutil时用psutil的CPU占用和磁盘繁忙时间，都取不到时保持当前并行数不变）
+- FullProf进度：所有任务每秒输出的 [Max] Shift 行数（精修循环速率），以及阻塞检测触发次数
+- 按AIMD调整：压力低且单任务循环速率没有下降时并行数+1，压力高/出现阻塞/循环速率明显下降时乘以0.7，
+  始终在用户设置的最小、最大并行数之间；减少并行数时不终止正在运行的任务，只是暂不启动新任务
+'''
+import os
+import time
+import threading
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 判定阈值
+HIGH_DISK_UTIL = 0.90      # 磁盘繁忙比例
+LOW_DISK_UTIL = 0.60
+HIGH_IOWAIT = 0.25         # iowait占CPU时间比例
+LOW_IOWAIT = 0.10
+HIGH_RUNQ_PER_CPU = 1.5    # 运行队列长度 / CPU核数
+LOW_RUNQ_PER_CPU = 1.0
+RATE_DROP = 0.6            # 单任务循环速率低于历史最好值的60%视为变慢
+RATE_SMOOTH = 0.3          # 循环速率的指数平滑系数
+BEST_RATE_DECAY = 0.98     # 历史最好速率每轮衰减，适应不同步骤的循环耗时差异
+DECREASE_FACTOR = 0.7
+COOLDOWN_ROUNDS = 2        # 减少并行数后至少观察几轮再增加
+
+
+def _whole_disks():
+    """/sys/block 下列出的是整块磁盘（不含分区），排除loop/ram等虚拟设备"""
+    try:
+        return {d for d in os.listdir("/sys/block") if not d.startswith(("loop", "ram", "zram"))}
+    except Exception:
+        return None
+
+
+class HostPressure:
+    """两次调用 sample() 之间的主机压力"""
+
+    def __init__(self):
+        self._last_cpu = None
+        self._last_disk = None
+        self._last_time = None
+        self.ncpu = os.cpu_count() or 1
+
+    def _read_cpu(self):
+        with open("/proc/stat", 'r') as f:
+            values = [int(v) for v in f.readline().split()[1:]]
+        iowait = values[4] if len(values) > 4 else 0
+        return sum(values), iowait
+
+    def _read_disk_ticks(self):
+        disks = _whole_disks()
+        ticks = {}
+        with open("/proc/diskstats", 'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 13 and (disks is None or fields[2] in disks):
+                    ticks[fields[2]] = int(fields[12])  # io_ticks: 有IO在进行的毫秒数
+        return ticks
+
+    def sample(self):
+        """返回 {"runq": 每核运行队列, "iowait": 比例, "disk": 最忙磁盘的繁忙比例}，取不到的项为None"""
+        now = time.time()
+        result = {"runq": None, "iowait": None, "disk": None}
+        if os.path.exists("/proc/stat"):
+            try:
+                with open("/proc/loadavg", 'r') as f:
+                    running = int(f.read().split()[3].split('/')[0])
+                result["runq"] = max(0, running - 1) / self.ncpu  # 不算读取者自己
+            except Exception:
+                pass
+            try:
+                total, iowait = self._read_cpu()
+                if self._last_cpu is not None and total > self._last_cpu[0]:
+                    result["iowait"] = (iowait - self._last_cpu[1]) / (total - self._last_cpu[0])
+                self._last_cpu = (total, iowait)
+            except Exception:
+                pass
+            try:
+                ticks = self._read_disk_ticks()
+                if self._last_disk is not None and ticks:
+                    dt_ms = (now - self._last_time) * 1000
+                    if dt_ms > 0:
+                        result["disk"] = min(1.0, max(
+                            (ticks[d] - self._last_disk.get(d, ticks[d])) / dt_ms for d in ticks
+                        ))
+                self._last_disk = ticks
+            except Exception:
+                pass
+        elif psutil is not None:
+            try:
+                result["runq"] = psutil.cpu_percent(interval=None) / 100.0
+                io = psutil.disk_io_counters()
+                busy = getattr(io, "busy_time", None)
+                if busy is None:
+                    busy = io.read_time + io.write_time  # Windows没有busy_time，用读写耗时近似
+                if self._last_disk is not None:
+                    dt_ms = (now - self._last_time) * 1000
+                    if dt_ms > 0:
+                        result["disk"] = min(1.0, max(0.0, (busy - self._last_disk) / dt_ms))
+                self._last_disk = busy
+            except Exception:
+                pass
+        self._last_time = now
+        return result
+
+
+class ConcurrencyController:
+    def __init__(self, min_jobs, max_jobs, initial=None):
+        self.min_jobs = max(1, int(min_jobs))
+        self.max_jobs = max(self.min_jobs, int(max_jobs))
+        if initial is None:
+            initial = self.min_jobs
+        self.target = min(self.max_jobs, max(self.min_jobs, int(initial)))
+        self.pressure = HostPressure()
+        self.pressure.sample()
+        self.lock = threading.Lock()
+        self._cycles = 0
+        self._blocks = 0
+        self._last_time = time.time()
+        self._rate = None       # 平滑后的单任务循环速率
+        self._best_rate = None  # 历史最好的单任务循环速率
+        self._cooldown = 0
+        self.last_state = {}
+
+    def record_event(self, kind):
+        """由worker线程调用：kind 为 "cycle"（一次精修循环）或 "block"（阻塞检测触发）"""
+        with self.lock:
+            if kind == "cycle":
+                self._cycles += 1
+            elif kind == "block":
+                self._blocks += 1
+
+    def update(self, active_jobs):
+        """定时调用，返回新的目标并行数"""
+        now = time.time()
+        with self.lock:
+            cycles, blocks = self._cycles, self._blocks
+            self._cycles = self._blocks = 0
+        dt = max(1e-6, now - self._last_time)
+        self._last_time = now
+        p = self.pressure.sample()
+        rate = None
+        slow = False
+        if active_jobs and cycles > 0:
+            raw = cycles / dt / active_jobs
+            self._rate = raw if self._rate is None else RATE_SMOOTH * raw + (1 - RATE_SMOOTH) * self._rate
+            rate = self._rate
+            if self._best_rate is None or rate > self._best_rate:
+                self._best_rate = rate
+            slow = rate < RATE_DROP * self._best_rate
+            self._best_rate *= BEST_RATE_DECAY
+
+        overloaded = (
+            blocks > 0 or slow
+            or (p["disk"] is not None and p["disk"] > HIGH_DISK_UTIL)
+            or (p["iowait"] is not None and p["iowait"] > HIGH_IOWAIT)
+            or (p["runq"] is not None and p["runq"] > HIGH_RUNQ_PER_CPU)
+        )
+        known = [v for v in (p["disk"], p["iowait"], p["runq"]) if v is not None]
+        relaxed = bool(known) and (
+            (p["disk"] is None or p["disk"] < LOW_DISK_UTIL)
+            and (p["iowait"] is None or p["iowait"] < LOW_IOWAIT)
+            and (p["runq"] is None or p["runq"] < LOW_RUNQ_PER_CPU)
+        )
+
+        old = self.target
+        if overloaded:
+            self.target = max(self.min_jobs, int(self.target * DECREASE_FACTOR))
+            self._cooldown = COOLDOWN_ROUNDS
+        elif self._cooldown > 0:
+            self._cooldown -= 1
+        elif relaxed and active_jobs >= self.target:
+            # 只有当前并行数已经跑满时才继续增加
+            self.target = min(self.max_jobs, self.target + 1)
+
+        self.last_state = dict(p, rate=rate, blocks=blocks, target=self.target, changed=self.target - old)
+        return self.target
+
+    def describe(self):
+        s = self.last_state
+        if not s:
+            return f"并行数: {self.target}"
+
+        def pct(v):
+            return "-" if v is None else f"{v * 100:.0f}%"
+        rate = "-" if s.get("rate") is None else f"{s['rate']:.2f}/s"
+        runq = "-" if s.get("runq") is None else f"{s['runq']:.2f}"
+        return (
+            f"并行数: {self.target} ({self.min_jobs}-{self.max_jobs})  磁盘繁忙: {pct(s.get('disk'))}  "
+            f"iowait: {pct(s.get('iowait'))}  每核运行队列: {runq}  单任务循环速率: {rate}"
+        )
@@ -0,0 +1,368 @@
+'''2026.01
+并行批量精修的统一面板，替代每个dat弹出一个 RealtimeRefineWindow：
+- 一个表格显示所有dat（排队/运行中/完成/已终止、当前步骤、进度、耗时、最近Chi²、预计剩余时间）
+- 一个日志区，可按任务筛选（每个任务只保留最近若干行；“全部任务”为所有任务共用的环形缓冲，按到达顺序显示）
+- 选中任务后可暂停/继续/跳过当前步骤/终止
+整个面板只有一个刷新定时器，日志和表格每秒合并刷新一次；日志只追加新到的行，筛选条件改变时才重建，
+并行32个任务时界面开销也基本不变
+CPU/内存/读写列来自进程监管（Magia_Process_Supervisor.py），为当前步骤fp2k进程的实时数据
+'''
+import re
+import time
+from collections import deque, OrderedDict
+from PyQt5.QtWidgets import (
+    QDialog, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableView, QPlainTextEdit,
+    QComboBox, QSplitter, QAbstractItemView, QHeaderView, QLineEdit
+)
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+from Magia_Process_Supervisor import supervisor
+
+JOB_COLUMNS = ["dat文件", "状态", "当前步骤", "进度", "耗时", "最近Chi²", "预计剩余", "CPU", "内存", "读/写"]
+CHI_PATTERN = re.compile(r'Chi²:\s*([-\d.eE+]+)')
+ALL_JOBS = "全部任务"
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h:d}:{m:02d}:{s:02d}" if h else f"{m:d}:{s:02d}"
+
+
+def format_bytes(n):
+    for unit in ("B", "K", "M", "G"):
+        if n < 1024:
+            return f"{n:.0f}{unit}"
+        n /= 1024
+    return f"{n:.1f}T"
+
+
+class BatchJob:
+    __slots__ = ("name", "status", "worker", "start", "end", "progress", "chi2", "overview", "logs", "usage")
+
+    def __init__(self, name, max_log_lines):
+        self.name = name
+        self.status = "排队"
+        self.worker = None
+        self.start = None
+        self.end = None
+        self.progress = 0
+        self.chi2 = None
+        self.overview = []
+        self.logs = deque(maxlen=max_log_lines)
+        self.usage = None  # 当前fp2k进程的CPU/内存/IO
+
+    def elapsed(self):
+        if self.start is None:
+            return None
+        return (self.end or time.time()) - self.start
+
+    def current_step(self):
+        for entry in self.overview:
+            if entry.get("status") == "运行中":
+                return f"{entry.get('index')}/{len(self.overview)} {entry.get('name', '')}"
+        return "-"
+
+    def eta(self):
+        """按已完成步骤的平均耗时估算剩余时间"""
+        if self.status != "运行中" or not self.overview:
+            return None
+        done = [e for e in self.overview if e.get("status") in ("成功", "失败", "跳过")]
+        if not done:
+            return None
+        per_step = sum(e.get("duration", 0) for e in done) / len(done)
+        remaining = len(self.overview) - len(done)
+        running = next((e for e in self.overview if e.get("status") == "运行中"), None)
+        spent = running.get("duration", 0) if running else 0
+        return max(0.0, remaining * per_step - spent)
+
+
+class JobTableModel(QAbstractTableModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.jobs = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.jobs)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(JOB_COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return JOB_COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        job = self.jobs[index.row()]
+        col = index.column()
+        if col == 0:
+            return job.name
+        if col == 1:
+            return job.status
+        if col == 2:
+            return job.current_step()
+        if col == 3:
+            return f"{job.progress}%"
+        if col == 4:
+            return format_seconds(job.elapsed())
+        if col == 5:
+            return "-" if job.chi2 is None else f"{job.chi2:.2f}"
+        if col == 6:
+            return format_seconds(job.eta())
+        if job.usage is None:
+            return "-" if col >= 7 else None
+        if col == 7:
+            return f"{job.usage['cpu']:.0f}%"
+        if col == 8:
+            return format_bytes(job.usage["rss"])
+        if col == 9:
+            return f"{format_bytes(job.usage['read_bytes'])}/{format_bytes(job.usage['write_bytes'])}"
+        return None
+
+    def set_jobs(self, jobs):
+        self.beginResetModel()
+        self.jobs = jobs
+        self.endResetModel()
+
+    def refresh(self):
+        if self.jobs:
+            self.dataChanged.emit(self.index(0, 1), self.index(len(self.jobs) - 1, len(JOB_COLUMNS) - 1), [Qt.DisplayRole])
+
+
+class BatchDashboard(QDialog):
+    MAX_LOG_LINES = 300  # 每个任务保留的日志行数
+    LOG_VIEW_LINES = 2000  # 日志区显示的行数，也是全部任务共用环形缓冲的大小
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("并行批量精修面板")
+        self.resize(1100, 700)
+        self.jobs = OrderedDict()
+        self._log_seq = 0
+        self._log_ring = deque(maxlen=self.LOG_VIEW_LINES)     # (序号, 任务, 类型, 内容)
+        self._log_pending = deque(maxlen=self.LOG_VIEW_LINES)  # 上次刷新后新到的日志
+        self._log_rebuild = False
+
+        layout = QVBoxLayout(self)
+        self.summary_label = QLabel("")
+        layout.addWidget(self.summary_label)
+        self.concurrency_label = QLabel("")
+        layout.addWidget(self.concurrency_label)
+
+        splitter = QSplitter(Qt.Vertical)
+        self.model = JobTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.table.verticalHeader().setDefaultSectionSize(22)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.selectionModel().selectionChanged.connect(self._on_selection_changed)
+        splitter.addWidget(self.table)
+
+        log_widget = QWidget()
+        log_layout = QVBoxLayout(log_widget)
+        log_layout.setContentsMargins(0, 0, 0, 0)
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("日志任务："))
+        self.job_filter = QComboBox()
+        self.job_filter.addItem(ALL_JOBS)
+        self.job_filter.currentIndexChanged.connect(lambda _: self._mark_log_dirty())
+        filter_layout.addWidget(self.job_filter, 1)
+        filter_layout.addWidget(QLabel("日志类型："))
+        self.type_filter = QComboBox()
+        self.type_filter.addItems(["全部", "main", "warn", "err", "chi"])
+        self.type_filter.currentIndexChanged.connect(lambda _: self._mark_log_dirty())
+        filter_layout.addWidget(self.type_filter)
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("日志搜索（支持关键词）")
+        self.search_box.textChanged.connect(lambda _: self._mark_log_dirty())
+        filter_layout.addWidget(self.search_box, 1)
+        log_layout.addLayout(filter_layout)
+        self.log_view = QPlainTextEdit()
+        self.log_view.setReadOnly(True)
+        self.log_view.setMaximumBlockCount(self.LOG_VIEW_LINES)
+        log_layout.addWidget(self.log_view)
+        splitter.addWidget(log_widget)
+        splitter.setSizes([350, 350])
+        layout.addWidget(splitter)
+
+        btn_layout = QHBoxLayout()
+        self.pause_btn = QPushButton("暂停选中")
+        self.resume_btn = QPushButton("继续选中")
+        self.skip_btn = QPushButton("跳过选中任务的当前步骤")
+        self.stop_btn = QPushButton("终止选中")
+        for btn in (self.pause_btn, self.resume_btn, self.skip_btn, self.stop_btn):
+            btn_layout.addWidget(btn)
+        btn_layout.addStretch()
+        layout.addLayout(btn_layout)
+        self.pause_btn.clicked.connect(lambda: self._for_selected(lambda w: w.pause()))
+        self.resume_btn.clicked.connect(lambda: self._for_selected(lambda w: w.resume()))
+        self.skip_btn.clicked.connect(lambda: self._for_selected(lambda w: w.skip_current_step()))
+        self.stop_btn.clicked.connect(self._stop_selected)
+
+        # 整个面板只有这一个定时器
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._refresh)
+        self._timer.start(1000)
+
+    # ---- 任务生命周期（由主界面调用，均在主线程） ----
+    def set_jobs(self, names):
+        self.jobs = OrderedDict((name, BatchJob(name, self.MAX_LOG_LINES)) for name in names)
+        self.model.set_jobs(list(self.jobs.values()))
+        self.job_filter.blockSignals(True)
+        self.job_filter.clear()
+        self.job_filter.addItem(ALL_JOBS)
+        self.job_filter.addItems(list(self.jobs.keys()))
+        self.job_filter.blockSignals(False)
+        self._log_ring.clear()
+        self._log_pending.clear()
+        self.log_view.clear()
+        self._refresh()
+
+    def job_started(self, name, worker):
+        job = self.jobs[name]
+        job.status = "运行中"
+        job.worker = worker
+        job.start = time.time()
+        worker.log_signal.connect(lambda log_type, msg, n=name: self.append_log(n, log_type, msg))
+        worker.progress_signal.connect(lambda value, n=name: self._set_progress(n, value))
+        worker.step_overview_signal.connect(lambda overview, n=name: self._set_overview(n, overview))
+
+    def job_finished(self, name):
+        job = self.jobs.get(name)
+        if job is None:
+            return
+        job.end = time.time()
+        if job.status == "运行中":
+            job.status = "完成"
+        job.worker = None
+
+    def set_concurrency_info(self, text):
+        self.concurrency_label.setText(text)
+
+    def overview_of(self, name):
+        job = self.jobs.get(name)
+        return job.overview if job else []
+
+    # ---- worker 信号 ----
+    def append_log(self, name, log_type, msg):
+        job = self.jobs.get(name)
+        if job is None:
+            return
+        self._log_seq += 1
+        entry = (self._log_seq, name, log_type, msg)
+        job.logs.append(entry)
+        self._log_ring.append(entry)
+        self._log_pending.append(entry)
+        if log_type == "chi":
+            m = CHI_PATTERN.search(msg)
+            if m:
+                try:
+                    job.chi2 = float(m.group(1))
+                except ValueError:
+                    pass
+
+    def _set_progress(self, name, value):
+        if name in self.jobs:
+            self.jobs[name].progress = value
+
+    def _set_overview(self, name, overview):
+        if name in self.jobs:
+            self.jobs[name].overview = overview
+
+    # ---- 控制 ----
+    def _selected_jobs(self):
+        rows = sorted({idx.row() for idx in self.table.selectionModel().selectedRows()})
+        return [self.model.jobs[r] for r in rows if 0 <= r < len(self.model.jobs)]
+
+    def _for_selected(self, action):
+        for job in self._selected_jobs():
+            if job.worker is not None:
+                try:
+                    action(job.worker)
+                except Exception:
+                    pass
+
+    def _stop_selected(self):
+        for job in self._selected_jobs():
+            if job.worker is not None:
+                job.status = "已终止"
+                try:
+                    job.worker.stop()
+                except Exception:
+                    pass
+            elif job.status == "排队":
+                job.status = "已取消"  # 主界面启动下一个任务时跳过已取消的dat
+
+    def _on_selection_changed(self, *_):
+        jobs = self._selected_jobs()
+        if len(jobs) == 1:
+            self.job_filter.setCurrentText(jobs[0].name)
+
+    # ---- 刷新 ----
+    def _mark_log_dirty(self):
+        # 筛选条件改变：重建日志区
+        self._log_rebuild = True
+        self._refresh_log()
+
+    def _refresh(self):
+        supervisor.sample()
+        for job in self.jobs.values():
+            job.usage = supervisor.stats_by_owner(job.worker) if job.worker is not None else None
+        self.model.refresh()
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        self.summary_label.setText(
+            "  ".join(f"{k}: {v}" for k, v in counts.items())
+            + f"  共 {len(self.jobs)} 个dat  运行中的fp2k进程: {supervisor.live_count()}"
+        )
+        if self._log_rebuild or self._log_pending:
+            self._refresh_log()
+
+    def _log_lines(self, entries):
+        """按当前筛选条件格式化日志（entries按序号递增）"""
+        current = self.job_filter.currentText()
+        log_type = self.type_filter.currentText()
+        keyword = self.search_box.text().strip()
+        lines = []
+        for _, name, t, msg in entries:
+            if current != ALL_JOBS and name != current:
+                continue
+            if log_type != "全部" and t != log_type:
+                continue
+            if keyword and keyword not in msg:
+                continue
+            lines.append(f"[{name}] {msg}" if current == ALL_JOBS else msg)
+        return lines
+
+    def _refresh_log(self):
+        if self._log_rebuild:
+            self._log_rebuild = False
+            self._log_pending.clear()
+            current = self.job_filter.currentText()
+            if current == ALL_JOBS:
+                source = self._log_ring
+            else:
+                job = self.jobs.get(current)
+                source = job.logs if job is not None else ()
+            lines = self._log_lines(source)
+            self.log_view.setPlainText("\n".join(lines[-self.LOG_VIEW_LINES:]))
+        else:
+            lines = self._log_lines(self._log_pending)
+            self._log_pending.clear()
+            if not lines:
+                return
+            self.log_view.appendPlainText("\n".join(lines))
+        self.log_view.moveCursor(self.log_view.textCursor().End)
+
+    def closeEvent(self, event):
+        # 关闭面板不影响正在运行的任务，可在主界面重新打开
+        self.hide()
+        event.ignore()
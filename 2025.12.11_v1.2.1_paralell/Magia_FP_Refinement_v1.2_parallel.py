@@ -18,12 +18,15 @@ from collections import deque
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
     QFileDialog, QComboBox, QTabWidget, QTextEdit, QProgressBar, QMessageBox,
-    QSpinBox, QGroupBox, QSplitter, QSizePolicy
+    QSpinBox, QGroupBox, QSplitter, QSizePolicy, QCheckBox
 )
 from PyQt5.QtCore import Qt, QThread, pyqtSignal,QTimer
 from PyQt5.QtGui import QFont, QPalette, QColor
 import concurrent.futures
-from PyQt5.QtWidgets import QDialog
+from Magia_Batch_Dashboard import BatchDashboard
+from Magia_Process_Supervisor import supervisor
+from Magia_Adaptive_Concurrency import ConcurrencyController
+from Magia_Scratch import ScratchManager, RETENTION_POLICIES, default_scratch_root
 
 '''2025.10.30
 新增PCR_check调用，自动跳过B值或占位率异常的步骤
@@ -47,6 +50,17 @@ from PyQt5.QtWidgets import QDialog
 
 #######并行精修经过测试，无法较稳定运行，但保留此功能，建议使用单线程模式进行精修########
 
+2026.01
+并行批量精修不再为每个dat弹出一个实时窗口，改为统一的批量面板（Magia_Batch_Dashboard.py）：
+表格显示所有dat的状态、当前步骤、耗时、最近Chi²和预计剩余时间，日志可按任务筛选，
+选中任务后可暂停/继续/跳过/终止，关闭面板不影响精修，可点击“批量面板”重新打开
+fp2k改由进程监管（Magia_Process_Supervisor.py）启动：独立进程组，跳过/终止/超时/退出程序时整组kill并回收，
+批量面板显示每个任务fp2k的CPU、内存和磁盘读写
+新增自适应并行数（Magia_Adaptive_Concurrency.py）：根据磁盘繁忙度、iowait、运行队列和FullProf循环速率，
+在最小/最大并行数之间自动增减同时运行的dat数，默认从3个开始
+新增内存盘运行模式（Magia_Scratch.py）：批量精修时FullProf在 /dev/shm（或指定的RAM盘）中运行，
+每步结束后按回写策略异步写回精修目录，内存盘占用超过上限时自动改回磁盘运行
+
 '''
 
 
@@ -131,6 +145,8 @@ class RefinementWorker(QThread):
         self._overview_list = []  # 新增：步骤状态列表
         self._current_step_start = None
         self.pcrcheck_path = self.config.get("pcrcheck_path")  # 新增：保存PCRcheck路径
+        self.event_hook = None  # 自适应并行数：上报精修循环("cycle")和阻塞("block")
+        self.scratch_manager = None  # 内存盘运行模式，由批量精修设置
 
     def run(self):
         TEMP_DIR = self.config['temp_dir']  # 修改为使用传入的temp_dir
@@ -147,6 +163,15 @@ class RefinementWorker(QThread):
         os.makedirs(TEMP_DIR, exist_ok=True)
         file_history = deque(maxlen=MAX_KEEP_STEPS)
         current_template = self.config['pcr_path']
+        STEP_EXTS = ['.out', '.prf', '.pcr', '.mic', '.dat', '.fst', '.log', '.sum']
+        scratch = None
+        last_step_size = 0
+        if self.scratch_manager is not None:
+            scratch = self.scratch_manager.open_session(os.path.basename(os.path.normpath(TEMP_DIR)), TEMP_DIR)
+            if scratch is not None:
+                self.log_signal.emit("main", f"💾 在内存盘中运行: {scratch.dir}")
+            else:
+                self.log_signal.emit("warn", "⚠️ 内存盘占用已达上限，本dat在磁盘上运行")
         if os.path.exists(ERROR_LOG_PATH):
             os.remove(ERROR_LOG_PATH)
         total = len(self.run_indices)
@@ -209,12 +234,19 @@ class RefinementWorker(QThread):
                 self._overview_list[idx]["reason"] = "用户主动跳过"
                 self.step_overview_signal.emit(self._overview_list)
                 continue
+            base_name = None
             try:
+                if scratch is not None and scratch.need_spill(last_step_size):
+                    self.log_signal.emit("warn", "⚠️ 内存盘占用超过上限，写回已有文件后改在磁盘上继续")
+                    if os.path.dirname(current_template) == scratch.dir:
+                        current_template = os.path.join(TEMP_DIR, os.path.basename(current_template))
+                    scratch.spill()
+                work_dir = scratch.work_dir if scratch is not None else TEMP_DIR
                 step_number = idx + 1
                 safe_step_name = re.sub(r'[^a-zA-Z0-9_]', '_', step['name'])
                 base_name = f"step_{step_number:03d}_{safe_step_name}"
                 template_path = current_template  # <--- 这里是上一步的pcr
-                new_pcr_path = os.path.join(TEMP_DIR, f"{base_name}.pcr")
+                new_pcr_path = os.path.join(work_dir, f"{base_name}.pcr")
                 active_param_ids = [ap['id'] for ap in step['active_params']]
                 self.modify_pcr_template(
                     template_path=template_path,
@@ -224,14 +256,18 @@ class RefinementWorker(QThread):
                     active_params=step['active_params']
                 )
                 param_names = [param_lib[pid].get('name', str(pid)) for pid in active_param_ids]
-                new_dat_path = os.path.join(TEMP_DIR, f"{base_name}.dat")
+                new_dat_path = os.path.join(work_dir, f"{base_name}.dat")
                 import shutil
                 shutil.copyfile(self.config['data_path'], new_dat_path)
                 # current_template = new_pcr_path  # <-- 移除这行，后面根据结果再更新
-                step_files = [os.path.join(TEMP_DIR, f"{base_name}{ext}") for ext in ['.out', '.prf', '.pcr', '.mic', '.dat', '.fst', '.log', '.sum']]
+                step_files = [os.path.join(TEMP_DIR, f"{base_name}{ext}") for ext in STEP_EXTS]
                 file_history.append(step_files)
                 while len(file_history) > MAX_KEEP_STEPS:
                     old_files = file_history.popleft()
+                    if scratch is not None:
+                        # 内存盘模式下删除要排在回写之后
+                        scratch.discard([os.path.basename(f) for f in old_files])
+                        continue
                     for f in old_files:
                         if os.path.exists(f):
                             try:
@@ -247,7 +283,7 @@ class RefinementWorker(QThread):
                     pcr_path=new_pcr_path,
                     timeout=self.config.get('timeout', 3600),
                     show_window=False,
-                    temp_dir=TEMP_DIR
+                    temp_dir=work_dir
                 )
                 # 检查是否被跳过
                 if self._skip:
@@ -292,6 +328,23 @@ class RefinementWorker(QThread):
                 self._overview_list[idx]["reason"] = error_info
                 self.step_overview_signal.emit(self._overview_list)
                 continue
+            finally:
+                # 内存盘模式：步骤结束后按回写策略写回，内存盘中只保留当前模板
+                if scratch is not None and base_name is not None and not scratch.spilled:
+                    try:
+                        last_step_size = sum(
+                            os.path.getsize(os.path.join(scratch.dir, base_name + ext))
+                            for ext in STEP_EXTS if os.path.exists(os.path.join(scratch.dir, base_name + ext))
+                        )
+                        keep_base = os.path.splitext(os.path.basename(current_template))[0]
+                        scratch.finish_step(base_name, STEP_EXTS, self._overview_list[idx]["status"], keep_base)
+                    except Exception as e:
+                        self.log_signal.emit("warn", f"⚠️ 内存盘回写失败: {e}")
+        if scratch is not None:
+            final_base = None
+            if os.path.dirname(current_template) == scratch.dir:
+                final_base = os.path.splitext(os.path.basename(current_template))[0]
+            scratch.close(final_base, STEP_EXTS)
         self.progress_signal.emit(100)
         self.finished_signal.emit("精修已完成！报告已生成。")
 
@@ -358,8 +411,11 @@ class RefinementWorker(QThread):
             with open(log_path, 'w', encoding='utf-8') as log_file:
                 process = None
                 try:
-                    process = subprocess.Popen(
+                    process = supervisor.spawn(
                         [fullprof_path, os.path.basename(pcr_path)],
+                        owner=self,
+                        label=os.path.basename(pcr_path),
+                        timeout=timeout,
                         cwd=os.path.dirname(pcr_path),
                         stdout=subprocess.PIPE,
                         stderr=subprocess.STDOUT,
@@ -390,10 +446,10 @@ class RefinementWorker(QThread):
                         self.log_signal.emit("main", line.rstrip())
                         buffer.append(line.strip())
                         # 检查是否被跳过
-                        if self._skip:
-                            process.kill()
+                        if self._skip or self._stop:
+                            supervisor.kill(process)
                             self._current_process = None
-                            return False, "用户主动跳过"
+                            return False, "用户主动跳过" if self._skip else "用户终止"
                         # 检测 [Max] Shift 收敛和阻塞
                         shift_match = re.search(
                             r'Conv\. not yet reached\s*->\s*\[Max\] Shift.*?=\s*([-\d.]+)\s*abs>', line)
@@ -404,11 +460,13 @@ class RefinementWorker(QThread):
                                 abs_shift = abs(shift_val)
                                 # 阻塞检测
                                 if last_shift_time is not None and now_time - last_shift_time > BLOCK_TIMEOUT:
-                                    process.kill()
+                                    supervisor.kill(process)
                                     self._current_process = None
+                                    self._report_event("block")
                                     self.log_signal.emit("err", "当前步骤精修阻塞！请查看log文件")
                                     return False, "当前步骤精修阻塞！超过60s未检测到新的[Max] Shift！"
                                 last_shift_time = now_time
+                                self._report_event("cycle")
                                 # 收敛检测
                                 if last_abs_shift is not None:
                                     if abs_shift > last_abs_shift:
@@ -422,7 +480,7 @@ class RefinementWorker(QThread):
                                 last_abs_shift = abs_shift
                                 # 达到阈值则判定未收敛
                                 if not_decrease_count >= MAX_NOT_DECREASE or equal_count >= MAX_EQUAL:
-                                    process.kill()
+                                    supervisor.kill(process)
                                     self._current_process = None
                                     self.log_signal.emit("err", "当前步骤不收敛，[Max] Shift多次未降低或多次相等，自动跳过")
                                     return False, "当前步骤不收敛，[Max] Shift多次未降低或多次相等"
@@ -431,8 +489,9 @@ class RefinementWorker(QThread):
                         else:
                             # 如果已检测到过shift行，且距离上次超过BLOCK_TIMEOUT，则判定阻塞
                             if last_shift_time is not None and now_time - last_shift_time > BLOCK_TIMEOUT:
-                                process.kill()
+                                supervisor.kill(process)
                                 self._current_process = None
+                                self._report_event("block")
                                 self.log_signal.emit("err", "当前步骤精修阻塞！请查看log文件")
                                 return False, "当前步骤精修阻塞！未检测到新的[Max] Shift，请查看log文件"
                         # === 原有错误检测 ===
@@ -455,18 +514,25 @@ class RefinementWorker(QThread):
                             error_flag = True
                             error_message = "NO REFLECTIONS FOUND -> Check your INS parameter for input data and/or ZERO point"
                         if error_flag:
-                            process.kill()
+                            supervisor.kill(process)
                             self._current_process = None
                             break
                 try:
                     exit_code = process.wait(timeout=timeout)
                 except Exception:
-                    process.kill()
+                    supervisor.kill(process)
                     self._current_process = None
                     return False, "进程超时"
+                supervisor.release(process)
                 self._current_process = None
+                if self._stop and not error_flag:
+                    return False, "用户终止"
+                if exit_code != 0 and not error_flag and not self._skip:
+                    # 被监管线程按截止时间kill（输出卡住时readline不会返回，只能由监管线程结束）
+                    return False, f"进程超时或异常退出(退出码 {exit_code})"
                 return exit_code == 0 and not error_flag, error_message if error_flag else "正常完成"
         except Exception as e:
+            supervisor.kill(self._current_process)
             self._current_process = None
             return False, f"运行时错误: {str(e)}"
 
@@ -495,6 +561,13 @@ class RefinementWorker(QThread):
         except Exception as e:
             self.log_signal.emit("err", f"⚠️ 无法写入错误日志: {str(e)}")
 
+    def _report_event(self, kind):
+        if self.event_hook is not None:
+            try:
+                self.event_hook(kind)
+            except Exception:
+                pass
+
     def pause(self):
         self._pause = True
 
@@ -503,15 +576,12 @@ class RefinementWorker(QThread):
 
     def stop(self):
         self._stop = True
+        supervisor.kill_owner(self)
 
     def skip_current_step(self):
         self._skip = True
-        # 如果有正在运行的FullProf进程，立即kill
-        if self._current_process is not None:
-            try:
-                self._current_process.kill()
-            except Exception:
-                pass
+        # 如果有正在运行的FullProf进程，立即kill整个进程组
+        supervisor.kill_owner(self)
 
 class LogTabWidget(QTabWidget):
     MAX_DISPLAY_LINES = 100
@@ -659,6 +729,7 @@ class RefinementGUI(QWidget):
         # self.auto_search_fp2k()
         self.pcrcheck_path = None  # 新增：PCRcheck文件路径
         self._batch_dat_start_time = None  # 记录当前dat开始时间
+        self.batch_dashboard = None  # 并行批量精修面板，所有dat共用一个
         
     def skip_current_step(self):
         if self.worker:
@@ -701,6 +772,11 @@ class RefinementGUI(QWidget):
             QMessageBox.warning(self, "错误", "当前目录下没有dat文件")
             return
 
+        if getattr(self, "_batch_active", {}):
+            QMessageBox.warning(self, "提示", "上一次批量精修仍在进行，请在批量面板中终止或等待完成")
+            self.show_batch_dashboard()
+            return
+
         # 批量队列与执行器
         from collections import deque
         self._batch_queue = deque(dat_files)
@@ -708,20 +784,87 @@ class RefinementGUI(QWidget):
         self._batch_total = len(dat_files)
         self._batch_completed = 0
         max_parallel = max(1, int(self.max_parallel_spin.value()))
+        min_parallel = min(max_parallel, max(1, int(self.min_parallel_spin.value())))
         self._batch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel)
+        self._batch_active = {}
+        if self.adaptive_checkbox.isChecked() and min_parallel < max_parallel:
+            # 按README建议从3个开始，再根据主机压力增减
+            self._batch_controller = ConcurrencyController(min_parallel, max_parallel, initial=min(max_parallel, max(min_parallel, 3)))
+            self._batch_target = self._batch_controller.target
+        else:
+            self._batch_controller = None
+            self._batch_target = max_parallel
+        self._batch_scratch = None
+        if self.scratch_checkbox.isChecked():
+            scratch_root = self.scratch_path_edit.text().strip() or default_scratch_root()
+            if scratch_root and os.path.isdir(scratch_root):
+                try:
+                    self._batch_scratch = ScratchManager(
+                        scratch_root, self.scratch_cap_spin.value(), self.scratch_policy_combo.currentData()
+                    )
+                except Exception as e:
+                    QMessageBox.warning(self, "提示", f"内存盘目录无法使用，改为在磁盘上运行：{e}")
+            else:
+                QMessageBox.warning(self, "提示", "未找到可用的内存盘路径（/dev/shm 不存在时请手动指定RAM盘路径），改为在磁盘上运行")
+        if self.batch_dashboard is None:
+            self.batch_dashboard = BatchDashboard(self)
+        self.batch_dashboard.set_jobs(dat_files)
+        self.show_batch_dashboard()
+
+        self._fill_batch_slots()
+        if self._batch_controller is not None:
+            self.batch_dashboard.set_concurrency_info(self._batch_controller.describe())
+            if not hasattr(self, "_concurrency_timer"):
+                self._concurrency_timer = QTimer(self)
+                self._concurrency_timer.timeout.connect(self._adjust_concurrency)
+            self._concurrency_timer.start(10000)
+            QMessageBox.information(self, "批量启动", f"已启动批量精修：总 {self._batch_total} 个 dat，自适应并行 {min_parallel}-{max_parallel} 个，当前 {self._batch_target} 个。")
+        else:
+            self.batch_dashboard.set_concurrency_info(f"并行数: {max_parallel}（固定）")
+            QMessageBox.information(self, "批量启动", f"已启动批量精修：总 {self._batch_total} 个 dat，最多并行 {max_parallel} 个。")
 
-        # 启动最多 max_parallel 个任务
-        for _ in range(min(max_parallel, len(self._batch_queue))):
+    def _fill_batch_slots(self):
+        # 按当前目标并行数补足正在运行的任务
+        while self._batch_queue and len(self._batch_active) < self._batch_target:
+            before = len(self._batch_active)
             self._start_next_task()
+            if len(self._batch_active) == before:
+                break
 
-        QMessageBox.information(self, "批量启动", f"已启动批量精修：总 {self._batch_total} 个 dat，最多并行 {max_parallel} 个。")
+    def _adjust_concurrency(self):
+        controller = getattr(self, "_batch_controller", None)
+        if controller is None or (not self._batch_active and not self._batch_queue):
+            self._concurrency_timer.stop()
+            return
+        old = self._batch_target
+        self._batch_target = controller.update(len(self._batch_active))
+        self.batch_dashboard.set_concurrency_info(controller.describe())
+        if self._batch_target > old:
+            self._fill_batch_slots()
+
+    def show_batch_dashboard(self):
+        if self.batch_dashboard is None:
+            QMessageBox.information(self, "提示", "还没有开始批量精修")
+            return
+        self.batch_dashboard.show()
+        self.batch_dashboard.raise_()
+        self.batch_dashboard.activateWindow()
 # ...existing code...
 # ...existing code...
     def _start_next_task(self):
-        # 从队列取下一个 dat 并提交执行，且只为正在并行执行的任务弹出窗口
+        # 从队列取下一个 dat 并提交执行，状态和日志统一显示在批量面板
         if not hasattr(self, "_batch_queue") or not self._batch_queue:
             return
-        dat_file = self._batch_queue.popleft()
+        dat_file = None
+        while self._batch_queue:
+            candidate = self._batch_queue.popleft()
+            job = self.batch_dashboard.jobs.get(candidate)
+            if job is not None and job.status == "已取消":
+                continue  # 排队时已在面板中终止
+            dat_file = candidate
+            break
+        if dat_file is None:
+            return
         subdir = os.path.join(self._batch_refine_dir, os.path.splitext(dat_file)[0])
         os.makedirs(subdir, exist_ok=True)
         config = {
@@ -735,24 +878,19 @@ class RefinementGUI(QWidget):
             "temp_dir": subdir
         }
         run_indices = list(range(len(self.steps)))
-        win = RealtimeRefineWindow(dat_file)
         worker = RefinementWorker(config, self.steps, run_indices)
 
-        # 绑定信号到子窗口
-        worker.log_signal.connect(win.log_tabs.append_log)
-        worker.progress_signal.connect(win.progress.setValue)
-        worker.step_overview_signal.connect(win.log_tabs.set_overview)
-
-        # 允许窗口按钮控制 worker
-        win.bind_worker_control(worker)
-        win._confirm_on_close = True
-        win.show()
+        # 信号统一接到批量面板，由面板按任务区分
+        self.batch_dashboard.job_started(dat_file, worker)
+        if getattr(self, "_batch_controller", None) is not None:
+            worker.event_hook = self._batch_controller.record_event
+        worker.scratch_manager = getattr(self, "_batch_scratch", None)
 
         future = self._batch_executor.submit(worker.run)
         start_time = time.time()
         if not hasattr(self, "_batch_active"):
             self._batch_active = {}
-        self._batch_active[future] = (worker, win, subdir, start_time)
+        self._batch_active[future] = (worker, dat_file, subdir, start_time)
 
         def _on_future_done(fut):
             QTimer.singleShot(0, lambda: self._on_task_done(fut))
@@ -762,11 +900,11 @@ class RefinementGUI(QWidget):
         info = self._batch_active.pop(future, None)
         if info is None:
             return
-        worker, win, subdir, start_time = info
+        worker, dat_file, subdir, start_time = info
         # 写入 AAA_step_overview.txt
         try:
             overview_lines = []
-            for entry in getattr(win.log_tabs, "overview_data", []):
+            for entry in self.batch_dashboard.overview_of(dat_file):
                 status = entry.get("status", "")
                 if status not in ("运行中", "成功", "失败", "跳过"):
                     continue
@@ -796,20 +934,16 @@ class RefinementGUI(QWidget):
         except Exception:
             pass
 
-        # 自动关闭子窗口（不弹确认）
-        try:
-            win._confirm_on_close = False
-            win.close()
-        except Exception:
-            pass
+        self.batch_dashboard.job_finished(dat_file)
 
         # 启动下一个待处理任务
         self._batch_completed = getattr(self, "_batch_completed", 0) + 1
-        if self._batch_queue:
-            self._start_next_task()
-        else:
-            if not getattr(self, "_batch_active", {}):
-                QMessageBox.information(self, "批量完成", "所有dat文件批量精修已完成！")
+        self._fill_batch_slots()
+        if not getattr(self, "_batch_active", {}):
+            if getattr(self, "_batch_scratch", None) is not None:
+                self._batch_scratch.shutdown()
+                self._batch_scratch = None
+            QMessageBox.information(self, "批量完成", "所有dat文件批量精修已完成！")
 # ...existing code...
 
 
@@ -992,6 +1126,7 @@ class RefinementGUI(QWidget):
         self.stop_btn = QPushButton("终止")
         self.skip_btn = QPushButton("立即跳过当前步骤")  # 新增按钮
         self.batch_btn = QPushButton("批量精修")  # 新增批量精修按钮
+        self.dashboard_btn = QPushButton("批量面板")
         self.export_log_btn = QPushButton("导出日志")
         self.export_report_btn = QPushButton("导出报告")
         btn_layout.addWidget(self.run_btn)
@@ -1000,12 +1135,14 @@ class RefinementGUI(QWidget):
         btn_layout.addWidget(self.stop_btn)
         btn_layout.addWidget(self.skip_btn)  # 添加到布局
         btn_layout.addWidget(self.batch_btn)  # 添加到布局
+        btn_layout.addWidget(self.dashboard_btn)
         btn_layout.addWidget(self.export_log_btn)
         btn_layout.addWidget(self.export_report_btn)
         main_layout.addLayout(btn_layout)
         # 事件绑定
         self.run_btn.clicked.connect(self.start_refinement)
         self.batch_btn.clicked.connect(self.batch_refinement)
+        self.dashboard_btn.clicked.connect(self.show_batch_dashboard)
         self.pause_btn.clicked.connect(self.pause_refinement)
         self.resume_btn.clicked.connect(self.resume_refinement)
         self.stop_btn.clicked.connect(self.stop_refinement)
@@ -1018,6 +1155,37 @@ class RefinementGUI(QWidget):
         self.max_parallel_spin.setValue(5)
         paramset_layout.addWidget(QLabel("最大并行精修数："))
         paramset_layout.addWidget(self.max_parallel_spin)
+        self.min_parallel_spin = QSpinBox()
+        self.min_parallel_spin.setRange(1, 32)
+        self.min_parallel_spin.setValue(1)
+        paramset_layout.addWidget(QLabel("最小并行数："))
+        paramset_layout.addWidget(self.min_parallel_spin)
+        self.adaptive_checkbox = QCheckBox("自适应并行数")
+        self.adaptive_checkbox.setChecked(True)
+        self.adaptive_checkbox.setToolTip("根据磁盘、CPU压力和FullProf循环速率在最小/最大并行数之间自动调整")
+        paramset_layout.addWidget(self.adaptive_checkbox)
+        # 内存盘运行设置（仅批量精修）
+        scratch_group = QGroupBox("内存盘运行（批量精修）")
+        scratch_layout = QHBoxLayout()
+        self.scratch_checkbox = QCheckBox("在内存盘中运行FullProf")
+        self.scratch_checkbox.setToolTip("每步结束后按回写策略异步写回精修目录，减少并行精修时的磁盘争用")
+        self.scratch_path_edit = QLineEdit()
+        self.scratch_path_edit.setPlaceholderText("内存盘路径，留空使用 /dev/shm")
+        self.scratch_cap_spin = QSpinBox()
+        self.scratch_cap_spin.setRange(64, 262144)
+        self.scratch_cap_spin.setValue(2048)
+        self.scratch_cap_spin.setSuffix(" MB")
+        self.scratch_policy_combo = QComboBox()
+        for key, label in RETENTION_POLICIES.items():
+            self.scratch_policy_combo.addItem(label, key)
+        scratch_layout.addWidget(self.scratch_checkbox)
+        scratch_layout.addWidget(self.scratch_path_edit, 1)
+        scratch_layout.addWidget(QLabel("内存上限："))
+        scratch_layout.addWidget(self.scratch_cap_spin)
+        scratch_layout.addWidget(QLabel("回写策略："))
+        scratch_layout.addWidget(self.scratch_policy_combo)
+        scratch_group.setLayout(scratch_layout)
+        main_layout.insertWidget(main_layout.indexOf(param_group) + 1, scratch_group)
         # ...existing code...
 
     def select_pcrcheck(self):
@@ -1066,6 +1234,17 @@ class RefinementGUI(QWidget):
                     self.worker.stop()
             except Exception:
                 pass
+            for worker, *_ in list(getattr(self, "_batch_active", {}).values()):
+                try:
+                    worker.stop()
+                except Exception:
+                    pass
+            supervisor.kill_all()
+            if hasattr(self, "_concurrency_timer"):
+                self._concurrency_timer.stop()
+            if getattr(self, "_batch_scratch", None) is not None:
+                # 已排队的回写在后台完成后再删除内存盘目录，不阻塞界面关闭
+                self._batch_scratch.shutdown()
             try:
                 if hasattr(self, '_batch_executor') and self._batch_executor:
                     # 不等待正在进行的任务完成，尝试立即关闭线程池
@@ -1156,6 +1335,21 @@ class RefinementGUI(QWidget):
             self.timeout_spin.setValue(cfg["timeout"])
         if cfg.get("maxfiles"):
             self.maxfile_spin.setValue(cfg["maxfiles"])
+        if cfg.get("max_parallel"):
+            self.max_parallel_spin.setValue(cfg["max_parallel"])
+        if cfg.get("min_parallel"):
+            self.min_parallel_spin.setValue(cfg["min_parallel"])
+        if "adaptive_parallel" in cfg:
+            self.adaptive_checkbox.setChecked(bool(cfg["adaptive_parallel"]))
+        self.scratch_checkbox.setChecked(bool(cfg.get("scratch_enabled", False)))
+        if cfg.get("scratch_path"):
+            self.scratch_path_edit.setText(cfg["scratch_path"])
+        if cfg.get("scratch_cap_mb"):
+            self.scratch_cap_spin.setValue(cfg["scratch_cap_mb"])
+        if cfg.get("scratch_policy"):
+            idx = self.scratch_policy_combo.findData(cfg["scratch_policy"])
+            if idx >= 0:
+                self.scratch_policy_combo.setCurrentIndex(idx)
 
     def save_current_settings(self):
         cfg = {
@@ -1166,7 +1360,14 @@ class RefinementGUI(QWidget):
             "paramlib_path": self.param_edit.text(),
             "stepcfg_path": self.step_edit.text(),
             "timeout": self.timeout_spin.value(),
-            "maxfiles": self.maxfile_spin.value()
+            "maxfiles": self.maxfile_spin.value(),
+            "max_parallel": self.max_parallel_spin.value(),
+            "min_parallel": self.min_parallel_spin.value(),
+            "adaptive_parallel": self.adaptive_checkbox.isChecked(),
+            "scratch_enabled": self.scratch_checkbox.isChecked(),
+            "scratch_path": self.scratch_path_edit.text().strip(),
+            "scratch_cap_mb": self.scratch_cap_spin.value(),
+            "scratch_policy": self.scratch_policy_combo.currentData()
         }
         save_config(cfg)
 
@@ -1256,74 +1457,6 @@ class RefinementGUI(QWidget):
         self.progress.setValue(100)
         QMessageBox.information(self, "完成", msg)
 
-from PyQt5.QtWidgets import QDialog
-
-class RealtimeRefineWindow(QDialog):
-    def __init__(self, dat_file):
-        super().__init__()
-        self.setWindowTitle(f"{dat_file} 精修实时窗口")
-        self.resize(800, 600)
-        layout = QVBoxLayout(self)
-        self.log_tabs = LogTabWidget()
-        layout.addWidget(self.log_tabs)
-        self.progress = QProgressBar()
-        layout.addWidget(self.progress)
-
-        # 按钮区：暂停 / 继续 / 立即跳过当前步骤
-        btn_layout = QHBoxLayout()
-        self.pause_btn = QPushButton("暂停")
-        self.resume_btn = QPushButton("继续")
-        self.skip_btn = QPushButton("立即跳过当前步骤")
-        btn_layout.addWidget(self.pause_btn)
-        btn_layout.addWidget(self.resume_btn)
-        btn_layout.addWidget(self.skip_btn)
-        layout.addLayout(btn_layout)
-
-        # 状态
-        self._worker = None
-        self._confirm_on_close = True
-
-    def bind_worker_control(self, worker):
-        """将窗口按钮绑定到对应 worker（由主 GUI 调用）"""
-        self._worker = worker
-        try:
-            self.pause_btn.clicked.disconnect()
-        except Exception:
-            pass
-        try:
-            self.resume_btn.clicked.disconnect()
-        except Exception:
-            pass
-        try:
-            self.skip_btn.clicked.disconnect()
-        except Exception:
-            pass
-        self.pause_btn.clicked.connect(lambda: self._worker.pause() if self._worker else None)
-        self.resume_btn.clicked.connect(lambda: self._worker.resume() if self._worker else None)
-        self.skip_btn.clicked.connect(lambda: self._worker.skip_current_step() if self._worker else None)
-
-    def closeEvent(self, event):
-        # 自动关闭（由批量管理触发）时不弹窗
-        if not getattr(self, "_confirm_on_close", True):
-            event.accept()
-            return
-        reply = QMessageBox.question(
-            self,
-            "确认关闭",
-            "精修可能在进行中，确认关闭此窗口？",
-            QMessageBox.Yes | QMessageBox.No,
-            QMessageBox.No
-        )
-        if reply == QMessageBox.Yes:
-            try:
-                if hasattr(self, "_worker") and self._worker:
-                    self._worker.stop()
-            except Exception:
-                pass
-            event.accept()
-        else:
-            event.ignore()
-
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setFont(QFont("微软雅黑"))
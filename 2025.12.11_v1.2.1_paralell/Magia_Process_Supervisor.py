@@ -0,0 +1,231 @@
+'''2026.01
+FullProf子进程监管：
+- 每个fp2k在独立的进程组中启动（Windows: CREATE_NEW_PROCESS_GROUP，其他系统: 新会话），终止时连同其子进程一起结束
+- 登记所有仍在运行的子进程，跳过/终止/超时/程序退出时统一kill，不再留下占用CPU和磁盘的孤儿fp2k
+- kill只在调用线程发送信号、立即返回（GUI线程点击跳过/终止不会卡住），等待退出由后台线程完成
+- 后台线程每秒检查一次：回收已退出的进程，kill超过截止时间的进程，kill后超过KILL_WAIT秒仍未退出的再kill一次
+- 提供每个子进程的CPU占用、内存(RSS)、磁盘读写量（优先使用psutil，没有时在Linux下读取/proc）
+'''
+import os
+import time
+import atexit
+import signal
+import threading
+import subprocess
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+KILL_WAIT = 5  # kill后等待进程退出的秒数，超过后重新发送
+
+
+class ChildInfo:
+    __slots__ = ("process", "owner", "label", "start", "deadline", "killed_at", "cpu_time", "sample_time", "stats")
+
+    def __init__(self, process, owner, label, deadline):
+        self.process = process
+        self.owner = owner
+        self.label = label
+        self.start = time.time()
+        self.deadline = deadline
+        self.killed_at = None  # 已发送kill的时间
+        self.cpu_time = None
+        self.sample_time = None
+        self.stats = {"cpu": 0.0, "rss": 0, "read_bytes": 0, "write_bytes": 0}
+
+
+def _read_proc_usage(pid):
+    """返回 (cpu秒数, rss字节, 读字节, 写字节)，读取失败的项为0"""
+    if psutil is not None:
+        try:
+            p = psutil.Process(pid)
+            with p.oneshot():
+                t = p.cpu_times()
+                rss = p.memory_info().rss
+                try:
+                    io = p.io_counters()
+                    rb, wb = io.read_bytes, io.write_bytes
+                except Exception:
+                    rb = wb = 0
+            return t.user + t.system, rss, rb, wb
+        except Exception:
+            return None
+    if not os.path.isdir(f"/proc/{pid}"):
+        return None
+    cpu = rss = rb = wb = 0
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        rss = int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        pass
+    try:
+        with open(f"/proc/{pid}/io", 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == "read_bytes":
+                    rb = int(value)
+                elif key == "write_bytes":
+                    wb = int(value)
+    except Exception:
+        pass
+    return cpu, rss, rb, wb
+
+
+class ProcessSupervisor:
+    def __init__(self, poll_interval=1.0):
+        self.lock = threading.Lock()
+        self.children = {}  # pid -> ChildInfo
+        self.poll_interval = poll_interval
+        self._reaper = None
+        self._closed = False
+
+    # ---- 启动与登记 ----
+    def spawn(self, args, owner=None, label="", timeout=None, **popen_kwargs):
+        """启动子进程并登记，timeout为整个进程允许运行的最长秒数（None为不限）"""
+        if os.name == 'nt':
+            popen_kwargs["creationflags"] = popen_kwargs.get("creationflags", 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            popen_kwargs["start_new_session"] = True
+        process = subprocess.Popen(args, **popen_kwargs)
+        deadline = time.time() + timeout if timeout else None
+        with self.lock:
+            self.children[process.pid] = ChildInfo(process, owner, label, deadline)
+        self._ensure_reaper()
+        return process
+
+    def release(self, process):
+        """进程已正常结束，从登记表移除"""
+        if process is None:
+            return
+        with self.lock:
+            self.children.pop(process.pid, None)
+
+    # ---- 终止与回收 ----
+    def _send_kill(self, process):
+        try:
+            if os.name == 'nt':
+                subprocess.Popen(
+                    ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+                )
+            else:
+                os.killpg(process.pid, signal.SIGKILL)
+        except Exception:
+            pass
+        try:
+            process.kill()
+        except Exception:
+            pass
+
+    def kill(self, process):
+        """结束整个进程组，不等待；返回进程是否已退出（未退出的由后台线程回收）"""
+        if process is None:
+            return True
+        if process.poll() is not None:
+            self.release(process)
+            return True
+        self._send_kill(process)
+        with self.lock:
+            child = self.children.get(process.pid)
+            if child is None:  # 未登记的进程也交给后台线程回收
+                child = self.children[process.pid] = ChildInfo(process, None, "", None)
+            child.killed_at = time.time()
+        self._ensure_reaper()
+        return False
+
+    def _wait_all(self, timeout):
+        """等待已kill的进程退出（仅在程序退出时使用）"""
+        end = time.time() + timeout
+        with self.lock:
+            targets = [c.process for c in self.children.values()]
+        for process in targets:
+            try:
+                process.wait(timeout=max(0.0, end - time.time()))
+                self.release(process)
+            except Exception:
+                pass
+
+    def kill_owner(self, owner):
+        """结束某个精修任务（worker）启动的全部子进程"""
+        with self.lock:
+            targets = [c.process for c in self.children.values() if c.owner is owner]
+        for process in targets:
+            self.kill(process)
+        return len(targets)
+
+    def kill_all(self):
+        with self.lock:
+            targets = [c.process for c in self.children.values()]
+        for process in targets:
+            self.kill(process)
+        return len(targets)
+
+    def shutdown(self):
+        self._closed = True
+        self.kill_all()
+        self._wait_all(KILL_WAIT)
+
+    # ---- 后台检查 ----
+    def _ensure_reaper(self):
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self):
+        while not self._closed:
+            time.sleep(self.poll_interval)
+            now = time.time()
+            with self.lock:
+                children = list(self.children.values())
+            if not children:
+                continue
+            for child in children:
+                if child.process.poll() is not None:
+                    self.release(child.process)
+                elif child.killed_at is not None:
+                    if now - child.killed_at > KILL_WAIT:
+                        self.kill(child.process)  # 仍未退出，重新发送
+                elif child.deadline is not None and now > child.deadline:
+                    self.kill(child.process)
+
+    # ---- 资源统计 ----
+    def sample(self):
+        """刷新所有子进程的CPU/内存/IO，返回 {pid: stats}；cpu为两次采样间的占用百分比（单核100%）"""
+        now = time.time()
+        result = {}
+        with self.lock:
+            children = list(self.children.values())
+        for child in children:
+            usage = _read_proc_usage(child.process.pid)
+            if usage is None:
+                continue
+            cpu_time, rss, rb, wb = usage
+            if child.cpu_time is not None and now > child.sample_time:
+                child.stats["cpu"] = max(0.0, (cpu_time - child.cpu_time) / (now - child.sample_time) * 100)
+            child.cpu_time = cpu_time
+            child.sample_time = now
+            child.stats.update(rss=rss, read_bytes=rb, write_bytes=wb)
+            result[child.process.pid] = dict(child.stats, label=child.label, elapsed=now - child.start)
+        return result
+
+    def stats_by_owner(self, owner):
+        """某个worker当前子进程的统计（未采样过时为0）"""
+        with self.lock:
+            for child in self.children.values():
+                if child.owner is owner:
+                    return dict(child.stats, pid=child.process.pid, label=child.label)
+        return None
+
+    def live_count(self):
+        with self.lock:
+            return len(self.children)
+
+
+supervisor = ProcessSupervisor()
+atexit.register(supervisor.shutdown)
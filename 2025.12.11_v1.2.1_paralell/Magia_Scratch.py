@@ -0,0 +1,222 @@
+'''2026.01
+内存盘(tmpfs)运行模式：每个dat的FullProf在内存盘的临时目录中运行（默认 /dev/shm，也可指定RAM盘路径），
+步骤结束时按回写策略把需要保留的文件异步复制回精修目录，减少并行精修时对共享磁盘的读写争用。
+- 所有任务共用一个 ScratchManager，统计内存盘占用，超过上限时新任务直接在磁盘上运行，
+  正在运行的任务在下一步开始前把已有文件写回磁盘并切换到磁盘继续
+- 回写由一个后台线程按顺序完成（先写后删，保证淘汰旧步骤时不会把文件又写回来）
+- 内存盘中只保留当前模板（上一次成功步骤）的文件，其余步骤写回后即从内存盘删除
+回写策略：
+  all      每一步的全部文件（与磁盘模式保留的文件相同）
+  success  成功步骤的全部文件，失败/跳过步骤只写回 .out 和 .log 便于查错
+  final    运行中不回写，结束时只写回最后一次成功步骤的文件
+'''
+import os
+import queue
+import shutil
+import threading
+
+DEFAULT_SCRATCH_ROOT = "/dev/shm"
+RETENTION_POLICIES = {
+    "all": "全部文件",
+    "success": "成功步骤+失败日志",
+    "final": "仅最终结果",
+}
+FAILED_STEP_EXTS = ('.out', '.log')
+
+
+def default_scratch_root():
+    """未指定路径时使用 /dev/shm；不存在或不可写（如Windows）时返回None"""
+    if os.path.isdir(DEFAULT_SCRATCH_ROOT) and os.access(DEFAULT_SCRATCH_ROOT, os.W_OK):
+        return DEFAULT_SCRATCH_ROOT
+    return None
+
+
+def _dir_size(path):
+    total = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    except Exception:
+        pass
+    return total
+
+
+class ScratchManager:
+    def __init__(self, root, cap_mb, policy="all"):
+        self.root = os.path.join(root, f"magia_scratch_{os.getpid()}")
+        self.cap_bytes = int(cap_mb) * 1024 * 1024
+        self.policy = policy if policy in RETENTION_POLICIES else "all"
+        self.lock = threading.Lock()
+        self.sessions = {}  # name -> ScratchSession
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._writeback_loop, daemon=True)
+        self._thread.start()
+        os.makedirs(self.root, exist_ok=True)
+
+    def usage(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+        return sum(s.measure() for s in sessions)
+
+    def has_room(self, extra=0):
+        if self.usage() + extra > self.cap_bytes:
+            return False
+        try:
+            return shutil.disk_usage(self.root).free > extra
+        except Exception:
+            return False
+
+    def open_session(self, name, persist_dir):
+        """为一个dat创建内存盘目录；超过上限时返回None，由调用方在磁盘上运行"""
+        if not self.has_room():
+            return None
+        session = ScratchSession(self, name, persist_dir)
+        with self.lock:
+            self.sessions[name] = session
+        return session
+
+    def _close_session(self, session):
+        with self.lock:
+            self.sessions.pop(session.name, None)
+
+    def _writeback_loop(self):
+        while True:
+            task = self._queue.get()
+            if task is None:  # shutdown() 放入的结束标记，之前的回写都已完成
+                self._queue.task_done()
+                return
+            try:
+                task()
+            except Exception:
+                pass
+            finally:
+                self._queue.task_done()
+
+    def submit(self, task):
+        done = threading.Event()
+
+        def wrapped():
+            try:
+                task()
+            finally:
+                done.set()
+        self._queue.put(wrapped)
+        return done
+
+    def shutdown(self, wait=False):
+        """结束回写线程并删除内存盘目录。默认不阻塞调用线程（GUI线程），
+        由一个非守护线程等待已排队的回写完成后删除，程序退出时解释器也会等它完成"""
+        self._queue.put(None)
+        finisher = threading.Thread(target=self._finish, daemon=False)
+        finisher.start()
+        if wait:
+            finisher.join()
+        return finisher
+
+    def _finish(self):
+        self._thread.join()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class ScratchSession:
+    def __init__(self, manager, name, persist_dir):
+        self.manager = manager
+        self.name = name
+        self.persist_dir = persist_dir
+        self.dir = os.path.join(manager.root, name)
+        self.spilled = False  # 已切换回磁盘
+        self._size = 0
+        self._held = []  # 仍在内存盘中的步骤
+        self._last = threading.Event()
+        self._last.set()
+        shutil.rmtree(self.dir, ignore_errors=True)
+        os.makedirs(self.dir, exist_ok=True)
+
+    @property
+    def work_dir(self):
+        return self.persist_dir if self.spilled else self.dir
+
+    def measure(self):
+        if not self.spilled:
+            self._size = _dir_size(self.dir)
+        else:
+            self._size = 0
+        return self._size
+
+    def _copy_back(self, names):
+        for name in names:
+            src = os.path.join(self.dir, name)
+            if not os.path.isfile(src):
+                continue
+            dst = os.path.join(self.persist_dir, name)
+            tmp = dst + ".writeback"
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+
+    def _remove_local(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.dir, name))
+            except Exception:
+                pass
+
+    def finish_step(self, base_name, exts, status, keep_base):
+        """步骤结束：按回写策略异步写回，然后删除内存盘中除 keep_base（当前模板）以外的步骤文件"""
+        if self.spilled:
+            return
+        policy = self.manager.policy
+        if policy != "final":
+            write_exts = exts
+            if policy == "success" and status != "成功":
+                write_exts = [e for e in exts if e in FAILED_STEP_EXTS]
+            names = [base_name + ext for ext in write_exts]
+            self._last = self.manager.submit(lambda n=names: self._copy_back(n))
+        self._held.append(base_name)
+        for held in self._held:
+            if held != keep_base:
+                local = [held + ext for ext in exts]
+                self._last = self.manager.submit(lambda n=local: self._remove_local(n))
+        self._held = [keep_base] if keep_base in self._held else []
+
+    def discard(self, names):
+        """淘汰旧步骤：内存盘中立即删除，磁盘上的副本排在回写之后删除"""
+        self._remove_local(names)
+
+        def remove_persisted():
+            for name in names:
+                path = os.path.join(self.persist_dir, name)
+                if os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except Exception:
+                        pass
+        if self.spilled:
+            remove_persisted()
+        else:
+            self._last = self.manager.submit(remove_persisted)
+
+    def need_spill(self, extra):
+        """下一步预计还需要 extra 字节，内存盘放不下时返回True"""
+        return not self.spilled and not self.manager.has_room(extra)
+
+    def spill(self):
+        """把内存盘中的全部文件写回磁盘，之后在磁盘上继续运行"""
+        if self.spilled:
+            return
+        # 回写队列按顺序执行，等到这一项完成时本任务之前的回写也都已完成
+        self.manager.submit(lambda: self._copy_back(os.listdir(self.dir))).wait()
+        self.spilled = True
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.manager._close_session(self)
+
+    def close(self, final_base=None, exts=()):
+        """结束：final 策略写回最后一次成功步骤，等待全部回写完成后删除内存盘目录"""
+        if not self.spilled:
+            if self.manager.policy == "final" and final_base:
+                names = [final_base + ext for ext in exts]
+                self._last = self.manager.submit(lambda: self._copy_back(names))
+            self._last.wait()
+            shutil.rmtree(self.dir, ignore_errors=True)
+        self.manager._close_session(self)
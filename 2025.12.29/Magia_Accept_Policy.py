@@ -0,0 +1,166 @@
+'''2026.01
+步骤接受策略：FullProf正常结束且通过PCRcheck的步骤，是否作为后续步骤的pcr模板。
+以前只要正常结束就接受，Chi²变差的步骤也会成为下一步的起点；现在由策略比较本步与上一个被接受步骤的结果，
+不接受时该步骤记为失败（原因以“未通过接受策略”开头），下一步仍使用上一个被接受的pcr（回退）。
+内置策略（config["accept_policy"] 可为名称、dict、.json 或 .py 文件路径）：
+  permissive  全部接受（默认，与以前相同）
+  chi2        Chi² 不超过上一步的 (1 - tolerance) 倍
+  rfactor     keys 中的R因子（默认Rwp）不超过上一步 + tolerance（百分点）
+  gated       chi2 或 rfactor(Rwp) 满足其一即接受
+  strict      chi2 和 rfactor(Rwp) 都满足才接受
+  dict：{"type": "gated", "tolerance": 0.001, "r_tolerance": 0.1, "keys": ["Rwp"]}、{"type": "any"/"all", "policies": [...]}
+  .py：定义 decide(prev, new) 函数，返回 bool 或 (bool, 说明)
+Chi²的 tolerance 为相对值：0 表示不变差即可，0.001 表示至少改善0.1%，负数表示允许变差；R因子的 r_tolerance 为百分点。
+prev/new 为 {"chi2", "r_factors": {"Rp", "Rwp", "Rexp"}, "coarse"}；没有可比的上一步（第一步、粗化/完整数据切换后）时prev为None，总是接受。
+resolve_spec() 把 .json 展开为dict并拒绝 .py（任务服务收到的策略不能执行代码）。
+'''
+import os
+import json
+
+REJECT_REASON = "未通过接受策略"
+DEFAULT_POLICY = "permissive"
+
+
+class AcceptAll:
+    name = "permissive"
+
+    def decide(self, prev, new):
+        return True, ""
+
+
+class Chi2Gate:
+    def __init__(self, tolerance=0.0):
+        self.tolerance = float(tolerance)
+        self.name = f"chi2(tol={self.tolerance:g})"
+
+    def decide(self, prev, new):
+        if prev is None or prev.get("chi2") is None:
+            return True, "没有可比较的Chi²"
+        if new.get("chi2") is None:
+            return False, "未检测到Chi²"
+        limit = prev["chi2"] * (1.0 - self.tolerance)
+        ok = new["chi2"] <= limit
+        return ok, f"Chi² {prev['chi2']:.4f} → {new['chi2']:.4f}（上限 {limit:.4f}）"
+
+
+class RFactorGate:
+    def __init__(self, keys=("Rwp",), tolerance=0.0):
+        self.keys = tuple(keys)
+        self.tolerance = float(tolerance)
+        self.name = f"rfactor({','.join(self.keys)}, tol={self.tolerance:g})"
+
+    def decide(self, prev, new):
+        prev_r = (prev or {}).get("r_factors")
+        if not prev_r:
+            return True, "没有可比较的R因子"
+        new_r = new.get("r_factors")
+        if not new_r:
+            return False, "未检测到R因子"
+        ok = True
+        parts = []
+        for k in self.keys:
+            if k not in prev_r or k not in new_r:
+                continue
+            ok = ok and new_r[k] <= prev_r[k] + self.tolerance
+            parts.append(f"{k} {prev_r[k]:.2f} → {new_r[k]:.2f}")
+        return ok, "，".join(parts)
+
+
+class AnyOf:
+    def __init__(self, *policies):
+        self.policies = policies
+        self.name = " or ".join(p.name for p in policies)
+
+    def decide(self, prev, new):
+        results = [p.decide(prev, new) for p in self.policies]
+        return any(ok for ok, _ in results), "；".join(d for _, d in results if d)
+
+
+class AllOf(AnyOf):
+    def __init__(self, *policies):
+        super().__init__(*policies)
+        self.name = " and ".join(p.name for p in policies)
+
+    def decide(self, prev, new):
+        results = [p.decide(prev, new) for p in self.policies]
+        return all(ok for ok, _ in results), "；".join(d for _, d in results if d)
+
+
+class ModulePolicy:
+    """.py 文件中的 decide(prev, new)"""
+
+    def __init__(self, path):
+        import importlib.util
+        spec = importlib.util.spec_from_file_location("magia_accept_policy_plugin", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        if not callable(getattr(module, "decide", None)):
+            raise ValueError(f"{path} 中没有 decide(prev, new) 函数")
+        self.module = module
+        self.name = getattr(module, "NAME", os.path.basename(path))
+
+    def decide(self, prev, new):
+        result = self.module.decide(prev, new)
+        if isinstance(result, tuple):
+            return bool(result[0]), str(result[1]) if len(result) > 1 else ""
+        return bool(result), ""
+
+
+def _from_dict(spec):
+    kind = spec.get("type", DEFAULT_POLICY)
+    tol = spec.get("tolerance", 0.0)
+    r_tol = spec.get("r_tolerance", 0.0)
+    keys = spec.get("keys", ("Rwp",))
+    if kind == "permissive":
+        return AcceptAll()
+    if kind == "chi2":
+        return Chi2Gate(tol)
+    if kind == "rfactor":
+        return RFactorGate(keys, r_tol if "r_tolerance" in spec else tol)
+    if kind == "gated":
+        return AnyOf(Chi2Gate(tol), RFactorGate(keys, r_tol))
+    if kind == "strict":
+        return AllOf(Chi2Gate(tol), RFactorGate(keys, r_tol))
+    if kind in ("any", "all"):
+        policies = [load_policy(p) for p in spec.get("policies", [])]
+        if not policies:
+            raise ValueError(f"{kind} 策略缺少 policies")
+        return AnyOf(*policies) if kind == "any" else AllOf(*policies)
+    raise ValueError(f"未知的接受策略: {kind}")
+
+
+def resolve_spec(spec):
+    """只含数据的策略描述：名称/dict 原样检查，.json 读入后展开，.py 或其他文件路径抛出ValueError"""
+    if not spec:
+        return None
+    if isinstance(spec, dict):
+        spec = dict(spec)
+        if spec.get("type") in ("any", "all"):
+            spec["policies"] = [resolve_spec(p) for p in spec.get("policies", [])]
+        _from_dict(spec)  # 检查类型和参数
+        return spec
+    if not isinstance(spec, str):
+        raise ValueError(f"接受策略格式错误: {spec!r}")
+    if spec.lower().endswith(".json"):
+        with open(spec, "r", encoding="utf-8") as f:
+            return resolve_spec(json.load(f))
+    if spec.lower().endswith(".py") or os.sep in spec or "/" in spec:
+        raise ValueError(f"不允许使用代码文件作为接受策略: {spec}")
+    _from_dict({"type": spec})
+    return spec
+
+
+def load_policy(spec=None):
+    """由名称/dict/文件路径得到策略对象（提供 name 和 decide(prev, new)）"""
+    if not spec:
+        return AcceptAll()
+    if hasattr(spec, "decide"):
+        return spec
+    if isinstance(spec, dict):
+        return _from_dict(spec)
+    if spec.lower().endswith(".json"):
+        with open(spec, "r", encoding="utf-8") as f:
+            return load_policy(json.load(f))
+    if spec.lower().endswith(".py"):
+        return ModulePolicy(spec)
+    return _from_dict({"type": spec})
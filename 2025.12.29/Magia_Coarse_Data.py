@@ -0,0 +1,57 @@
+'''2026.01
+粗到细精修：前N步在粗化（合并相邻点）后的dat上运行，之后切换回完整数据继续精修。
+早期的标度因子、零点、背底等步骤只需要粗略拟合，数据点少几倍FullProf每个循环也快几倍（TOF大数据集尤其明显）。
+- 支持自由格式的 X Y [Sigma] 数据（FullProf Ins=10等）和 Ins=0 等步长数据（用Magia_Dat_Reader读取），
+  开头/结尾的非数值行（XYDATA、注释等）原样保留；GSAS格式不粗化
+- 每 factor 个相邻点合并为一个：X、Y取平均，Sigma = sqrt(ΣSigma²)/factor；
+  取平均而不是求和，强度标度不变，粗数据上精修得到的标度因子、背底等可直接沿用到完整数据
+- 参数通过pcr模板链传递（粗数据最后一个成功步骤的pcr就是完整数据第一步的模板），不需要额外处理
+'''
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from Magia_Dat_Reader import read_dat
+
+MIN_COARSE_POINTS = 200  # 粗化后点数太少时不粗化
+
+
+def rebin(data, factor):
+    """每 factor 个相邻点合并为一个，最后不足 factor 个的点单独成组"""
+    factor = int(factor)
+    n = len(data)
+    if factor <= 1 or n < factor:
+        return data.copy()
+    starts = np.arange(0, n, factor)
+    counts = np.diff(np.append(starts, n))
+    out = np.empty((len(starts), data.shape[1]))
+    out[:, :2] = np.add.reduceat(data[:, :2], starts, axis=0) / counts[:, None]
+    if data.shape[1] > 2:
+        out[:, 2] = np.sqrt(np.add.reduceat(data[:, 2] ** 2, starts)) / counts
+    return out
+
+
+def write_coarse_dat(src, dst, factor):
+    """写出粗化后的dat，返回 (原点数, 粗化后点数)；格式不支持或点数太少时抛出ValueError"""
+    if np is None:
+        raise ImportError("粗化数据需要numpy")
+    dat = read_dat(src)
+    if dat.fmt not in ("xye", "ins0"):
+        raise ValueError(f"{dat.fmt} 格式的数据不支持粗化")
+    columns = [dat.x, dat.y] if dat.e is None else [dat.x, dat.y, dat.e]
+    coarse = rebin(np.column_stack(columns), factor)
+    if dat.fmt == "ins0" and dat.npoints % int(factor):
+        coarse = coarse[:-1]  # 不足factor个点的最后一组不在等步长网格上
+    if len(coarse) < MIN_COARSE_POINTS or len(coarse) == dat.npoints:
+        raise ValueError(f"粗化后点数为 {len(coarse)}（原 {dat.npoints}），不值得粗化")
+    with open(dst, 'w', encoding='utf-8', newline='') as f:
+        f.writelines(dat.header)
+        if dat.fmt == "ins0":
+            # 等步长：平均后的X仍等步长，写回 起始 步长 终止 + 强度
+            step = dat.step * int(factor)
+            f.write(f"{coarse[0, 0]:.6f} {step:.6f} {coarse[0, 0] + step * (len(coarse) - 1):.6f}\n")
+            np.savetxt(f, coarse[:, 1], fmt="%.6f")
+        else:
+            np.savetxt(f, coarse, fmt=["%.6f"] * coarse.shape[1])
+        f.writelines(dat.trailer)
+    return dat.npoints, len(coarse)
@@ -0,0 +1,242 @@
+'''2026.01
+衍射数据(dat)读取：内存映射读取文件，数据区一次性交给numpy解析（不逐行用Python循环），返回 X/Y/Sigma 数组，
+供精修前检查、作图、粗化等功能共用。支持的格式：
+  xye   自由格式 X Y [Sigma]（FullProf Ins=10，开头的XYDATA/注释行和结尾的非数值行原样保留在header/trailer中）
+  ins0  FullProf Ins=0：起始角 步长 终止角，之后是按步长排列的强度
+  gsas  GSAS格式（BANK行 + 数据），支持 CONST（角度，单位为百分之一度）/SLOG（TOF对数步长）的 ESD、STD、FXYE 数据
+命令行：python Magia_Dat_Reader.py xxx.dat  打印数据概况
+'''
+import os
+import sys
+import mmap
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HEADER_SCAN_LINES = 200  # 最多向前查找这么多行头部
+GSAS_FIELD = 8           # GSAS固定格式每个数值占8个字符，每行10个
+GSAS_LINE = 80
+
+
+class DatData:
+    def __init__(self, path, fmt, x, y, e=None, header=None, trailer=None, info=None):
+        self.path = path
+        self.fmt = fmt
+        self.x = x
+        self.y = y
+        self.e = e              # 没有误差列时为None
+        self.header = header or []
+        self.trailer = trailer or []
+        self.info = info or {}  # 格式相关信息（如GSAS的bank号、数据类型）
+
+    @property
+    def npoints(self):
+        return len(self.x)
+
+    @property
+    def step(self):
+        """步长（相邻点间隔的中位数）"""
+        if len(self.x) < 2:
+            return None
+        return float(np.median(np.diff(self.x)))
+
+    @property
+    def constant_step(self):
+        if len(self.x) < 3:
+            return True
+        d = np.diff(self.x)
+        return bool(np.max(np.abs(d - d.mean())) <= 1e-3 * abs(d.mean()))
+
+    def summary(self):
+        return {
+            "path": self.path,
+            "format": self.fmt,
+            "npoints": self.npoints,
+            "xmin": float(self.x.min()) if self.npoints else None,
+            "xmax": float(self.x.max()) if self.npoints else None,
+            "step": self.step,
+            "constant_step": self.constant_step,
+            "has_errors": self.e is not None,
+            "ymin": float(self.y.min()) if self.npoints else None,
+            "ymax": float(self.y.max()) if self.npoints else None,
+            "monotonic": bool(np.all(np.diff(self.x) > 0)),
+            "nonfinite": int(np.count_nonzero(~np.isfinite(self.y))),
+            **self.info
+        }
+
+
+def _numbers(line):
+    """行中的数值（逗号也作为分隔符），有非数值时返回None"""
+    try:
+        return [float(t) for t in line.replace(b',', b' ').split()]
+    except ValueError:
+        return None
+
+
+def _parse_free(text):
+    """空白/逗号分隔的数值块 -> 一维数组（numpy内部解析）"""
+    return np.fromstring(text.replace(b',', b' ').decode('ascii', errors='ignore'), sep=' ')
+
+
+def _split_header(mm):
+    """返回 (数据区起始偏移, 头部行列表, 第一行数据的数值)"""
+    header = []
+    pos = 0
+    for _ in range(HEADER_SCAN_LINES):
+        end = mm.find(b'\n', pos)
+        line = mm[pos:] if end < 0 else mm[pos:end + 1]
+        if not line:
+            break
+        nums = _numbers(line)
+        if nums and len(nums) >= 2:
+            return pos, header, nums
+        header.append(line.decode('utf-8', errors='ignore'))
+        if end < 0:
+            break
+        pos = end + 1
+    raise ValueError("没有找到数值数据")
+
+
+def _split_trailer(mm, start):
+    """从文件末尾向前跳过非数值行，返回 (数据区结束偏移, 尾部行列表)"""
+    trailer = []
+    end = len(mm)
+    while end > start:
+        line_start = mm.rfind(b'\n', start, end - 1) + 1
+        if line_start <= start:
+            line_start = start
+        line = mm[line_start:end]
+        if line.strip() and _numbers(line) is not None:
+            break
+        if line.strip():
+            trailer.insert(0, line.decode('utf-8', errors='ignore'))
+        end = line_start
+    return end, trailer
+
+
+def _fixed_width(block, nfields):
+    """GSAS固定宽度数据：按行补齐到80字符后切成8字符的字段，返回 [nfields, 8] 的字节矩阵"""
+    buf = np.frombuffer(block, dtype=np.uint8)
+    nl = np.flatnonzero(buf == ord('\n'))
+    starts = np.concatenate(([0], nl + 1))
+    ends = np.concatenate((nl, [len(buf)]))
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+    idx = starts[:, None] + np.arange(GSAS_LINE)
+    grid = np.full(idx.shape, ord(' '), dtype=np.uint8)
+    mask = idx < ends[:, None]
+    grid[mask] = buf[idx[mask]]
+    grid[grid == ord('\r')] = ord(' ')
+    fields = grid.reshape(-1, GSAS_FIELD)[:nfields]
+    if len(fields) < nfields:
+        raise ValueError(f"数据点数不足（应为 {nfields} 个字段，实际 {len(fields)} 个）")
+    return fields
+
+
+def _to_float(fields):
+    """字节矩阵的每一行转换为一个浮点数"""
+    return np.ascontiguousarray(fields).view(f"S{fields.shape[1]}").ravel().astype(float)
+
+
+def _read_gsas(path, mm, bank=None):
+    pos = 0
+    while True:
+        pos = mm.find(b'BANK', pos)
+        if pos < 0:
+            raise ValueError("GSAS文件中没有找到指定的BANK")
+        if pos == 0 or mm[pos - 1:pos] == b'\n':
+            end = mm.find(b'\n', pos)
+            tokens = mm[pos:end].decode('ascii', errors='ignore').split()
+            if bank is None or int(tokens[1]) == int(bank):
+                break
+        pos += 4
+    header = [mm[:end + 1].decode('utf-8', errors='ignore')]
+    nchan = int(tokens[2])
+    bintyp = tokens[4].upper()
+    coefs = [float(t) for t in tokens[5:9] if _numbers(t.encode())]
+    dtype = tokens[-1].upper() if tokens[-1].upper() in ("ESD", "STD", "FXYE", "ALT") else "STD"
+    data_start = end + 1
+    next_bank = mm.find(b'\nBANK', data_start)
+    data_end = len(mm) if next_bank < 0 else next_bank + 1
+    block = mm[data_start:data_end]
+    e = None
+    if dtype == "FXYE":
+        values = _parse_free(block)[:nchan * 3].reshape(-1, 3)
+        x, y, e = values[:, 0], values[:, 1], values[:, 2]
+        if bintyp.startswith("CONS"):
+            x = x / 100.0
+    elif dtype in ("ESD", "STD"):
+        if dtype == "ESD":
+            values = _to_float(_fixed_width(block, nchan * 2)).reshape(-1, 2)
+            y, e = values[:, 0], values[:, 1]
+        else:
+            # STD：每个字段为 I2 计数次数（空白为1） + F6 强度
+            fields = _fixed_width(block, nchan)
+            digits = np.where(fields[:, :2] == ord(' '), 0, fields[:, :2].astype(int) - ord('0'))
+            nc = np.maximum(digits[:, 0] * 10 + digits[:, 1], 1)
+            y = _to_float(fields[:, 2:])
+            e = np.sqrt(np.abs(y) / nc)
+        i = np.arange(len(y))
+        if bintyp.startswith("CONS"):
+            x = (coefs[0] + i * coefs[1]) / 100.0
+        elif bintyp == "SLOG":
+            x = coefs[0] * (1.0 + coefs[2]) ** i
+        else:
+            raise ValueError(f"不支持的GSAS分箱类型: {bintyp}")
+    else:
+        raise ValueError(f"不支持的GSAS数据类型: {dtype}")
+    return DatData(path, "gsas", x, y, e, header=header,
+                   info={"bank": int(tokens[1]), "bintyp": bintyp, "datatype": dtype})
+
+
+def detect_format(path):
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+    for line in head.splitlines()[:HEADER_SCAN_LINES]:
+        if line.startswith(b'BANK'):
+            return "gsas"
+    return "auto"
+
+
+def read_dat(path, fmt="auto", bank=None):
+    """读取dat，fmt 为 auto/xye/ins0/gsas"""
+    if np is None:
+        raise ImportError("读取dat需要numpy")
+    if os.path.getsize(path) == 0:
+        raise ValueError(f"{path} 是空文件")
+    if fmt == "auto":
+        fmt = detect_format(path)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if fmt == "gsas":
+            return _read_gsas(path, mm, bank)
+        start, header, first = _split_header(mm)
+        end, trailer = _split_trailer(mm, start)
+        values = _parse_free(mm[start:end])
+        # Ins=0：第一行为 起始 步长 终止，之后的数值个数与之对应
+        if fmt in ("auto", "ins0") and len(first) == 3 and first[1] > 0 and first[2] > first[0]:
+            n = int(round((first[2] - first[0]) / first[1])) + 1
+            if fmt == "ins0" or len(values) - 3 == n:
+                y = values[3:3 + n]
+                x = first[0] + first[1] * np.arange(len(y))
+                return DatData(path, "ins0", x, y, header=header, trailer=trailer)
+        ncol = min(3, len(first))
+        if len(values) % len(first):
+            raise ValueError(f"数据列数不一致（第一行为 {len(first)} 列）")
+        table = values.reshape(-1, len(first))
+        e = table[:, 2] if ncol == 3 else None
+        return DatData(path, "xye", table[:, 0], table[:, 1], e, header=header, trailer=trailer)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: Magia_Dat_Reader.py <dat> [...]")
+        sys.exit(1)
+    for p in sys.argv[1:]:
+        try:
+            s = read_dat(p).summary()
+            print(f"{p}: {s['format']}, {s['npoints']} 点, {s['xmin']:.4f} ~ {s['xmax']:.4f}, 步长 {s['step']:.5f}"
+                  f"{'' if s['constant_step'] else '（非等步长）'}, {'有' if s['has_errors'] else '无'}误差列")
+        except Exception as e:
+            print(f"{p}: 读取失败: {e}")
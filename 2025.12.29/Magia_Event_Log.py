@@ -0,0 +1,110 @@
+'''2026.01
+结构化事件日志：精修过程中的事件按 JSON Lines 写入（每行一个JSON），报告、运行数据库、监视程序可以逐行解析，
+不必再用正则从日志文本中提取。GUI中的四个日志标签页和 error_history.txt 不变。
+每条事件的字段：
+  ts     时间（ISO格式，毫秒）
+  level  info / warn / err
+  event  run_start / preflight / step_start / step_end / error / run_end
+  job    任务名（批量精修为dat名，任务服务为任务id，多起点为起点id）
+  dat    dat文件名
+  step   步骤序号（从1开始），step_name 步骤名
+  其余为事件相关字段，如 status、reason、duration、chi2、fullprof_seconds、params 等
+- 文件超过 max_bytes 时轮转：当前文件压缩为 .1.gz，原有的 .N.gz 依次后移，最多保留 backups 个
+- 同一路径在进程内共用一个 EventLog（批量/多起点/任务服务的多个worker可写同一个文件）
+命令行：python Magia_Event_Log.py AAA_events.jsonl [--event step_end] [--job xxx] [--level err]
+'''
+import os
+import sys
+import json
+import gzip
+import shutil
+import argparse
+import threading
+from datetime import datetime
+
+EVENTS_FILE = "AAA_events.jsonl"
+MAX_BYTES = 10 * 1024 * 1024
+BACKUPS = 5
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+class EventLog:
+    def __init__(self, path, max_bytes=MAX_BYTES, backups=BACKUPS):
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.lock = threading.Lock()
+
+    def emit(self, event, level="info", **fields):
+        record = {"ts": datetime.now().isoformat(timespec="milliseconds"), "level": level, "event": event}
+        record.update((k, v) for k, v in fields.items() if v is not None)
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8", newline="\n") as f:
+                f.write(line)
+                size = f.tell()
+            if size >= self.max_bytes:
+                self._rotate()
+
+    def _rotated(self, n):
+        return f"{self.path}.{n}.gz"
+
+    def _rotate(self):
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        if os.path.exists(self._rotated(self.backups)):
+            os.remove(self._rotated(self.backups))
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(self._rotated(n)):
+                os.replace(self._rotated(n), self._rotated(n + 1))
+        # 在锁内压缩，其他线程的新事件等压缩完成后写入新的当前文件
+        with open(self.path, "rb") as src, gzip.open(self._rotated(1), "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(self.path)
+
+    def files(self):
+        """全部日志文件，从旧到新"""
+        old = [self._rotated(n) for n in range(self.backups, 0, -1) if os.path.exists(self._rotated(n))]
+        return old + ([self.path] if os.path.exists(self.path) else [])
+
+
+def get_event_log(path):
+    """同一路径返回同一个EventLog"""
+    path = os.path.abspath(path)
+    with _logs_lock:
+        if path not in _logs:
+            _logs[path] = EventLog(path)
+        return _logs[path]
+
+
+def read_events(path, **match):
+    """按时间顺序逐条读取事件（含已轮转的 .gz），match 为字段过滤条件，如 event="step_end" """
+    for p in EventLog(path).files():
+        opener = gzip.open if p.endswith(".gz") else open
+        with opener(p, "rt", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 写入中途被中断的半行
+                if all(record.get(k) == v for k, v in match.items()):
+                    yield record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="读取Magia结构化事件日志")
+    parser.add_argument("path")
+    parser.add_argument("--event")
+    parser.add_argument("--job")
+    parser.add_argument("--level")
+    args = parser.parse_args(argv)
+    match = {k: v for k, v in (("event", args.event), ("job", args.job), ("level", args.level)) if v}
+    for record in read_events(args.path, **match):
+        print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
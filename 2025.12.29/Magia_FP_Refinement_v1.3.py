@@ -19,12 +19,22 @@ from collections import deque
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
     QFileDialog, QComboBox, QTabWidget, QTextEdit, QProgressBar, QMessageBox,
-    QSpinBox, QGroupBox, QSplitter, QSizePolicy
+    QSpinBox, QGroupBox, QSplitter, QSizePolicy, QCheckBox, QDoubleSpinBox
 )
 from PyQt5.QtCore import Qt, QThread, pyqtSignal,QTimer
 from PyQt5.QtGui import QFont, QPalette, QColor
-from PyQt5.QtWidgets import QRadioButton, QButtonGroup
-import importlib.util
+from PyQt5.QtWidgets import QRadioButton, QButtonGroup, QInputDialog
+from Magia_Step_Optimizer import optimize_step_file, format_report
+from Magia_Step_Cache import StepCache, default_cache_dir
+from Magia_Limit_Rules import load_limit_checker, CompiledLimits, RunawayDetector, load_rules
+from Magia_Multi_Start import MultiStartRunner, load_start_spec
+from Magia_Param_Trends import TrendMatrix, TRENDS_FILE, parse_refined_params, parse_r_factors
+from Magia_Coarse_Data import write_coarse_dat
+from Magia_Preflight import preflight_check, format_issues
+from Magia_Watch_Ingest import DatIngest, POLL_INTERVAL_MS
+from Magia_Metrics import metrics, files_size, MetricsExporter, METRICS_FILE, EXPORT_INTERVAL
+from Magia_Event_Log import get_event_log, EVENTS_FILE
+from Magia_Accept_Policy import load_policy, REJECT_REASON
 
 '''2025.10.30
 新增PCR_check调用，自动跳过B值或占位率异常的步骤
@@ -64,10 +74,43 @@ _batch_on_finished 会在每个 dat 完成后查找上一次“成功”步骤
 
 2025.12.18
 对步骤概览进行优化显示，增加顶部元信息显示当前策略、dat文件和初始pcr路径
+
+2026.01
+步骤概览中记录成功步骤的Chi²
+新增“优化步骤”：根据历史AAA_step_overview.txt删除总是失败/超时/不改变Chi²的步骤，成功率低的步骤移到最后（见Magia_Step_Optimizer.py）
+PCRcheck支持声明式规则文件（.json，由Magia_PCR_check导出，见Magia_Limit_Rules.py），整个精修只加载/编译一次，
+每步只读取一次pcr完成全部检查；旧版导出的 .py 仍可使用
+新增精修过程中的参数失控检测：解析FullProf每个循环输出的参数新值，一旦超出PCRcheck规则范围立即终止该步骤
+新增步骤缓存：相同的pcr+dat+fp2k直接恢复上次的输出文件，不再运行FullProf（见Magia_Step_Cache.py，缓存目录默认为用户缓存目录下的 magia/step_cache，配置文件中的 cache_dir 可指定其他路径）
+新增“多起点精修”：对当前dat按起点配置（网格/随机）写出多个初值不同的pcr模板，并行跑完整步骤，
+按最终Chi²和R因子排序，前k步明显落后的起点提前淘汰（见Magia_Multi_Start.py，结果在 <dat名>_multistart 目录）
+批量精修时每个dat结束后把最终参数值/ESD/Chi²/R因子追加到参数趋势矩阵，实时保存为精修目录下的AAA_param_trends.npz和.csv，
+可用“参数趋势图”按钮或 Magia_Param_Trends.py 命令行导出/作图
+新增粗到细精修：设置“粗数据步骤数”N>0时，前N步在合并相邻点后的dat上运行，之后切换到完整数据，
+参数沿pcr模板链传递（见Magia_Coarse_Data.py），步骤概览中粗数据步骤标记为“粗化数据”
+新增精修前预检（见Magia_Preflight.py）：检查dat格式/范围、参数库位置、原子名重复，并由晶胞估算衍射峰数，
+确定跑不通时所有步骤直接标记为失败，不启动FullProf（批量精修继续下一个dat）
+新增批量精修“持续监视新dat”：已有dat精修完后继续等待目录中新写完的dat，按自然排序依次精修（见Magia_Watch_Ingest.py），
+点击“终止”结束监视
+新增运行指标（见Magia_Metrics.py）：步骤开始/成功/失败（按原因）、FullProf耗时和Python额外开销、排队数、超时和主动终止次数、写出字节数，
+勾选“导出运行指标”后每15秒以Prometheus文本格式写入精修目录下的 magia_metrics.prom（配置文件中的 metrics_file 可指定其他路径）
+修正watchdog检测到阻塞并终止FullProf后，步骤失败原因显示为“正常完成”的问题；步骤超时（>10000s）的原因不再被“用户主动跳过”覆盖
+新增结构化事件日志（见Magia_Event_Log.py）：精修开始/预检/步骤开始/步骤结束（状态、原因、耗时、Chi²）/错误/精修结束
+按JSON Lines写入精修目录下的AAA_events.jsonl，超过10MB时压缩轮转，其他工具可逐行解析
+新增步骤接受策略（见Magia_Accept_Policy.py）：正常结束的步骤按策略与上一个被接受的步骤比较Chi²/R因子，
+不接受时记为失败（原因“未通过接受策略”），下一步回退使用上一个被接受的pcr；默认“全部接受”与以前相同
 '''
 
 
 CONFIG_FILE = "refine_gui_config.json"
+# 步骤接受策略（见Magia_Accept_Policy.py）：界面文字 -> 策略名，最后一项为自定义 .json/.py 文件
+ACCEPT_POLICY_CHOICES = [
+    ("全部接受", "permissive"),
+    ("Chi²或Rwp不变差", "gated"),
+    ("Chi²和Rwp都不变差", "strict"),
+    ("Chi²不变差", "chi2"),
+    ("自定义文件…", None),
+]
 
 def read_text_autoenc(filepath, encodings=('utf-8', 'gbk', 'gb2312', 'latin1')):
     last_exc = None
@@ -111,6 +154,25 @@ def load_config():
             return {}
     return {}
 
+def format_overview_line(entry):
+    """步骤概览单行文本，界面显示与AAA_step_overview.txt共用（Magia_Step_Optimizer按此格式解析）"""
+    status = entry["status"]
+    params = entry.get("params", [])
+    param_str = ", ".join(params) if params else ""
+    line = f"步骤 {entry['index']}: {entry['name']}"
+    if param_str:
+        line += f" | 参数: {param_str}"
+    line += f" | 状态: {status} | 耗时: {entry['duration']}s"
+    if status == "失败" or status == "跳过":
+        line += f" | 原因: {entry.get('reason', '')}"
+    elif status == "成功":
+        line += " | 精修成功"
+        if entry.get("coarse"):
+            line += " | 粗化数据"
+        if entry.get("chi2") is not None:
+            line += f" | Chi²: {entry['chi2']:.4f}"
+    return line
+
 # 新增：自然排序函数，确保 1.dat 2.dat ... 10.dat 正确排序
 def natural_sort_key(s):
     parts = re.split(r'(\d+)', s)
@@ -162,6 +224,17 @@ class RefinementWorker(QThread):
         self._overview_list = []  # 新增：步骤状态列表
         self._current_step_start = None
         self.pcrcheck_path = self.config.get("pcrcheck_path")  # 新增：保存PCRcheck路径
+        self._limit_checker = None
+        self._limit_checker_error = None
+        self._runaway_limits = None  # 过程中检测用的编译规则
+        self._last_check_result = None
+        self._last_chi = None  # 最近一次成功步骤的Chi²
+        self.refined_params = {}  # 各成功步骤 .out 中的精修参数 {符号名: (值, ESD)}，后面的步骤覆盖前面的
+        self.final_pcr_values = {}  # 最后一次成功步骤的PCRcheck参数值
+        self.final_r_factors = None
+        self.step_hook = None  # 每步结束后调用 step_hook(步骤序号, 最近Chi²)，返回False时终止（多起点淘汰用）
+        self.event_log = None  # 结构化事件日志（config中的event_log路径）
+        self._job_name = self.config.get("job_id") or os.path.splitext(os.path.basename(self.config.get("data_path", "")))[0]
 
     def run(self):
         TEMP_DIR = self.config['temp_dir']  # 修改为使用传入的temp_dir
@@ -176,6 +249,50 @@ class RefinementWorker(QThread):
             import shutil
             shutil.rmtree(TEMP_DIR)
         os.makedirs(TEMP_DIR, exist_ok=True)
+        if self.config.get("event_log"):
+            self.event_log = get_event_log(self.config["event_log"])
+        # 限值规则整个精修只加载一次
+        if self.pcrcheck_path:
+            try:
+                self._limit_checker = load_limit_checker(self.pcrcheck_path)
+            except Exception as e:
+                self._limit_checker_error = str(e)
+                self.log_signal.emit("err", f"PCR_check加载失败: {e}")
+        if self._limit_checker is not None and self.config.get("runaway_check", True):
+            try:
+                if isinstance(self._limit_checker, CompiledLimits):
+                    self._runaway_limits = self._limit_checker
+                elif hasattr(self._limit_checker, "PARAM_LIMITS"):
+                    self._runaway_limits = CompiledLimits.from_param_limits(self._limit_checker.PARAM_LIMITS)
+            except Exception as e:
+                self.log_signal.emit("warn", f"⚠️ 参数失控检测不可用: {e}")
+        step_cache = None
+        if self.config.get("step_cache"):
+            try:
+                step_cache = StepCache(self.config.get("cache_dir") or default_cache_dir())
+                step_cache.prune()
+            except Exception as e:
+                self.log_signal.emit("warn", f"⚠️ 步骤缓存不可用: {e}")
+                step_cache = None
+        try:
+            accept_policy = load_policy(self.config.get("accept_policy"))
+        except Exception as e:
+            accept_policy = load_policy(None)
+            self.log_signal.emit("warn", f"⚠️ 步骤接受策略加载失败，全部接受: {e}")
+        if accept_policy.name != "permissive":
+            self.log_signal.emit("main", f"⚖️ 步骤接受策略: {accept_policy.name}")
+        accepted_result = None  # 上一个被接受步骤的 {"chi2", "r_factors", "coarse"}
+        # 粗到细：前 coarse_steps 步使用粗化后的dat
+        coarse_steps = int(self.config.get("coarse_steps", 0) or 0)
+        coarse_dat = None
+        if coarse_steps > 0:
+            coarse_dat = os.path.join(TEMP_DIR, "coarse_" + os.path.basename(self.config['data_path']))
+            try:
+                n_full, n_coarse = write_coarse_dat(self.config['data_path'], coarse_dat, self.config.get("coarse_factor", 4))
+                self.log_signal.emit("main", f"🔽 前 {coarse_steps} 步使用粗化数据: {n_full} → {n_coarse} 个点")
+            except Exception as e:
+                coarse_dat = None
+                self.log_signal.emit("warn", f"⚠️ 无法生成粗化数据，全部步骤使用完整数据: {e}")
         file_history = deque(maxlen=MAX_KEEP_STEPS)
         current_template = self.config['pcr_path']
         if os.path.exists(ERROR_LOG_PATH):
@@ -204,6 +321,25 @@ class RefinementWorker(QThread):
             }
             self._overview_list.append(overview_entry)
         self.step_overview_signal.emit(self._overview_list)
+        self._event("run_start", pcr=os.path.abspath(self.config['pcr_path']), temp_dir=os.path.abspath(TEMP_DIR),
+                    steps=total, coarse_steps=coarse_steps if coarse_dat is not None else 0)
+        if self.config.get("preflight", True):
+            issues = preflight_check(self.config['pcr_path'], self.config['data_path'], param_lib)
+            if issues:
+                self.log_signal.emit("warn", f"🔍 精修前预检:\n{format_issues(issues)}")
+                self._event("preflight", "err" if any(l == "err" for l, _ in issues) else "warn",
+                            issues=[{"level": l, "msg": m} for l, m in issues])
+            errors = [msg for level, msg in issues if level == "err"]
+            if errors:
+                for entry in self._overview_list:
+                    entry["status"] = "失败"
+                    entry["reason"] = "预检失败: " + "；".join(errors)
+                self.step_overview_signal.emit(self._overview_list)
+                self.log_signal.emit("err", f"❌ 预检未通过，未启动FullProf: {self.config['data_path']}")
+                self.progress_signal.emit(100)
+                self._event("run_end", "err", result="preflight_failed")
+                self.finished_signal.emit("预检未通过，未运行精修。")
+                return
         for idx, step_idx in enumerate(self.run_indices):
             if self._stop:
                 self.log_signal.emit("main", f"[主日志] 已终止于步骤 {step_idx+1}")
@@ -216,6 +352,11 @@ class RefinementWorker(QThread):
             self._overview_list[idx]["duration"] = 0
             self._overview_list[idx]["reason"] = ""
             self.step_overview_signal.emit(self._overview_list)
+            metrics.steps_started.inc()
+            fullprof_seconds = None  # 运行指标：None表示本步没有启动FullProf
+            cached = None
+            written_files = []
+            timed_out = [False]
 
             # 新增：实时刷新耗时线程
             running = True
@@ -225,6 +366,7 @@ class RefinementWorker(QThread):
                     self._overview_list[idx]["duration"] = int(now - self._current_step_start)
                     # 步骤超时自动跳过
                     if self._overview_list[idx]["duration"] > 10000 and not self._skip:
+                        timed_out[0] = True
                         self._skip = True
                         self._overview_list[idx]["status"] = "跳过"
                         self._overview_list[idx]["reason"] = "精修超时"
@@ -245,6 +387,7 @@ class RefinementWorker(QThread):
                 self._overview_list[idx]["duration"] = int(time.time() - self._current_step_start)
                 self._overview_list[idx]["reason"] = "用户主动跳过"
                 self.step_overview_signal.emit(self._overview_list)
+                self._record_step_end(idx, step, None, None, [])
                 continue
             try:
                 step_number = idx + 1
@@ -268,10 +411,15 @@ class RefinementWorker(QThread):
                 ]
                 new_dat_path = os.path.join(TEMP_DIR, f"{base_name}.dat")
                 import shutil
-                shutil.copyfile(self.config['data_path'], new_dat_path)
+                use_coarse = coarse_dat is not None and idx < coarse_steps
+                if coarse_dat is not None and idx == coarse_steps:
+                    self.log_signal.emit("main", "🔼 切换到完整数据，沿用粗化数据上精修得到的参数")
+                shutil.copyfile(coarse_dat if use_coarse else self.config['data_path'], new_dat_path)
+                self._overview_list[idx]["coarse"] = use_coarse
                 # current_template = new_pcr_path  # <-- 移除这行，后面根据结果再更新
                 step_files = [os.path.join(TEMP_DIR, f"{base_name}{ext}") for ext in ['.out', '.prf', '.pcr', '.mic', '.dat', '.fst', '.log', '.sum']]
                 file_history.append(step_files)
+                written_files = step_files + [os.path.join(TEMP_DIR, f"{base_name}.param")]
                 while len(file_history) > MAX_KEEP_STEPS:
                     old_files = file_history.popleft()
                     for f in old_files:
@@ -282,15 +430,33 @@ class RefinementWorker(QThread):
                                 pass
                 self.log_signal.emit("main", f"\n🚀 步骤 {idx+1}/{total}: {step['name']}")
                 self.log_signal.emit("main", f"🛠️ 正在精修: {', '.join(param_names)}")
+                self._event("step_start", step=idx + 1, step_name=step['name'], params=param_names, coarse=use_coarse)
                 # 计时开始
                 step_start = time.time()
-                success, error_info = self.run_fullprof_process(
-                    fullprof_path=self.config['fullprof_path'],
-                    pcr_path=new_pcr_path,
-                    timeout=self.config.get('timeout', 3600),
-                    show_window=False,
-                    temp_dir=TEMP_DIR
-                )
+                # 步骤缓存：键需在FullProf改写pcr之前计算
+                cache_key = None
+                if step_cache is not None:
+                    try:
+                        cache_key = step_cache.make_key(new_pcr_path, new_dat_path, self.config['fullprof_path'])
+                        cached = step_cache.restore(cache_key, TEMP_DIR, base_name)
+                    except Exception as e:
+                        self.log_signal.emit("warn", f"⚠️ 步骤缓存读取失败: {e}")
+                if cached is not None:
+                    success, error_info = cached
+                    self.log_signal.emit("main", f"♻️ 命中步骤缓存，跳过FullProf运行: {step['name']}")
+                else:
+                    fullprof_start = time.time()
+                    success, error_info = self.run_fullprof_process(
+                        fullprof_path=self.config['fullprof_path'],
+                        pcr_path=new_pcr_path,
+                        timeout=self.config.get('timeout', 3600),
+                        show_window=False,
+                        temp_dir=TEMP_DIR
+                    )
+                    fullprof_seconds = time.time() - fullprof_start
+                    # 只缓存成功或FullProf确定性报错的结果（超时/阻塞/用户跳过不缓存）
+                    if cache_key is not None and self._last_run_cacheable and not self._skip:
+                        step_cache.store(cache_key, TEMP_DIR, base_name, success, error_info)
                 # 无论成功与否，先尝试提取PARAM_LIMITS中所有参数的值并保存到概览（便于调试）
                 try:
                     _ = self.check_pcr_values(new_pcr_path)  # 也会填充 self._last_pcr_values
@@ -308,28 +474,19 @@ class RefinementWorker(QThread):
                     self.log_signal.emit("err", f"⚠️ 无法写入param文件: {e}")
                 # 检查是否被跳过
                 if self._skip:
-                    self.log_signal.emit("warn", f"⏩ 用户操作：立即跳过步骤: {step['name']}")
-                    self.log_error(ERROR_LOG_PATH, step['name'], "用户主动跳过")
+                    skip_reason = "精修超时" if timed_out[0] else "用户主动跳过"
+                    if not timed_out[0]:
+                        self.log_signal.emit("warn", f"⏩ 用户操作：立即跳过步骤: {step['name']}")
+                    self.log_error(ERROR_LOG_PATH, step['name'], skip_reason)
                     self._skip = False
                     self._overview_list[idx]["status"] = "跳过"
                     self._overview_list[idx]["duration"] = int(time.time() - step_start)
-                    self._overview_list[idx]["reason"] = "用户主动跳过"
+                    self._overview_list[idx]["reason"] = skip_reason
                     self.step_overview_signal.emit(self._overview_list)
                     continue
                 if success:
-                    # check_result 已经在上面调用过并保存值到 self._last_pcr_values
-                    # 为兼容旧逻辑，这里再次调用以获得错误信息
-                    check_result = None
-                    if self.pcrcheck_path:
-                        try:
-                            spec = importlib.util.spec_from_file_location("PCR_check_gui_export", self.pcrcheck_path)
-                            pcrcheck = importlib.util.module_from_spec(spec)
-                            spec.loader.exec_module(pcrcheck)
-                            errs = pcrcheck.check_pcr_limits(new_pcr_path)
-                            if errs:
-                                check_result = "\n".join(errs)
-                        except Exception as e:
-                            check_result = f"PCR_check运行失败: {e}"
+                    # check_pcr_values 已在上面对同一个pcr执行过全部检查，直接使用其结果
+                    check_result = self._last_check_result
                     if check_result is not None:
                         self._overview_list[idx]["status"] = "失败"
                         self._overview_list[idx]["duration"] = int(time.time() - step_start)
@@ -337,11 +494,26 @@ class RefinementWorker(QThread):
                         self.step_overview_signal.emit(self._overview_list)
                         continue
                     else:
-                        self._overview_list[idx]["status"] = "成功"
+                        out_path = os.path.join(TEMP_DIR, f"{base_name}.out")
+                        chi = self.extract_chi_value(new_pcr_path)
+                        result = {"chi2": chi, "r_factors": parse_r_factors(out_path), "coarse": use_coarse}
+                        # 粗化数据与完整数据的Chi²/R因子不可比，切换后重新建立基准
+                        baseline = accepted_result if accepted_result is not None and accepted_result["coarse"] == use_coarse else None
+                        accepted, detail = accept_policy.decide(baseline, result)
                         self._overview_list[idx]["duration"] = int(time.time() - step_start)
+                        if not accepted:
+                            self._overview_list[idx]["status"] = "失败"
+                            self._overview_list[idx]["reason"] = f"{REJECT_REASON}（{accept_policy.name}）: {detail}，回退到上一步的pcr"
+                            if chi is not None:
+                                self._overview_list[idx]["chi2"] = chi
+                            self.step_overview_signal.emit(self._overview_list)
+                            self.log_signal.emit("warn", f"↩️ 步骤 {step['name']} 未被接受: {detail}，下一步继续使用 {os.path.basename(current_template)}")
+                            continue
+                        self._overview_list[idx]["status"] = "成功"
                         self._overview_list[idx]["reason"] = "精修成功"
                         self.step_overview_signal.emit(self._overview_list)
                         current_template = new_pcr_path
+                        accepted_result = result
                 else:
                     # 即使失败，也已经把参数值放到概览里
                     self._overview_list[idx]["status"] = "失败"
@@ -349,8 +521,14 @@ class RefinementWorker(QThread):
                     self._overview_list[idx]["reason"] = error_info
                     self.step_overview_signal.emit(self._overview_list)
                     continue
-                chi = self.extract_chi_value(new_pcr_path)
+                # 参数趋势用：记录本步的精修参数和R因子
+                self.refined_params.update(parse_refined_params(out_path))
+                self.final_pcr_values = dict(self._last_pcr_values)
+                self.final_r_factors = result["r_factors"] or self.final_r_factors
                 if chi is not None:
+                    self._last_chi = chi
+                    self._overview_list[idx]["chi2"] = chi
+                    self.step_overview_signal.emit(self._overview_list)
                     self.log_signal.emit("chi", f"Step {step['name']} Chi²: {chi:.2f}")
                 else:
                     self.log_signal.emit("warn", f"⚠️ 未检测到Chi²值")
@@ -362,37 +540,73 @@ class RefinementWorker(QThread):
                 self._overview_list[idx]["reason"] = error_info
                 self.step_overview_signal.emit(self._overview_list)
                 continue
+            finally:
+                self._record_step_end(idx, step, fullprof_seconds, cached, written_files)
+                if self.step_hook is not None:
+                    try:
+                        if self.step_hook(idx + 1, self._last_chi) is False:
+                            self._stop = True
+                    except Exception as e:
+                        self.log_signal.emit("warn", f"⚠️ 步骤回调出错: {e}")
         self.progress_signal.emit(100)
+        self._event("run_end", result="stopped" if self._stop else "completed",
+                    succeeded=sum(1 for e in self._overview_list if e["status"] == "成功"),
+                    failed=sum(1 for e in self._overview_list if e["status"] == "失败"),
+                    skipped=sum(1 for e in self._overview_list if e["status"] == "跳过"),
+                    chi2=self._last_chi)
         self.finished_signal.emit("精修已完成！报告已生成。")
 
+    def _event(self, event, level="info", **fields):
+        if self.event_log is None:
+            return
+        try:
+            self.event_log.emit(event, level, job=self._job_name,
+                                dat=os.path.basename(self.config['data_path']), **fields)
+        except Exception as e:
+            self.event_log = None  # 写不了就停用，不影响精修
+            self.log_signal.emit("warn", f"⚠️ 事件日志写入失败，已停用: {e}")
+
+    def _record_step_end(self, idx, step, fullprof_seconds, cached, written_files):
+        """步骤结束：写运行指标和step_end事件（fullprof_seconds为None表示没有启动FullProf）"""
+        entry = self._overview_list[idx]
+        elapsed = time.time() - self._current_step_start
+        metrics.record_step(entry["status"], entry["reason"], elapsed,
+                            fullprof_seconds, cached is not None, files_size(written_files))
+        level = {"成功": "info", "跳过": "warn"}.get(entry["status"], "err")
+        self._event("step_end", level, step=idx + 1, step_name=step['name'], status=entry["status"],
+                    reason=entry["reason"], duration=round(elapsed, 3), chi2=entry.get("chi2"),
+                    fullprof_seconds=None if fullprof_seconds is None else round(fullprof_seconds, 3),
+                    cached=cached is not None, coarse=bool(entry.get("coarse")))
+
     def check_pcr_values(self, pcr_path):
         # 如果未导入PCRcheck，直接返回None（即不做限制），同时清空上次值
         self._last_pcr_values = {}
+        self._last_check_result = None
         if not self.pcrcheck_path:
             return None
+        if self._limit_checker is None:
+            self._last_check_result = f"PCR_check运行失败: {self._limit_checker_error}"
+            return self._last_check_result
         try:
-            
-            spec = importlib.util.spec_from_file_location("PCR_check_gui_export", self.pcrcheck_path)
-            pcrcheck = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(pcrcheck)
             # 提取并保存所有参数值（无论是否超限）
             try:
-                vals = pcrcheck.get_pcr_values(pcr_path)
+                vals = self._limit_checker.get_pcr_values(pcr_path)
             except Exception:
                 vals = {}
             self._last_pcr_values = vals or {}
-            errs = pcrcheck.check_pcr_limits(pcr_path)
+            errs = self._limit_checker.check_pcr_limits(pcr_path)
             if errs:
-                return "\n".join(errs)
-            return None
+                self._last_check_result = "\n".join(errs)
         except Exception as e:
-            return f"PCR_check运行失败: {e}"
+            self._last_check_result = f"PCR_check运行失败: {e}"
+        return self._last_check_result
         
     def modify_pcr_template(self, template_path, output_path, active_param_ids, param_lib, active_params=None):
         try:
             lines = read_text_autoenc(template_path)
         except Exception as e:
-            QMessageBox.critical(None, "编码错误", str(e))
+            # worker可能运行在任务服务（无GUI）中，只记录日志，由步骤的异常处理记为失败
+            self.log_signal.emit("err", f"❌ 编码错误: {template_path}: {str(e)}")
             raise
         param_positions = {}
         for pid, param in param_lib.items():
@@ -424,6 +638,16 @@ class RefinementWorker(QThread):
             f.writelines(lines)
     def run_fullprof_process(self, fullprof_path, pcr_path, timeout, show_window, temp_dir):
         log_path = pcr_path.replace('.pcr', '.log')
+        self._last_run_cacheable = False  # 仅正常退出或检测到FullProf报错时置为True，供步骤缓存判断
+        # 参数失控检测：以运行前pcr中的值为基准，跟踪stdout和正在写入的.out中的参数新值
+        detector = None
+        out_path = pcr_path.replace('.pcr', '.out')
+        if self._runaway_limits is not None:
+            try:
+                baseline, _ = self._runaway_limits.read_values(pcr_path)
+                detector = RunawayDetector(self._runaway_limits, baseline)
+            except Exception:
+                detector = None
         WARNING_FILE = os.path.join(temp_dir, "convergence_warnings.txt")
         buffer = deque(maxlen=2)
         startupinfo = None
@@ -463,9 +687,18 @@ class RefinementWorker(QThread):
 
                 # --- 插入 watchdog: 独立线程在 stdout 无新 shift 时也能超时终止进程 ---
                 watchdog_stop = [False]
+                watchdog_blocked = [False]
                 def _watchdog():
                     while not watchdog_stop[0] and process.poll() is None:
                         try:
+                            if detector is not None and detector.poll_file(out_path):
+                                try:
+                                    process.kill()
+                                except Exception:
+                                    pass
+                                self._current_process = None
+                                self.log_signal.emit("err", f"参数失控，已终止当前步骤: {detector.reason}")
+                                break
                             # 如果已记录过 last_shift_time 且超过阈值则 kill
                             if last_shift_time is not None and (time.time() - last_shift_time) > BLOCK_TIMEOUT:
                                 try:
@@ -473,6 +706,7 @@ class RefinementWorker(QThread):
                                 except Exception:
                                     pass
                                 self._current_process = None
+                                watchdog_blocked[0] = True
                                 self.log_signal.emit("err", "当前步骤精修阻塞（watchdog）！请查看log文件")
                                 break
                         except Exception:
@@ -487,6 +721,11 @@ class RefinementWorker(QThread):
                         log_file.write(line)
                         self.log_signal.emit("main", line.rstrip())
                         buffer.append(line.strip())
+                        if detector is not None and detector.feed(line):
+                            process.kill()
+                            self._current_process = None
+                            self.log_signal.emit("err", f"参数失控，已终止当前步骤: {detector.reason}")
+                            return False, f"参数失控: {detector.reason}"
                         # 检查是否被跳过
                         if self._skip:
                             process.kill()
@@ -556,6 +795,11 @@ class RefinementWorker(QThread):
                             process.kill()
                             self._current_process = None
                             break
+                if detector is not None and detector.reason is not None:
+                    # watchdog 线程从 .out 中检测到失控并已终止进程
+                    return False, f"参数失控: {detector.reason}"
+                if watchdog_blocked[0]:
+                    return False, f"当前步骤精修阻塞！超过{BLOCK_TIMEOUT}s未检测到新的[Max] Shift（watchdog）"
                 try:
                     exit_code = process.wait(timeout=timeout)
                 except Exception:
@@ -563,6 +807,7 @@ class RefinementWorker(QThread):
                     self._current_process = None
                     return False, "进程超时"
                 self._current_process = None
+                self._last_run_cacheable = exit_code == 0 or error_flag
                 return exit_code == 0 and not error_flag, error_message if error_flag else "正常完成"
         except Exception as e:
             self._current_process = None
@@ -575,7 +820,7 @@ class RefinementWorker(QThread):
         try:
             content = read_text_autoenc_content(out_path)
         except Exception as e:
-            QMessageBox.critical(None, "编码错误", str(e))
+            self.log_signal.emit("err", f"❌ 编码错误: {out_path}: {str(e)}")
             return None
         match = re.search(
             r"Global user-weigthed Chi2 \(Bragg contrib\.\):\s*(\d+\.?\d*)",
@@ -586,6 +831,7 @@ class RefinementWorker(QThread):
     def log_error(self, error_log_path, step_name, error_info):
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         log_entry = f"[{timestamp}] Step: {step_name}\nError: {error_info}\n{'='*60}\n"
+        self._event("error", "err", step_name=step_name, reason=error_info, error_log=error_log_path)
         try:
             with open(error_log_path, 'a', encoding='utf-8') as f:
                 f.write(log_entry)
@@ -709,19 +955,7 @@ class LogTabWidget(QTabWidget):
             status = entry["status"]
             if status not in ("运行中", "成功", "失败", "跳过"):
                 continue  # 只显示正在运行和已完成的步骤
-            name = entry["name"]
-            params = entry.get("params", [])
-            param_str = ", ".join(params) if params else ""
-            duration = entry["duration"]
-            reason = entry.get("reason", "")
-            line = f"步骤 {entry['index']}: {name}"
-            if param_str:
-                line += f" | 参数: {param_str}"
-            line += f" | 状态: {status} | 耗时: {duration}s"
-            if status == "失败" or status == "跳过":
-                line += f" | 原因: {reason}"
-            elif status == "成功":
-                line += " | 精修成功"
+            line = format_overview_line(entry)
             lines.append(line)
             lines.append("-" * 60)
         # 保持当前滚动位置，不自动下拉
@@ -757,6 +991,16 @@ class RefinementGUI(QWidget):
         # self.auto_search_fp2k()
         self.pcrcheck_path = None  # 新增：PCRcheck文件路径
         self._batch_dat_start_time = None  # 记录当前dat开始时间
+        self._batch_ingest = None  # 持续监视新dat
+        self._batch_waiting = False
+        self._batch_watch_timer = QTimer(self)
+        self._batch_watch_timer.timeout.connect(self._batch_poll_ingest)
+        self._metrics_exporter = None
+        metrics.add_collector(self._collect_metrics)
+        self._set_metrics_export(self.metrics_checkbox.isChecked())
+        self.metrics_checkbox.toggled.connect(self._set_metrics_export)
+        self._update_metrics_path()
+        self.dir_edit.textChanged.connect(self._update_metrics_path)
         
     def skip_current_step(self):
         if self.worker:
@@ -796,9 +1040,16 @@ class RefinementGUI(QWidget):
         self._batch_dat_files = natural_sorted([f for f in os.listdir(refine_dir) if f.lower().endswith('.dat')])
         self._batch_total = len(self._batch_dat_files)
         self._batch_idx = 0
-        if self._batch_total == 0:
+        watch = self.watch_checkbox.isChecked()
+        if self._batch_total == 0 and not watch:
             QMessageBox.warning(self, "错误", "当前目录下没有dat文件")
             return
+        self._stop_batch_ingest()
+        if watch:
+            self._batch_ingest = DatIngest(refine_dir, known=self._batch_dat_files, sort_key=natural_sort_key)
+            how = self._batch_ingest.start()
+            self._batch_watch_timer.start(POLL_INTERVAL_MS)
+            self.log_tabs.append_log("main", f"👀 持续监视新dat（{how}）: {refine_dir}")
         self._batch_refine_dir = refine_dir
         self._batch_pcr_file = pcr_file
         self._batch_paramlib_path = paramlib_path
@@ -810,11 +1061,22 @@ class RefinementGUI(QWidget):
         self._batch_pcrcheck_path = self.pcrcheck_path
         self._batch_mode = self.batch_mode_group.checkedId()  # 0: 固定模板, 1: 递推模板
         self._batch_last_pcr_path = None  # 新增：递推模式下记录上一个pcr
+        # 参数趋势矩阵：每个dat结束后追加一行并保存
+        try:
+            self._batch_trends = TrendMatrix()
+        except ImportError as e:
+            self._batch_trends = None
+            self.log_tabs.append_log("warn", f"⚠️ 不生成参数趋势文件: {e}")
         self._batch_run_next_dat()
     
     # 修改 _batch_run_next_dat 方法
     def _batch_run_next_dat(self):
         if self._batch_idx >= self._batch_total:
+            if self._batch_ingest is not None:
+                # 监视模式：等待新的dat写完后由 _batch_poll_ingest 继续
+                self._batch_waiting = True
+                self.log_tabs.set_overview_meta(f"已完成 {self._batch_total} 个dat，等待新的dat文件…")
+                return
             QMessageBox.information(self, "批量完成", "所有dat文件批量精修已完成！")
             return
         dat_file = self._batch_dat_files[self._batch_idx]
@@ -838,7 +1100,15 @@ class RefinementGUI(QWidget):
             "paramlib_path": self._batch_paramlib_path,
             "timeout": self._batch_timeout,
             "maxfiles": self._batch_maxfiles,
-            "temp_dir": subdir
+            "step_cache": self.cache_checkbox.isChecked(),
+            "cache_dir": self._cache_dir(),
+            "runaway_check": self.runaway_checkbox.isChecked(),
+            "coarse_steps": self.coarse_steps_spin.value(),
+            "coarse_factor": self.coarse_factor_spin.value(),
+            "preflight": self.preflight_checkbox.isChecked(),
+            "temp_dir": subdir,
+            "event_log": os.path.join(self._batch_refine_dir, EVENTS_FILE),
+            "accept_policy": self.accept_policy_spec()
         }
         run_indices = list(range(len(self._batch_steps)))
         self.worker = RefinementWorker(config, self._batch_steps, run_indices)
@@ -868,19 +1138,7 @@ class RefinementGUI(QWidget):
             status = entry["status"]
             if status not in ("运行中", "成功", "失败", "跳过"):
                 continue
-            name = entry["name"]
-            params = entry.get("params", [])
-            param_str = ", ".join(params) if params else ""
-            duration = entry["duration"]
-            reason = entry.get("reason", "")
-            line = f"步骤 {entry['index']}: {name}"
-            if param_str:
-                line += f" | 参数: {param_str}"
-            line += f" | 状态: {status} | 耗时: {duration}s"
-            if status == "失败" or status == "跳过":
-                line += f" | 原因: {reason}"
-            elif status == "成功":
-                line += " | 精修成功"
+            line = format_overview_line(entry)
             overview_lines.append(line)
             overview_lines.append("-" * 60)
         if elapsed is not None:
@@ -923,9 +1181,56 @@ class RefinementGUI(QWidget):
                     self._batch_last_pcr_path = None
             else:
                 self._batch_last_pcr_path = None
+        self._batch_update_trends(dat_file)
         self._batch_idx += 1
         self._batch_run_next_dat()
 
+    def _batch_poll_ingest(self):
+        if self._batch_ingest is None:
+            return
+        new_files = self._batch_ingest.poll()
+        if not new_files:
+            return
+        self._batch_dat_files.extend(new_files)
+        self._batch_total = len(self._batch_dat_files)
+        self.log_tabs.append_log("main", f"📥 新的dat加入队列: {', '.join(new_files)}（队列中共 {self._batch_total - self._batch_idx} 个）")
+        if self._batch_waiting:
+            self._batch_waiting = False
+            self._batch_run_next_dat()
+
+    def _stop_batch_ingest(self):
+        """结束监视；正在等待新dat时视为批量完成"""
+        self._batch_watch_timer.stop()
+        if self._batch_ingest is None:
+            return
+        self._batch_ingest.stop()
+        self._batch_ingest = None
+        self.log_tabs.append_log("main", "👀 已停止监视新dat")
+        if self._batch_waiting:
+            self._batch_waiting = False
+            QMessageBox.information(self, "批量完成", "所有dat文件批量精修已完成！")
+
+    def _batch_update_trends(self, dat_file):
+        """把当前dat的最终参数追加到趋势矩阵，并立即保存npz和csv（批量进行中也可随时查看）"""
+        if self._batch_trends is None or self.worker is None:
+            return
+        try:
+            params = dict(self.worker.refined_params)
+            for name, value in self.worker.final_pcr_values.items():
+                params.setdefault(name, value)
+            checker = self.worker._limit_checker
+            rule_params = getattr(checker, "params", None) or {}
+            phases = {name: p.get("phase") for name, p in rule_params.items() if p.get("phase") is not None}
+            self._batch_trends.add_row(
+                os.path.splitext(dat_file)[0], params,
+                chi2=self.worker._last_chi, r_factors=self.worker.final_r_factors, phases=phases
+            )
+            trends_path = os.path.join(self._batch_refine_dir, TRENDS_FILE)
+            self._batch_trends.save(trends_path)
+            self._batch_trends.export_csv(os.path.splitext(trends_path)[0] + ".csv")
+        except Exception as e:
+            self.log_tabs.append_log("err", f"无法更新参数趋势文件: {e}")
+
     def init_ui(self):
         main_layout = QVBoxLayout(self)
         
@@ -1013,6 +1318,44 @@ class RefinementGUI(QWidget):
         paramset_layout.addWidget(self.timeout_spin)
         paramset_layout.addWidget(QLabel("最大保留文件数："))
         paramset_layout.addWidget(self.maxfile_spin)
+        self.cache_checkbox = QCheckBox("启用步骤缓存")
+        self.cache_checkbox.setToolTip(f"相同的pcr、dat和fp2k.exe直接复用上次的FullProf输出（缓存目录: {self._cache_dir()}）")
+        paramset_layout.addWidget(self.cache_checkbox)
+        self.runaway_checkbox = QCheckBox("过程中检测参数失控")
+        self.runaway_checkbox.setToolTip("根据PCRcheck规则检查FullProf每个循环输出的参数值，超出范围立即终止该步骤")
+        self.runaway_checkbox.setChecked(True)
+        paramset_layout.addWidget(self.runaway_checkbox)
+        self.coarse_steps_spin = QSpinBox()
+        self.coarse_steps_spin.setRange(0, 999)
+        self.coarse_steps_spin.setToolTip("前N步在粗化数据上运行，之后切换到完整数据（0为不粗化，只支持X Y [Sigma]自由格式dat）")
+        self.coarse_factor_spin = QSpinBox()
+        self.coarse_factor_spin.setRange(2, 64)
+        self.coarse_factor_spin.setValue(4)
+        self.coarse_factor_spin.setToolTip("每多少个相邻数据点合并为一个")
+        paramset_layout.addWidget(QLabel("粗数据步骤数："))
+        paramset_layout.addWidget(self.coarse_steps_spin)
+        paramset_layout.addWidget(QLabel("粗化倍数："))
+        paramset_layout.addWidget(self.coarse_factor_spin)
+        self.preflight_checkbox = QCheckBox("精修前预检")
+        self.preflight_checkbox.setToolTip("启动FullProf前检查dat、pcr和参数库，确定跑不通时直接跳过该dat")
+        self.preflight_checkbox.setChecked(True)
+        paramset_layout.addWidget(self.preflight_checkbox)
+        self.accept_combo = QComboBox()
+        for text, key in ACCEPT_POLICY_CHOICES:
+            self.accept_combo.addItem(text, key)
+        self.accept_combo.setToolTip("正常结束的步骤与上一个被接受的步骤比较Chi²/R因子，不接受时回退到上一步的pcr")
+        self._accept_combo_last = 0
+        self.accept_tol_spin = QDoubleSpinBox()
+        self.accept_tol_spin.setRange(-100.0, 100.0)
+        self.accept_tol_spin.setDecimals(2)
+        self.accept_tol_spin.setSingleStep(0.1)
+        self.accept_tol_spin.setSuffix("%")
+        self.accept_tol_spin.setToolTip("Chi²至少改善的比例（0为不变差即可，负数为允许变差）")
+        paramset_layout.addWidget(QLabel("接受策略："))
+        paramset_layout.addWidget(self.accept_combo)
+        paramset_layout.addWidget(self.accept_tol_spin)
+        self.metrics_checkbox = QCheckBox("导出运行指标")
+        paramset_layout.addWidget(self.metrics_checkbox)
         param_group.setLayout(paramset_layout)
         main_layout.addWidget(param_group)
         # 日志与进度区
@@ -1039,6 +1382,9 @@ class RefinementGUI(QWidget):
         self.batch_btn = QPushButton("批量精修")
         self.export_log_btn = QPushButton("导出日志")
         self.export_report_btn = QPushButton("导出报告")
+        self.optimize_btn = QPushButton("优化步骤")
+        self.multistart_btn = QPushButton("多起点精修")
+        self.trends_btn = QPushButton("参数趋势图")
         btn_layout.addWidget(self.run_btn)
         btn_layout.addWidget(self.pause_btn)
         btn_layout.addWidget(self.resume_btn)
@@ -1047,6 +1393,9 @@ class RefinementGUI(QWidget):
         btn_layout.addWidget(self.batch_btn)
         btn_layout.addWidget(self.export_log_btn)
         btn_layout.addWidget(self.export_report_btn)
+        btn_layout.addWidget(self.optimize_btn)
+        btn_layout.addWidget(self.multistart_btn)
+        btn_layout.addWidget(self.trends_btn)
 
         # 新增：批量精修模式选择
         self.batch_mode_group = QButtonGroup(self)
@@ -1057,6 +1406,9 @@ class RefinementGUI(QWidget):
         self.batch_mode_group.addButton(self.batch_mode_radio2, 1)
         btn_layout.addWidget(self.batch_mode_radio1)
         btn_layout.addWidget(self.batch_mode_radio2)
+        self.watch_checkbox = QCheckBox("持续监视新dat")
+        self.watch_checkbox.setToolTip("批量精修完已有dat后继续等待目录中新写入的dat并依次精修，点击“终止”结束")
+        btn_layout.addWidget(self.watch_checkbox)
         main_layout.addLayout(btn_layout)
         # 事件绑定
         self.run_btn.clicked.connect(self.start_refinement)
@@ -1067,9 +1419,38 @@ class RefinementGUI(QWidget):
         self.skip_btn.clicked.connect(self.skip_current_step)  # 新增绑定
         self.export_log_btn.clicked.connect(self.export_log)
         self.export_report_btn.clicked.connect(self.export_report)
+        self.optimize_btn.clicked.connect(self.optimize_steps)
+        self.multistart_btn.clicked.connect(self.start_multi_start)
+        self.trends_btn.clicked.connect(self.plot_param_trends)
+        self.accept_combo.activated.connect(self.on_accept_policy_activated)
+
+    def on_accept_policy_activated(self, index):
+        custom = len(ACCEPT_POLICY_CHOICES) - 1
+        if index != custom:
+            self._accept_combo_last = index
+            return
+        fname, _ = QFileDialog.getOpenFileName(self, "选择接受策略文件", "", "接受策略 (*.json *.py)")
+        if fname:
+            self._set_custom_accept_policy(fname)
+            self._accept_combo_last = index
+        else:
+            self.accept_combo.setCurrentIndex(self._accept_combo_last)
+
+    def _set_custom_accept_policy(self, path):
+        custom = len(ACCEPT_POLICY_CHOICES) - 1
+        self.accept_combo.setItemData(custom, path)
+        self.accept_combo.setItemText(custom, f"自定义: {os.path.basename(path)}")
+        self.accept_combo.setCurrentIndex(custom)
+
+    def accept_policy_spec(self):
+        """传给RefinementWorker的 accept_policy：自定义文件为路径，内置策略为dict"""
+        key = self.accept_combo.currentData()
+        if self.accept_combo.currentIndex() == len(ACCEPT_POLICY_CHOICES) - 1:
+            return key
+        return {"type": key or "permissive", "tolerance": self.accept_tol_spin.value() / 100.0}
 
     def select_pcrcheck(self):
-        fname, _ = QFileDialog.getOpenFileName(self, "选择PCR_check_gui_export.py", "", "Python Files (*.py)")
+        fname, _ = QFileDialog.getOpenFileName(self, "选择限值规则文件", "", "限值规则 (*.json *.py);;JSON Files (*.json);;Python Files (*.py)")
         if fname:
             self.pcrcheck_edit.setText(fname)
             self.pcrcheck_path = fname
@@ -1093,13 +1474,55 @@ class RefinementGUI(QWidget):
                 QMessageBox.No
             )
             if reply == QMessageBox.Yes:
+                self._batch_waiting = False
+                self._stop_batch_ingest()
                 self.worker.stop()
+                self._set_metrics_export(False)
                 event.accept()
             else:
                 event.ignore()
         else:
+            self._batch_waiting = False
+            self._stop_batch_ingest()
+            self._set_metrics_export(False)
             event.accept()
 
+    def _cache_dir(self):
+        """步骤缓存目录：配置文件中的 cache_dir，否则为每个用户固定的默认位置"""
+        return os.path.abspath(self.config.get("cache_dir") or default_cache_dir())
+
+    def _metrics_path(self):
+        """指标文件：配置文件中的 metrics_file，否则为精修目录下的 magia_metrics.prom"""
+        if self.config.get("metrics_file"):
+            return os.path.abspath(self.config["metrics_file"])
+        refine_dir = self.dir_edit.text()
+        return os.path.abspath(os.path.join(refine_dir if os.path.isdir(refine_dir) else "", METRICS_FILE))
+
+    def _update_metrics_path(self, *_):
+        """精修目录变化时更新提示，正在导出时改写到新路径"""
+        path = self._metrics_path()
+        self.metrics_checkbox.setToolTip(f"每{EXPORT_INTERVAL}秒把步骤计数、FullProf耗时等指标以Prometheus文本格式写入 {path}")
+        if self._metrics_exporter is not None and self._metrics_exporter.path != path:
+            self._set_metrics_export(False)
+            self._set_metrics_export(True)
+
+    def _set_metrics_export(self, enabled):
+        if enabled and self._metrics_exporter is None:
+            self._metrics_exporter = MetricsExporter(self._metrics_path()).start()
+            self.log_tabs.append_log("main", f"📈 运行指标写入: {self._metrics_exporter.path}")
+        elif not enabled and self._metrics_exporter is not None:
+            self._metrics_exporter.stop()
+            self._metrics_exporter = None
+
+    def _collect_metrics(self):
+        # 在指标导出线程中调用，只读取状态
+        running = self.worker is not None and self.worker.isRunning()
+        queued = max(getattr(self, "_batch_total", 0) - getattr(self, "_batch_idx", 0) - (1 if running else 0), 0)
+        if self._batch_ingest is not None:
+            queued += self._batch_ingest.pending_count()
+        metrics.queue_depth.set(queued, source="gui")
+        metrics.active_jobs.set(1 if running else 0, source="gui")
+
     # def on_fp2k_found(self, candidates):
     #     self.fp2k_candidates = candidates
     #     if candidates:
@@ -1181,6 +1604,21 @@ class RefinementGUI(QWidget):
             self.timeout_spin.setValue(cfg["timeout"])
         if cfg.get("maxfiles"):
             self.maxfile_spin.setValue(cfg["maxfiles"])
+        self.cache_checkbox.setChecked(bool(cfg.get("step_cache", False)))
+        self.runaway_checkbox.setChecked(bool(cfg.get("runaway_check", True)))
+        self.coarse_steps_spin.setValue(int(cfg.get("coarse_steps", 0)))
+        self.coarse_factor_spin.setValue(int(cfg.get("coarse_factor", 4)))
+        self.preflight_checkbox.setChecked(bool(cfg.get("preflight", True)))
+        self.watch_checkbox.setChecked(bool(cfg.get("watch_new_dat", False)))
+        self.metrics_checkbox.setChecked(bool(cfg.get("export_metrics", False)))
+        policy = cfg.get("accept_policy") or "permissive"
+        idx = self.accept_combo.findData(policy)
+        if idx >= 0 and idx != len(ACCEPT_POLICY_CHOICES) - 1:
+            self.accept_combo.setCurrentIndex(idx)
+        elif os.path.isfile(policy):
+            self._set_custom_accept_policy(policy)
+        self._accept_combo_last = self.accept_combo.currentIndex()
+        self.accept_tol_spin.setValue(float(cfg.get("accept_tolerance", 0.0)))
 
     def save_current_settings(self):
         cfg = {
@@ -1191,7 +1629,18 @@ class RefinementGUI(QWidget):
             "paramlib_path": self.param_edit.text(),
             "stepcfg_path": self.step_edit.text(),
             "timeout": self.timeout_spin.value(),
-            "maxfiles": self.maxfile_spin.value()
+            "maxfiles": self.maxfile_spin.value(),
+            "step_cache": self.cache_checkbox.isChecked(),
+            "runaway_check": self.runaway_checkbox.isChecked(),
+            "coarse_steps": self.coarse_steps_spin.value(),
+            "coarse_factor": self.coarse_factor_spin.value(),
+            "preflight": self.preflight_checkbox.isChecked(),
+            "watch_new_dat": self.watch_checkbox.isChecked(),
+            "export_metrics": self.metrics_checkbox.isChecked(),
+            "accept_policy": self.accept_combo.currentData(),
+            "accept_tolerance": self.accept_tol_spin.value(),
+            "metrics_file": self.config.get("metrics_file", ""),
+            "cache_dir": self.config.get("cache_dir", "")
         }
         save_config(cfg)
 
@@ -1242,7 +1691,15 @@ class RefinementGUI(QWidget):
             "data_path": os.path.join(refine_dir, dat_file),
             "paramlib_path": paramlib_path,
             "timeout": timeout,
-            "maxfiles": maxfiles
+            "maxfiles": maxfiles,
+            "step_cache": self.cache_checkbox.isChecked(),
+            "cache_dir": self._cache_dir(),
+            "runaway_check": self.runaway_checkbox.isChecked(),
+            "coarse_steps": self.coarse_steps_spin.value(),
+            "coarse_factor": self.coarse_factor_spin.value(),
+            "preflight": self.preflight_checkbox.isChecked(),
+            "event_log": os.path.join(refine_dir, EVENTS_FILE),
+            "accept_policy": self.accept_policy_spec()
         }
         run_indices = list(range(len(self.steps)))
         self.worker = RefinementWorker(config, self.steps, run_indices)
@@ -1261,8 +1718,11 @@ class RefinementGUI(QWidget):
             self.worker.resume()
 
     def stop_refinement(self):
+        self._stop_batch_ingest()
         if self.worker:
             self.worker.stop()
+        if getattr(self, "multi_start_runner", None) is not None and self.multi_start_runner.isRunning():
+            self.multi_start_runner.stop()
 
     def export_log(self):
         fname, _ = QFileDialog.getSaveFileName(self, "保存日志", "refine_log.txt", "Text Files (*.txt)")
@@ -1282,6 +1742,132 @@ class RefinementGUI(QWidget):
                         f.write(line + "\n")
             QMessageBox.information(self, "保存成功", f"报告已保存到：{fname}")
 
+    def optimize_steps(self):
+        stepcfg_path = self.step_edit.text()
+        if not os.path.isfile(stepcfg_path):
+            QMessageBox.warning(self, "错误", "请先选择步骤配置JSON")
+            return
+        history_dir = QFileDialog.getExistingDirectory(self, "选择历史批量精修目录（包含AAA_step_overview.txt）", self.dir_edit.text())
+        if not history_dir:
+            return
+        try:
+            new_steps, report, _ = optimize_step_file(stepcfg_path, history_dir)
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"步骤优化失败: {e}")
+            return
+        if report["runs"] == 0:
+            QMessageBox.warning(self, "提示", "所选目录下没有找到AAA_step_overview.txt")
+            return
+        text = format_report(report)
+        self.log_tabs.append_log("main", f"📊 步骤优化分析:\n{text}")
+        if not report["removed"] and not report["deferred"]:
+            QMessageBox.information(self, "步骤优化", text)
+            return
+        reply = QMessageBox.question(self, "步骤优化", text + "\n\n是否应用并保存为 *_optimized.json？",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        try:
+            new_steps, _, out_path = optimize_step_file(stepcfg_path, history_dir, apply=True)
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"保存优化后的步骤失败: {e}")
+            return
+        self.steps = new_steps
+        self.step_edit.setText(out_path)
+        self.save_current_settings()
+        self.log_tabs.append_log("main", f"✅ 优化后的步骤已保存到: {out_path}")
+
+    def start_multi_start(self):
+        fp2k_path = self.fp2k_edit.text()
+        refine_dir = self.dir_edit.text()
+        pcr_file = self.pcr_combo.currentText()
+        dat_file = self.dat_combo.currentText()
+        paramlib_path = self.param_edit.text()
+        stepcfg_path = self.step_edit.text()
+        if not (os.path.isfile(fp2k_path) and fp2k_path.lower().endswith("fp2k.exe")):
+            QMessageBox.warning(self, "错误", "请正确指定fp2k.exe路径")
+            return
+        if not (os.path.isdir(refine_dir) and pcr_file and dat_file):
+            QMessageBox.warning(self, "错误", "请正确指定精修文件目录和pcr/dat文件")
+            return
+        if not (os.path.isfile(paramlib_path) and os.path.isfile(stepcfg_path)):
+            QMessageBox.warning(self, "错误", "请正确指定参数库和步骤配置文件")
+            return
+        if getattr(self, "multi_start_runner", None) is not None and self.multi_start_runner.isRunning():
+            QMessageBox.warning(self, "提示", "多起点精修正在进行")
+            return
+        spec_path, _ = QFileDialog.getOpenFileName(self, "选择起点配置", refine_dir, "JSON Files (*.json)")
+        if not spec_path:
+            return
+        try:
+            spec = load_start_spec(spec_path)
+            with open(stepcfg_path, "r", encoding="utf-8") as f:
+                self.steps = json.load(f).get("steps", [])
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"起点配置或步骤配置读取失败: {e}")
+            return
+        # 未写line/position的参数从PCRcheck规则文件中查找位置
+        rule_params = {}
+        if self.pcrcheck_path and self.pcrcheck_path.lower().endswith(".json"):
+            try:
+                rule_params = load_rules(self.pcrcheck_path).get("params", {})
+            except Exception as e:
+                self.log_tabs.append_log("warn", f"⚠️ 无法读取PCRcheck规则中的参数位置: {e}")
+        max_parallel, ok = QInputDialog.getInt(self, "多起点精修", "最多同时运行的起点数：", 4, 1, 64)
+        if not ok:
+            return
+        self.save_current_settings()
+        out_dir = os.path.join(refine_dir, f"{os.path.splitext(dat_file)[0]}_multistart")
+        config = {
+            "pcrcheck_path": self.pcrcheck_path,
+            "fullprof_path": fp2k_path,
+            "pcr_path": os.path.join(refine_dir, pcr_file),
+            "data_path": os.path.join(refine_dir, dat_file),
+            "paramlib_path": paramlib_path,
+            "timeout": self.timeout_spin.value(),
+            "maxfiles": self.maxfile_spin.value(),
+            "step_cache": self.cache_checkbox.isChecked(),
+            "cache_dir": self._cache_dir(),
+            "runaway_check": self.runaway_checkbox.isChecked(),
+            "coarse_steps": self.coarse_steps_spin.value(),
+            "coarse_factor": self.coarse_factor_spin.value(),
+            "preflight": self.preflight_checkbox.isChecked(),
+            "event_log": os.path.join(refine_dir, EVENTS_FILE),
+            "accept_policy": self.accept_policy_spec()
+        }
+        self.log_tabs.set_overview_meta(f"多起点精修 {dat_file}，起点配置 {os.path.abspath(spec_path)}，结果目录 {os.path.abspath(out_dir)}")
+        self.multi_start_runner = MultiStartRunner(RefinementWorker, config, self.steps, spec, rule_params, out_dir, max_parallel)
+        self.multi_start_runner.log_signal.connect(self.log_tabs.append_log)
+        self.multi_start_runner.finished_signal.connect(self.on_multi_start_finished)
+        self.multi_start_runner.start()
+
+    def on_multi_start_finished(self, report):
+        self.log_tabs.append_log("main", f"🏁 多起点精修排名:\n{report}")
+        lines = report.splitlines()
+        preview = "\n".join(lines[:12]) + ("\n..." if len(lines) > 12 else "")
+        QMessageBox.information(self, "多起点精修完成", preview)
+
+    def plot_param_trends(self):
+        default = os.path.join(self.dir_edit.text(), TRENDS_FILE)
+        trends_path, _ = QFileDialog.getOpenFileName(self, "选择参数趋势文件", default, "参数趋势 (*.npz)")
+        if not trends_path:
+            return
+        patterns, ok = QInputDialog.getText(self, "参数趋势图", "参数名（可用通配符，空格分隔，留空为全部）：")
+        if not ok:
+            return
+        png_path = os.path.splitext(trends_path)[0] + ".png"
+        try:
+            trends = TrendMatrix.load(trends_path)
+            trends.plot(png_path, patterns.split())
+        except ImportError as e:
+            QMessageBox.warning(self, "错误", f"作图需要numpy和matplotlib: {e}")
+            return
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"参数趋势作图失败: {e}")
+            return
+        self.log_tabs.append_log("main", f"📈 参数趋势图已保存到: {png_path}（{trends.n_rows} 个dat）")
+        QMessageBox.information(self, "参数趋势图", f"已保存到：{png_path}")
+
     def on_finished(self, msg):
         self.progress.setValue(100)
         QMessageBox.information(self, "完成", msg)
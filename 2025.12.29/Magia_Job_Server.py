@@ -0,0 +1,464 @@
+'''2026.01
+本地精修任务服务：一台工作站上只运行一个调度器，多个用户/脚本通过 JSON-over-HTTP 提交精修任务，
+共用同一个并行数上限，不再各开一个GUI互相争抢磁盘。默认只监听 127.0.0.1。
+启动（fp2k路径由服务端指定，任务中不能指定要运行的程序）：
+python Magia_Job_Server.py serve --fullprof C:/FullProf_Suite/fp2k.exe --port 8765 --max-jobs 4
+接口：
+POST /jobs                      提交任务，返回 {"id": ...}
+     {"pcr_path", "data_path", "paramlib_path", "stepcfg_path"（或直接给 "steps"）,
+      可选 "pcrcheck_path"（只接受 .json 声明式规则）, "temp_dir"（默认为dat同目录下的 <dat名>_<任务id> 子目录；
+      不能与未结束的任务相同，已存在的非空目录不会被清空而是拒绝）, "timeout", "maxfiles",
+      "step_cache", "runaway_check", "coarse_steps", "coarse_factor", "preflight", "event_log"（结构化事件日志路径，见Magia_Event_Log.py）,
+      "accept_policy"（步骤接受策略：内置名称、dict 或 .json，不接受 .py，见Magia_Accept_Policy.py）, "priority"（越大越先运行）, "user"}
+      任务中的 "fullprof_path" 会被忽略
+多个用户共用服务时，任何能访问端口的本机用户都以服务进程的身份运行精修，因此任务中不能指定可执行文件或Python代码。
+GET  /jobs                      全部任务（不含步骤详情）
+GET  /jobs/<id>                 单个任务，含步骤概览和最近的警告/错误/Chi²日志
+GET  /queue                     排队顺序、运行中的任务、并行数上限
+POST /jobs/<id>/cancel          取消（排队中直接移除，运行中终止FullProf）
+POST /jobs/<id>/priority        {"priority": n} 调整排队优先级
+GET  /events?since=<序号>       事件流（text/event-stream），每条为一个JSON：任务状态变化、步骤状态变化、Chi²
+GET  /metrics                   运行指标（Prometheus文本格式，见Magia_Metrics.py）；serve --metrics-file 时另外定时写入文件
+命令行客户端：
+python Magia_Job_Server.py submit job.json [--url http://127.0.0.1:8765]
+python Magia_Job_Server.py list | status <id> | cancel <id> | priority <id> <n>
+精修本身由 Magia_FP_Refinement_v1.3.py 中的 RefinementWorker 完成（与多起点精修相同，在线程中直接调用run）。
+'''
+import os
+import sys
+import json
+import time
+import heapq
+import argparse
+import threading
+import importlib.util
+import urllib.error
+import urllib.request
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from Magia_Metrics import metrics, MetricsExporter
+from Magia_Accept_Policy import resolve_spec
+
+ENGINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Magia_FP_Refinement_v1.3.py")
+DEFAULT_PORT = 8765
+MAX_EVENTS = 2000        # 事件缓冲，/events?since= 可回放
+MAX_JOB_LOGS = 200
+JOB_DEFAULTS = {
+    "pcrcheck_path": None,
+    "timeout": 3600,
+    "maxfiles": 999000,
+    "step_cache": False,
+    "runaway_check": True,
+    "coarse_steps": 0,
+    "coarse_factor": 4,
+    "preflight": True,
+    "event_log": None,
+    "accept_policy": None,
+}
+REQUIRED_FIELDS = ("pcr_path", "data_path", "paramlib_path")
+
+
+def load_engine(path=ENGINE_FILE):
+    """文件名中有版本号，不能直接import，按路径加载"""
+    spec = importlib.util.spec_from_file_location("magia_refinement_engine", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Job:
+    def __init__(self, job_id, spec, seq):
+        self.id = job_id
+        self.spec = spec
+        self.seq = seq
+        self.priority = int(spec.get("priority", 0))
+        self.user = spec.get("user", "")
+        self.status = "排队"   # 排队 / 运行中 / 完成 / 失败 / 已取消
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.message = ""
+        self.overview = []
+        self.logs = deque(maxlen=MAX_JOB_LOGS)
+        self.worker = None
+        self.cancelled = False
+
+    def brief(self):
+        return {
+            "id": self.id,
+            "user": self.user,
+            "status": self.status,
+            "priority": self.priority,
+            "dat": os.path.basename(self.spec["data_path"]),
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "steps_done": sum(1 for e in self.overview if e.get("status") in ("成功", "失败", "跳过")),
+            "steps_total": len(self.overview),
+            "message": self.message,
+        }
+
+    def detail(self):
+        d = self.brief()
+        d["spec"] = self.spec
+        d["overview"] = self.overview
+        d["logs"] = list(self.logs)
+        return d
+
+
+class JobScheduler:
+    def __init__(self, worker_class, max_jobs, fullprof_path):
+        self.worker_class = worker_class
+        self.fullprof_path = fullprof_path
+        self.max_jobs = max(1, int(max_jobs))
+        self.cond = threading.Condition()
+        self.jobs = {}
+        self._heap = []          # (-priority, seq, id)
+        self._running = set()
+        self._seq = 0
+        self.events = deque(maxlen=MAX_EVENTS)
+        self._event_seq = 0
+        self._closed = False
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._dispatcher.start()
+
+    # ---- 事件 ----
+    def _event(self, kind, job, **data):
+        with self.cond:
+            self._event_seq += 1
+            self.events.append(dict(seq=self._event_seq, time=time.time(), type=kind, job=job.id, **data))
+            self.cond.notify_all()
+
+    def events_since(self, seq, timeout=15):
+        """返回序号大于seq的事件；没有时最多等待timeout秒"""
+        with self.cond:
+            if not self.events or self.events[-1]["seq"] <= seq:
+                self.cond.wait(timeout)
+            return [e for e in self.events if e["seq"] > seq]
+
+    # ---- 提交/取消/优先级 ----
+    def submit(self, spec):
+        spec.pop("fullprof_path", None)  # 只使用服务端的 --fullprof
+        missing = [k for k in REQUIRED_FIELDS if not spec.get(k)]
+        if missing:
+            raise ValueError(f"缺少字段: {', '.join(missing)}")
+        if not spec.get("steps"):
+            if not spec.get("stepcfg_path"):
+                raise ValueError("需要 stepcfg_path 或 steps")
+            with open(spec["stepcfg_path"], "r", encoding="utf-8") as f:
+                spec["steps"] = json.load(f).get("steps", [])
+        for k in REQUIRED_FIELDS:
+            if not os.path.isfile(spec[k]):
+                raise ValueError(f"{k} 文件不存在: {spec[k]}")
+        if spec.get("pcrcheck_path") and not spec["pcrcheck_path"].lower().endswith(".json"):
+            raise ValueError("pcrcheck_path 只接受 .json 声明式规则（.py 导出文件会被执行）")
+        # .json 在提交时展开为dict，运行前文件被改写也不会引入 .py 策略
+        spec["accept_policy"] = resolve_spec(spec.get("accept_policy"))
+        with self.cond:
+            # 精修开始时会清空临时目录，同一目录不能同时给两个任务使用
+            if spec.get("temp_dir"):
+                temp_dir = os.path.abspath(spec["temp_dir"])
+                for other in self.jobs.values():
+                    if other.status in ("排队", "运行中") and other.spec.get("temp_dir") == temp_dir:
+                        raise ValueError(f"temp_dir 正被任务 {other.id} 使用: {temp_dir}")
+                if os.path.isdir(temp_dir) and os.listdir(temp_dir):
+                    raise ValueError(f"temp_dir 已存在且不为空（精修开始时会清空该目录）: {temp_dir}")
+                spec["temp_dir"] = temp_dir
+            self._seq += 1
+            job_id = f"job-{self._seq:05d}"
+            if not spec.get("temp_dir"):
+                spec["temp_dir"] = os.path.join(
+                    os.path.dirname(os.path.abspath(spec["data_path"])),
+                    f"{os.path.splitext(os.path.basename(spec['data_path']))[0]}_{job_id}"
+                )
+            job = Job(job_id, spec, self._seq)
+            self.jobs[job.id] = job
+            heapq.heappush(self._heap, (-job.priority, job.seq, job.id))
+            self.cond.notify_all()
+        self._event("status", job, status=job.status)
+        return job
+
+    def cancel(self, job_id):
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status == "排队":
+                job.status = "已取消"
+                job.finished = time.time()
+                self._heap = [h for h in self._heap if h[2] != job_id]
+                heapq.heapify(self._heap)
+            elif job.status == "运行中":
+                job.cancelled = True
+                if job.worker is not None:
+                    job.worker.stop()
+                    job.worker.skip_current_step()
+        self._event("status", job, status=job.status if not job.cancelled else "取消中")
+        return job
+
+    def set_priority(self, job_id, priority):
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job.priority = int(priority)
+            if job.status == "排队":
+                self._heap = [h if h[2] != job_id else (-job.priority, job.seq, job_id) for h in self._heap]
+                heapq.heapify(self._heap)
+        self._event("priority", job, priority=job.priority)
+        return job
+
+    def queue_state(self):
+        with self.cond:
+            order = [h[2] for h in sorted(self._heap)]
+            return {"queued": order, "running": sorted(self._running), "max_jobs": self.max_jobs}
+
+    def collect_metrics(self):
+        with self.cond:
+            queued, running = len(self._heap), len(self._running)
+        metrics.queue_depth.set(queued, source="server")
+        metrics.active_jobs.set(running, source="server")
+
+    # ---- 调度 ----
+    def _dispatch_loop(self):
+        while True:
+            with self.cond:
+                while not self._closed and (not self._heap or len(self._running) >= self.max_jobs):
+                    self.cond.wait()
+                if self._closed:
+                    return
+                _, _, job_id = heapq.heappop(self._heap)
+                job = self.jobs[job_id]
+                job.status = "运行中"
+                job.started = time.time()
+                self._running.add(job_id)
+            self._event("status", job, status=job.status)
+            threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+
+    def _run_job(self, job):
+        from PyQt5.QtCore import Qt
+        spec = job.spec
+        config = dict(JOB_DEFAULTS)
+        config.update({k: spec[k] for k in list(JOB_DEFAULTS) + list(REQUIRED_FIELDS) if k in spec})
+        config["fullprof_path"] = self.fullprof_path
+        config["temp_dir"] = spec["temp_dir"]  # submit时已确定（默认每个任务单独一个目录）
+        config["job_id"] = job.id
+        steps = spec["steps"]
+        try:
+            worker = self.worker_class(config, steps, list(range(len(steps))))
+            job.worker = worker
+            last_status = {}
+
+            def on_log(kind, msg):
+                if kind == "main":
+                    return  # FullProf输出太多，只保留警告/错误/Chi²
+                job.logs.append({"time": time.time(), "type": kind, "msg": msg})
+                if kind == "chi":
+                    self._event("chi", job, msg=msg)
+
+            def on_overview(entries):
+                job.overview = [dict(e) for e in entries]
+                for e in job.overview:
+                    if last_status.get(e["index"]) != e["status"]:
+                        last_status[e["index"]] = e["status"]
+                        self._event("step", job, index=e["index"], name=e["name"], status=e["status"],
+                                    reason=e.get("reason", ""), chi2=e.get("chi2"))
+
+            worker.log_signal.connect(on_log, Qt.DirectConnection)
+            worker.step_overview_signal.connect(on_overview, Qt.DirectConnection)
+            worker.finished_signal.connect(lambda msg: setattr(job, "message", msg), Qt.DirectConnection)
+            if job.cancelled:
+                worker.stop()  # 在worker创建之前就收到了取消请求
+            worker.run()
+            if job.cancelled:
+                job.status = "已取消"
+            elif any(e.get("status") == "成功" for e in job.overview):
+                job.status = "完成"
+            else:
+                job.status = "失败"
+        except Exception as e:
+            job.status = "失败"
+            job.message = f"运行失败: {e}"
+        finally:
+            job.worker = None
+            job.finished = time.time()
+            with self.cond:
+                self._running.discard(job.id)
+                self.cond.notify_all()
+            self._event("status", job, status=job.status, message=job.message)
+
+    def shutdown(self):
+        with self.cond:
+            self._closed = True
+            running = [self.jobs[j] for j in self._running]
+            self.cond.notify_all()
+        for job in running:
+            if job.worker is not None:
+                job.worker.stop()
+                job.worker.skip_current_step()
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    server_version = "MagiaJobServer/1.0"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, code, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode("utf-8"))
+
+    def do_GET(self):
+        sched = self.server.scheduler
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["jobs"]:
+            with sched.cond:
+                jobs = list(sched.jobs.values())
+            return self._send(200, [j.brief() for j in jobs])
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = sched.jobs.get(parts[1])
+            return self._send(200, job.detail()) if job else self._send(404, {"error": "任务不存在"})
+        if parts == ["queue"]:
+            return self._send(200, sched.queue_state())
+        if parts == ["events"]:
+            return self._stream_events(int(parse_qs(url.query).get("since", ["0"])[0]))
+        if parts == ["metrics"]:
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._send(404, {"error": "未知接口"})
+
+    def do_POST(self):
+        sched = self.server.scheduler
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        try:
+            body = self._body()
+        except Exception as e:
+            return self._send(400, {"error": f"请求不是有效的JSON: {e}"})
+        if parts == ["jobs"]:
+            try:
+                job = sched.submit(body)
+            except Exception as e:
+                return self._send(400, {"error": str(e)})
+            return self._send(201, {"id": job.id})
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            job = sched.cancel(parts[1])
+            return self._send(200, job.brief()) if job else self._send(404, {"error": "任务不存在"})
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "priority":
+            if "priority" not in body:
+                return self._send(400, {"error": "缺少 priority"})
+            try:
+                job = sched.set_priority(parts[1], body["priority"])
+            except (TypeError, ValueError) as e:
+                return self._send(400, {"error": f"priority 必须是整数: {e}"})
+            return self._send(200, job.brief()) if job else self._send(404, {"error": "任务不存在"})
+        self._send(404, {"error": "未知接口"})
+
+    def _stream_events(self, since):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        sched = self.server.scheduler
+        try:
+            while True:
+                events = sched.events_since(since)
+                if not events:
+                    self.wfile.write(b": keep-alive\n\n")  # 客户端断开时在这里报错退出
+                for e in events:
+                    self.wfile.write(f"id: {e['seq']}\ndata: {json.dumps(e, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    since = e["seq"]
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def serve(host, port, max_jobs, fullprof_path, metrics_file=None):
+    from PyQt5.QtCore import QCoreApplication
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)  # noqa: F841 信号需要Qt应用对象，不需要事件循环
+    engine = load_engine()
+    scheduler = JobScheduler(engine.RefinementWorker, max_jobs, fullprof_path)
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.daemon_threads = True
+    server.scheduler = scheduler
+    metrics.add_collector(scheduler.collect_metrics)
+    exporter = MetricsExporter(metrics_file).start() if metrics_file else None
+    print(f"精修任务服务已启动: http://{host}:{port}  并行数上限 {scheduler.max_jobs}  fp2k: {fullprof_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.shutdown()
+        server.server_close()
+        if exporter is not None:
+            exporter.stop()
+
+
+def _request(url, method="GET", data=None):
+    body = None if data is None else json.dumps(data, ensure_ascii=False).encode("utf-8")
+    req = urllib.request.Request(url, data=body, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read().decode("utf-8"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Magia 本地精修任务服务")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("serve")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--max-jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    p.add_argument("--fullprof", required=True, help="fp2k可执行文件路径（所有任务共用）")
+    p.add_argument("--metrics-file", help="定时写入Prometheus文本格式指标的文件（如 magia_metrics.prom）")
+    p = sub.add_parser("submit")
+    p.add_argument("job_file")
+    sub.add_parser("list")
+    for name in ("status", "cancel"):
+        sub.add_parser(name).add_argument("id")
+    p = sub.add_parser("priority")
+    p.add_argument("id")
+    p.add_argument("priority", type=int)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "serve":
+        if not os.path.isfile(args.fullprof):
+            parser.error(f"fp2k不存在: {args.fullprof}")
+        serve(args.host, args.port, args.max_jobs, os.path.abspath(args.fullprof), args.metrics_file)
+        return
+    if args.cmd == "submit":
+        with open(args.job_file, "r", encoding="utf-8") as f:
+            result = _request(f"{args.url}/jobs", "POST", json.load(f))
+    elif args.cmd == "list":
+        result = _request(f"{args.url}/jobs")
+    elif args.cmd == "status":
+        result = _request(f"{args.url}/jobs/{args.id}")
+    elif args.cmd == "cancel":
+        result = _request(f"{args.url}/jobs/{args.id}/cancel", "POST", {})
+    else:
+        result = _request(f"{args.url}/jobs/{args.id}/priority", "POST", {"priority": args.priority})
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
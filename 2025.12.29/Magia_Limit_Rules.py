@@ -0,0 +1,441 @@
+'''2026.01
+声明式参数限值规则（替代 Magia_PCR_check.py 导出的 PCR_check_gui_export.py）
+规则文件为JSON，不再生成和执行Python代码：
+{
+  "format": "magia_limit_rules", "version": 1,
+  "params": {"li1_biso_1": {"line": 39, "position": 4, "phase": 1}, ...},   # 参数名 -> pcr中的位置（与原PARAM_LIMITS相同的定位方式）
+  "rules": [
+    {"type": "range", "param": "li1_biso_1", "min": 0, "max": 3},             # 上下限，param可用通配符，如 *_biso
+    {"type": "sum", "params": ["li1_occ", "ni1_occ"], "min": 0.99, "max": 1.01, "phase": 1},   # 同一位置占位率之和
+    {"type": "order", "params": ["o1_biso", "li1_biso"], "phase": "*"}         # 前者 <= 后者（如B值大小关系）
+  ]
+}
+规则带 "phase"（整数、列表或 "*"）时，参数名自动追加 _<phase> 后缀，"*" 表示对每个phase分别检查；
+不带 "phase" 的通配符范围规则（如 *_biso）按去掉 _<phase> 后缀的参数名匹配，对所有phase生效。
+编译后所有规则在一次读取pcr后统一计算（有numpy时向量化），可在每个dat的每一步之后检查。
+
+也可用文本写关系约束（Magia_PCR_check 中的“关系约束”文本框），每行一条，# 开头为注释：
+    sum(li1_occ, ni1_occ) in [0.99, 1.01] @ phase 1
+    o1_biso <= li1_biso @ phase *
+    *_biso in [0, 3] @ phase 2
+    zero in [-0.1, 0.1]
+
+RunawayDetector 在精修过程中解析FullProf每个循环输出的参数新值（符号名如 Occ_Li1_ph1、Scale_ph1_pat1，
+映射为规则中的参数名），参数超出允许范围时即可终止FullProf，不必等整步结束后再由pcr检查判定失败。
+单个参数的范围规则逐行检查；sum/order规则涉及多个参数，等一个循环的参数表全部读完后再检查，
+避免用本循环的新值和其他参数的上一循环旧值比较（如占位率之和约束下Li、Ni同时变化）。
+'''
+import os
+import re
+import json
+import fnmatch
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RULES_FORMAT = "magia_limit_rules"
+ORDER_TOLERANCE = 1e-9
+
+_PHASE_SUFFIX = r'(?:\s*@\s*phase\s+(?P<phase>\*|[\d,\s]+))?\s*$'
+_RANGE_LINE = re.compile(r'^(?P<expr>.+?)\s+in\s+\[\s*(?P<min>[-+\d.eE]+)\s*,\s*(?P<max>[-+\d.eE]+)\s*\]' + _PHASE_SUFFIX)
+_ORDER_LINE = re.compile(r'^(?P<a>[^\s<>=]+)\s*(?P<op><=|>=|<|>)\s*(?P<b>[^\s<>=@]+)' + _PHASE_SUFFIX)
+_SUM_EXPR = re.compile(r'^sum\((?P<args>[^)]*)\)$', re.IGNORECASE)
+
+
+class LimitRuleError(ValueError):
+    pass
+
+
+def _parse_phase(text):
+    if text is None:
+        return None
+    text = text.strip()
+    if text == "*":
+        return "*"
+    phases = [int(p) for p in re.split(r'[,\s]+', text) if p]
+    return phases[0] if len(phases) == 1 else phases
+
+
+def parse_rule_text(text):
+    """关系约束文本 -> 规则列表"""
+    rules = []
+    for lineno, raw in enumerate(text.splitlines(), 1):
+        line = raw.split("#", 1)[0].strip()
+        if not line:
+            continue
+        m = _RANGE_LINE.match(line)
+        if m:
+            rule = {"min": float(m.group("min")), "max": float(m.group("max"))}
+            sm = _SUM_EXPR.match(m.group("expr").strip())
+            if sm:
+                rule["type"] = "sum"
+                rule["params"] = [a.strip().lower() for a in sm.group("args").split(",") if a.strip()]
+            else:
+                rule["type"] = "range"
+                rule["param"] = m.group("expr").strip().lower()
+        else:
+            m = _ORDER_LINE.match(line)
+            if not m:
+                raise LimitRuleError(f"第 {lineno} 行无法识别: {raw.strip()}")
+            a, b = m.group("a").lower(), m.group("b").lower()
+            rule = {"type": "order", "params": [a, b] if m.group("op").startswith("<") else [b, a]}
+        phase = _parse_phase(m.group("phase"))
+        if phase is not None:
+            rule["phase"] = phase
+        rules.append(rule)
+    return rules
+
+
+def format_rule_text(rules):
+    """规则列表 -> 关系约束文本（只输出sum/order和带通配符/phase的range规则）"""
+    lines = []
+    for rule in rules:
+        phase = rule.get("phase")
+        suffix = ""
+        if phase is not None:
+            suffix = " @ phase " + (",".join(str(p) for p in phase) if isinstance(phase, list) else str(phase))
+        if rule["type"] == "sum":
+            lines.append(f"sum({', '.join(rule['params'])}) in [{rule['min']:g}, {rule['max']:g}]{suffix}")
+        elif rule["type"] == "order":
+            lines.append(f"{rule['params'][0]} <= {rule['params'][1]}{suffix}")
+        elif phase is not None or any(c in rule["param"] for c in "*?["):
+            lines.append(f"{rule['param']} in [{rule['min']:g}, {rule['max']:g}]{suffix}")
+    return "\n".join(lines)
+
+
+def load_rules(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        doc = json.load(f)
+    if doc.get("format") != RULES_FORMAT:
+        raise LimitRuleError(f"{path} 不是参数限值规则文件")
+    return doc
+
+
+def save_rules(path, params, rules):
+    doc = {"format": RULES_FORMAT, "version": 1, "params": params, "rules": rules}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(doc, f, ensure_ascii=False, indent=2)
+    return doc
+
+
+class CompiledLimits:
+    """编译后的限值规则：参数位置去重，一次读取pcr后统一计算所有规则"""
+
+    def __init__(self, doc):
+        self.params = doc.get("params", {})
+        self.phases = sorted({p["phase"] for p in self.params.values() if p.get("phase") is not None})
+        self.slot_names = []
+        self.slot_index = {}
+        self.range_idx, self.range_min, self.range_max = [], [], []
+        self.sum_groups = []  # [(slot索引列表, min, max, 标签)]
+        self.order_pairs = []  # [(a, b)] 要求 value[a] <= value[b]
+        for rule in doc.get("rules", []):
+            self._compile_rule(rule)
+        # 按行分组，读取时每行只split一次
+        self.by_line = {}
+        self.range_by_slot = {}  # 参数索引 -> [(min, max)]，逐行检查用
+        for i, lo, hi in zip(self.range_idx, self.range_min, self.range_max):
+            self.range_by_slot.setdefault(i, []).append((lo, hi))
+        for i, name in enumerate(self.slot_names):
+            p = self.params[name]
+            self.by_line.setdefault(p["line"], []).append((p["position"], i))
+        if np is not None:
+            self.range_idx = np.array(self.range_idx, dtype=int)
+            self.range_min = np.array(self.range_min, dtype=float)
+            self.range_max = np.array(self.range_max, dtype=float)
+            self.order_a = np.array([a for a, _ in self.order_pairs], dtype=int)
+            self.order_b = np.array([b for _, b in self.order_pairs], dtype=int)
+            flat = [i for idx, _, _, _ in self.sum_groups for i in idx]
+            self.sum_flat = np.array(flat, dtype=int)
+            starts, pos = [], 0
+            for idx, _, _, _ in self.sum_groups:
+                starts.append(pos)
+                pos += len(idx)
+            self.sum_starts = np.array(starts, dtype=int)
+            self.sum_min = np.array([g[1] for g in self.sum_groups], dtype=float)
+            self.sum_max = np.array([g[2] for g in self.sum_groups], dtype=float)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(load_rules(path))
+
+    @classmethod
+    def from_param_limits(cls, param_limits):
+        """由旧版导出文件中的 PARAM_LIMITS 构造（定位方式相同），供过程中检测使用"""
+        params, rules = {}, []
+        for item in param_limits:
+            params[item["name"]] = {"line": item["line"], "position": item["position"]}
+            rules.append({"type": "range", "param": item["name"], "min": item["min"], "max": item["max"]})
+        return cls({"params": params, "rules": rules})
+
+    def _scoped(self, rule):
+        """按phase展开规则，返回 [(名称后缀, phase)]"""
+        phase = rule.get("phase")
+        if phase is None:
+            return [("", None)]
+        phases = self.phases if phase == "*" else (phase if isinstance(phase, list) else [phase])
+        return [(f"_{ph}", ph) for ph in phases]
+
+    def _base_name(self, name):
+        """去掉phase参数的 _<phase> 后缀：li1_biso_1 -> li1_biso"""
+        phase = self.params[name].get("phase")
+        suffix = f"_{phase}"
+        if phase is not None and name.endswith(suffix):
+            return name[:-len(suffix)]
+        return name
+
+    def _slot(self, name):
+        if name not in self.params:
+            raise LimitRuleError(f"规则中的参数 {name} 不在参数表中")
+        if name not in self.slot_index:
+            self.slot_index[name] = len(self.slot_names)
+            self.slot_names.append(name)
+        return self.slot_index[name]
+
+    def _compile_rule(self, rule):
+        kind = rule.get("type")
+        scopes = self._scoped(rule)
+        if kind == "range":
+            matched = False
+            for suffix, _ in scopes:
+                pattern = rule["param"].lower() + suffix
+                if any(c in pattern for c in "*?["):
+                    if rule.get("phase") is None:
+                        names = [n for n in self.params if fnmatch.fnmatch(self._base_name(n), pattern)]
+                    else:
+                        names = fnmatch.filter(self.params.keys(), pattern)
+                else:
+                    names = [pattern] if pattern in self.params or rule.get("phase") != "*" else []
+                for name in names:
+                    self.range_idx.append(self._slot(name))
+                    self.range_min.append(float(rule["min"]))
+                    self.range_max.append(float(rule["max"]))
+                    matched = True
+            if not matched and rule.get("phase") != "*":
+                raise LimitRuleError(f"范围规则 {rule['param']} 没有匹配的参数")
+        elif kind in ("sum", "order"):
+            for suffix, phase in scopes:
+                names = [n.lower() + suffix for n in rule["params"]]
+                if rule.get("phase") == "*" and not all(n in self.params for n in names):
+                    continue  # "*" 时跳过不含这些参数的phase
+                idx = [self._slot(n) for n in names]
+                if kind == "sum":
+                    label = f"sum({', '.join(names)})"
+                    self.sum_groups.append((idx, float(rule["min"]), float(rule["max"]), label))
+                else:
+                    self.order_pairs.extend(zip(idx[:-1], idx[1:]))
+        else:
+            raise LimitRuleError(f"未知规则类型: {kind}")
+
+    # ---- 取值 ----
+    def read_values(self, pcr_file):
+        """一次读取pcr，返回 (各参数值列表[缺失为None], 读取错误列表)"""
+        try:
+            with open(pcr_file, 'r', encoding='utf-8', errors='ignore') as f:
+                lines = f.readlines()
+        except Exception as e:
+            return [None] * len(self.slot_names), [f"无法读取pcr文件: {e}"]
+        values = [None] * len(self.slot_names)
+        errors = []
+        for idx, slots in self.by_line.items():
+            idx0 = idx - 1
+            if idx0 < 0 or idx0 >= len(lines):
+                errors.extend(f"{self.slot_names[i]} 参数所在行 {idx} 超出pcr文件范围" for _, i in slots)
+                continue
+            line = lines[idx0]
+            if line.strip().startswith("!"):
+                errors.extend(f"{self.slot_names[i]} 参数所在行 {idx} 是注释行" for _, i in slots)
+                continue
+            parts = line.split()
+            for pos, i in slots:
+                if pos < 0 or pos >= len(parts):
+                    errors.append(f"{self.slot_names[i]} 参数在第 {idx} 行的第 {pos} 列不存在")
+                    continue
+                try:
+                    values[i] = float(parts[pos])
+                except ValueError:
+                    errors.append(f"{self.slot_names[i]} 参数在第 {idx} 行的第 {pos} 列无法转换为数值")
+        return values, errors
+
+    def get_pcr_values(self, pcr_file):
+        values, _ = self.read_values(pcr_file)
+        return {name: v for name, v in zip(self.slot_names, values) if v is not None}
+
+    # ---- 检查 ----
+    def violations(self, values):
+        """对参数值列表（缺失为None）执行全部规则，返回 [(涉及的参数索引, 错误信息)]；含缺失值的规则自动跳过"""
+        found = []
+        if np is not None:
+            v = np.array([np.nan if x is None else x for x in values], dtype=float)
+            if len(self.range_idx):
+                rv = v[self.range_idx]
+                for k in np.nonzero((rv < self.range_min) | (rv > self.range_max))[0]:
+                    i = int(self.range_idx[k])
+                    found.append(((i,), f"{self.slot_names[i]} 参数的值为 {rv[k]}，"
+                                        f"超出范围 {self.range_min[k]}~{self.range_max[k]}"))
+            if len(self.sum_groups):
+                sums = np.add.reduceat(v[self.sum_flat], self.sum_starts)
+                for k in np.nonzero((sums < self.sum_min) | (sums > self.sum_max))[0]:
+                    idx, lo, hi, label = self.sum_groups[k]
+                    found.append((tuple(idx), f"{label} 的值为 {sums[k]:.6g}，超出范围 {lo}~{hi}"))
+            if len(self.order_pairs):
+                va, vb = v[self.order_a], v[self.order_b]
+                for k in np.nonzero(va > vb + ORDER_TOLERANCE)[0]:
+                    a, b = self.order_pairs[k]
+                    found.append(((a, b), f"{self.slot_names[a]} 的值 {va[k]} 大于 {self.slot_names[b]} 的值 {vb[k]}"))
+            return found
+        for i, lo, hi in zip(self.range_idx, self.range_min, self.range_max):
+            x = values[i]
+            if x is not None and not (lo <= x <= hi):
+                found.append(((i,), f"{self.slot_names[i]} 参数的值为 {x}，超出范围 {lo}~{hi}"))
+        for idx, lo, hi, label in self.sum_groups:
+            xs = [values[i] for i in idx]
+            if None not in xs and not (lo <= sum(xs) <= hi):
+                found.append((tuple(idx), f"{label} 的值为 {sum(xs):.6g}，超出范围 {lo}~{hi}"))
+        for a, b in self.order_pairs:
+            if values[a] is not None and values[b] is not None and values[a] > values[b] + ORDER_TOLERANCE:
+                found.append(((a, b), f"{self.slot_names[a]} 的值 {values[a]} 大于 {self.slot_names[b]} 的值 {values[b]}"))
+        return found
+
+    def range_violations(self, slot, value):
+        """单个参数的范围检查，返回错误信息列表"""
+        return [f"{self.slot_names[slot]} 参数的值为 {value}，超出范围 {lo}~{hi}"
+                for lo, hi in self.range_by_slot.get(slot, ()) if not (lo <= value <= hi)]
+
+    def evaluate(self, values):
+        return [msg for _, msg in self.violations(values)]
+
+    def check_pcr_limits(self, pcr_file):
+        """与原 PCR_check_gui_export.check_pcr_limits 相同的接口：返回错误信息列表，无超限时为空"""
+        values, errors = self.read_values(pcr_file)
+        return errors + self.evaluate(values)
+
+
+def load_limit_checker(path):
+    """加载限值检查器：.json 为声明式规则（编译一次反复使用）；.py 为旧版导出的 PCR_check_gui_export.py
+    返回对象均提供 check_pcr_limits(pcr_file)，可能提供 get_pcr_values(pcr_file)"""
+    if path.lower().endswith(".json"):
+        return CompiledLimits.from_file(path)
+    import importlib.util
+    spec = importlib.util.spec_from_file_location("PCR_check_gui_export", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# FullProf 每个精修循环输出的参数表行：序号  符号名  旧值  变化量  新值  [sigma ...]
+_NUM = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[EeDd][-+]?\d+)?'
+FULLPROF_PARAM_LINE = re.compile(
+    r'^\s*\d+\s+(?P<name>[A-Za-z][\w\-.()]*)\s+(?P<old>' + _NUM + r')\s+(?P<change>' + _NUM + r')\s+(?P<new>' + _NUM + r')'
+    r'(?:\s+(?P<sigma>' + _NUM + r'))?'
+)
+
+
+def fullprof_name_candidates(symbol):
+    """FullProf符号名 -> 可能的规则参数名，如 Biso_Li1_ph1_pat1 -> li1_biso_1 / biso_li1_1 / ..."""
+    phase = None
+    rest = []
+    for token in symbol.split("_"):
+        m = re.fullmatch(r'ph(\d+)', token, re.IGNORECASE)
+        if m:
+            phase = m.group(1)
+        elif not re.fullmatch(r'pat\d+', token, re.IGNORECASE):
+            rest.append(token.lower())
+    bases = ["_".join(rest), "_".join(reversed(rest))]
+    candidates = [f"{b}_{phase}" for b in bases] if phase is not None else []
+    return candidates + bases
+
+
+class RunawayDetector:
+    """精修过程中根据FullProf输出的参数新值检查限值规则，参数一旦超出允许范围即报告
+    以运行前pcr中的值为基准（未精修的参数也参与占位率之和等规则），只对本次运行中更新过的参数报错，
+    连续 patience 次检查都超限才判定失控。
+    参数表的每一行只做范围检查；参数表结束（遇到下一个非空的非参数行）时，把本循环的新值一起更新后再检查全部规则。
+    stdout 和 .out 分别记录未结束的参数表（source），两者交错输入不会互相打断"""
+
+    def __init__(self, limits, baseline_values=None, patience=1):
+        self.limits = limits
+        self.values = list(baseline_values) if baseline_values is not None else [None] * len(limits.slot_names)
+        self.patience = patience
+        self.updated = set()
+        self.pending = {}  # source -> {参数索引: 本循环的新值}
+        self.strikes = 0
+        self.reason = None
+        self.name_cache = {}
+        self.file_offsets = {}
+        self.lock = threading.Lock()
+
+    def _slot_of(self, symbol):
+        if symbol not in self.name_cache:
+            self.name_cache[symbol] = next(
+                (self.limits.slot_index[c] for c in fullprof_name_candidates(symbol) if c in self.limits.slot_index), None
+            )
+        return self.name_cache[symbol]
+
+    def feed(self, line, source="stdout"):
+        """输入一行FullProf输出，判定为失控时返回True（原因见 self.reason）"""
+        m = FULLPROF_PARAM_LINE.match(line)
+        with self.lock:
+            if self.reason is not None:
+                return True
+            if not m:
+                if line.strip() and self.pending.get(source):
+                    return self._end_cycle(source)
+                return False
+            slot = self._slot_of(m.group("name"))
+            if slot is None:
+                return False
+            try:
+                value = float(m.group("new").replace("D", "E").replace("d", "e"))
+            except ValueError:
+                return False
+            self.pending.setdefault(source, {})[slot] = value
+            bad = self.limits.range_violations(slot, value)
+            return self._strike(bad) if bad else False
+
+    def finish(self):
+        """输出结束：检查尚未结束的参数表"""
+        with self.lock:
+            for source in list(self.pending):
+                if self.pending.get(source) and self.reason is None:
+                    self._end_cycle(source)
+            return self.reason is not None
+
+    def _end_cycle(self, source):
+        for slot, value in self.pending.pop(source).items():
+            self.values[slot] = value
+            self.updated.add(slot)
+        bad = [msg for slots, msg in self.limits.violations(self.values) if self.updated.intersection(slots)]
+        if not bad:
+            self.strikes = 0
+            return False
+        return self._strike(bad)
+
+    def _strike(self, bad):
+        self.strikes += 1
+        if self.strikes >= self.patience:
+            self.reason = "; ".join(bad)
+            return True
+        return False
+
+    def poll_file(self, path):
+        """增量读取FullProf正在写入的文件（如 .out），只处理新增的完整行"""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        offset = self.file_offsets.get(path, 0)
+        if size <= offset:
+            return self.reason is not None
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        end = data.rfind(b'\n') + 1
+        self.file_offsets[path] = offset + end
+        for line in data[:end].decode('utf-8', errors='ignore').splitlines():
+            if self.feed(line, source=path):
+                return True
+        return False
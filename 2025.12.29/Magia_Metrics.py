@@ -0,0 +1,273 @@
+'''2026.01
+运行指标：统计精修步骤的开始/成功/失败（按原因分类）、每步FullProf耗时和Python额外开销、
+排队数和运行中任务数、超时和阻塞检测终止次数、写出的字节数，输出为 Prometheus 文本格式。
+- 进程内只有一个注册表 metrics，RefinementWorker 每步结束时记录，GUI批量精修和任务服务设置排队/运行中数量
+- MetricsExporter 定时把全部指标原子写入一个 .prom 文件（可由 node_exporter 的 textfile collector 采集）
+- 任务服务（Magia_Job_Server.py）另外提供 GET /metrics
+只用标准库，不依赖 prometheus_client。
+'''
+import os
+import math
+import time
+import threading
+
+METRICS_FILE = "magia_metrics.prom"
+EXPORT_INTERVAL = 15  # 秒
+
+FULLPROF_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+OVERHEAD_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+
+# 步骤概览中的原因 -> 指标标签（按顺序匹配，第一个命中的为准）
+REASON_CLASSES = (
+    ("预检失败", "preflight"),
+    ("未通过接受策略", "rejected"),
+    ("用户主动跳过", "user"),
+    ("超时", "timeout"),
+    ("阻塞", "block"),
+    ("参数失控", "runaway"),
+    ("参数范围异常", "range_check"),
+    ("不收敛", "nonconverge"),
+    ("FullProf启动失败", "launch"),
+    ("非预期错误", "exception"),
+    ("运行时错误", "exception"),
+)
+# 这些原因说明FullProf进程是被主动终止的
+KILL_CLASSES = ("timeout", "block", "runaway", "user", "nonconverge")
+STATUS_LABELS = {"成功": "success", "失败": "failed", "跳过": "skipped"}
+
+
+def classify_reason(status, reason):
+    if status == "成功":
+        return "ok"
+    reason = reason or ""
+    for key, label in REASON_CLASSES:
+        if key in reason:
+            return label
+    return "fullprof_error"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        if not self.labelnames:
+            self.values[()] = self._zero()  # 无标签的指标从0开始输出
+
+    def _zero(self):
+        return 0
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 的标签应为 {self.labelnames}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_fmt(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, buckets, labelnames=()):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, doc, labelnames)
+
+    def _zero(self):
+        return [0] * len(self.buckets), 0.0
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key) or self._zero()
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self.values.items())
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _fmt(bound)))} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []  # 输出前调用，用于按需刷新排队数等仪表值
+        self.steps_started = self._add(Counter(
+            "magia_steps_started_total", "已开始的精修步骤数"))
+        self.steps_finished = self._add(Counter(
+            "magia_steps_finished_total", "已结束的精修步骤数（按状态和原因分类）", ("status", "reason")))
+        self.cache_hits = self._add(Counter(
+            "magia_step_cache_hits_total", "命中步骤缓存、未运行FullProf的步骤数"))
+        self.fullprof_seconds = self._add(Histogram(
+            "magia_fullprof_seconds", "每步FullProf进程的运行时间（秒）", FULLPROF_BUCKETS))
+        self.overhead_seconds = self._add(Histogram(
+            "magia_step_overhead_seconds", "每步除FullProf外的耗时（写pcr/复制dat/检查/解析输出，秒）", OVERHEAD_BUCKETS))
+        self.timeouts = self._add(Counter(
+            "magia_step_timeouts_total", "超时的精修步骤数"))
+        self.kills = self._add(Counter(
+            "magia_fullprof_kills_total", "被主动终止的FullProf进程数（按原因分类）", ("cause",)))
+        self.bytes_written = self._add(Counter(
+            "magia_bytes_written_total", "精修步骤写出的文件字节数"))
+        self.queue_depth = self._add(Gauge(
+            "magia_queue_depth", "排队等待精修的任务/dat数", ("source",)))
+        self.active_jobs = self._add(Gauge(
+            "magia_active_jobs", "正在精修的任务数", ("source",)))
+        self.last_update = self._add(Gauge(
+            "magia_metrics_timestamp_seconds", "指标输出时间"))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, func):
+        self._collectors.append(func)
+
+    def remove_collector(self, func):
+        if func in self._collectors:
+            self._collectors.remove(func)
+
+    def record_step(self, status, reason, total_seconds, fullprof_seconds=None, cached=False, nbytes=0):
+        """一个步骤结束：fullprof_seconds 为None表示没有启动FullProf"""
+        label = classify_reason(status, reason)
+        self.steps_finished.inc(status=STATUS_LABELS.get(status, status), reason=label)
+        if cached:
+            self.cache_hits.inc()
+        if label == "timeout":
+            self.timeouts.inc()
+        if fullprof_seconds is not None:
+            self.fullprof_seconds.observe(fullprof_seconds)
+            if label in KILL_CLASSES:
+                self.kills.inc(cause=label)
+        self.overhead_seconds.observe(max(total_seconds - (fullprof_seconds or 0.0), 0.0))
+        if nbytes:
+            self.bytes_written.inc(nbytes)
+
+    def render(self):
+        for func in list(self._collectors):
+            try:
+                func()
+            except Exception:
+                pass
+        self.last_update.set(time.time())
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """原子写出（先写临时文件再替换），采集端不会读到一半的文件"""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+metrics = MetricsRegistry()
+
+
+def files_size(paths):
+    total = 0
+    for p in paths:
+        try:
+            total += os.path.getsize(p)
+        except OSError:
+            pass
+    return total
+
+
+class MetricsExporter:
+    """后台线程每 interval 秒写出一次指标文件，stop() 时再写一次"""
+
+    def __init__(self, path=METRICS_FILE, interval=EXPORT_INTERVAL, registry=None):
+        self.path = os.path.abspath(path)
+        self.interval = interval
+        self.registry = registry or metrics
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def _write(self):
+        try:
+            self.registry.write(self.path)
+            self.error = None
+        except Exception as e:
+            self.error = str(e)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._write()
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self._write()
+
+
+if __name__ == "__main__":
+    print(metrics.render(), end="")
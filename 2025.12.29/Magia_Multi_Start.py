@@ -0,0 +1,299 @@
+'''2026.01
+多起点精修：对同一个dat，用不同的参数初值（网格或随机抽样）各写一个pcr模板，并行跑完整的步骤方案，
+按最终Chi²和R因子排序，前k步之后明显落后的起点提前淘汰。适用于占位率有歧义（如Li6h/Li6g）或多个竞争模型的情况。
+
+起点配置文件（JSON）：
+{
+  "mode": "grid",              # grid: 各参数取值的全组合；random: 在[min,max]内均匀随机抽样
+  "n": 16,                     # random 模式的起点数
+  "seed": 0,
+  "eliminate_after": 3,        # 前k步结束后开始淘汰（0为不淘汰）
+  "eliminate_factor": 1.5,     # 第k步的Chi²大于已到达第k步起点中最好值的这个倍数即淘汰
+  "params": [
+    {"name": "li6h_occ_1", "values": [0.2, 0.5, 0.8]},                     # 位置从PCRcheck规则文件(.json)的params中查找
+    {"name": "li6g_occ", "line": 52, "position": 5, "min": 0.1, "max": 0.9, "steps": 5,
+     "complement": {"name": "li6h_occ", "line": 50, "position": 5, "total": 1.0}}   # 同时写入 total - 值
+  ]
+}
+参数位置（line从1开始，position为按空白分割后的列号）指向pcr中参数的“值”，与PCRcheck规则相同，
+注意参数库中记录的是精修代码的位置，不能直接用于写初值。
+
+FullProf本身就是独立进程，各起点由线程池驱动（每个线程只负责启动和监视一个FullProf）。
+'''
+import os
+import re
+import json
+import time
+import random
+import itertools
+import threading
+import concurrent.futures
+from PyQt5.QtCore import QThread, pyqtSignal, Qt
+from Magia_Param_Trends import parse_r_factors
+
+MULTI_START_SUMMARY = "AAA_multi_start_summary.txt"
+_TOKEN = re.compile(r'\S+')
+
+
+def load_start_spec(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    if not spec.get("params"):
+        raise ValueError("起点配置中没有参数")
+    return spec
+
+
+def resolve_locations(spec, rule_params=None):
+    """补全每个参数（及其complement）的 line/position，位置来自配置本身或PCRcheck规则文件的params"""
+    rule_params = {k.lower(): v for k, v in (rule_params or {}).items()}
+
+    def locate(entry):
+        if "line" in entry and "position" in entry:
+            return dict(entry)
+        found = rule_params.get(entry["name"].lower())
+        if found is None:
+            raise ValueError(f"参数 {entry['name']} 未指定line/position，PCRcheck规则文件中也没有该参数")
+        return dict(entry, line=found["line"], position=found["position"])
+
+    resolved = []
+    for entry in spec["params"]:
+        item = locate(entry)
+        if entry.get("complement"):
+            item["complement"] = dict(locate(entry["complement"]), total=entry["complement"]["total"])
+        resolved.append(item)
+    return resolved
+
+
+def _candidate_values(entry):
+    if "values" in entry:
+        return [float(v) for v in entry["values"]]
+    lo, hi, steps = float(entry["min"]), float(entry["max"]), int(entry.get("steps", 3))
+    if steps <= 1:
+        return [(lo + hi) / 2]
+    return [lo + (hi - lo) * i / (steps - 1) for i in range(steps)]
+
+
+def generate_starts(spec, params):
+    """返回起点列表，每个起点为 [(line, position, value, name), ...]"""
+    if spec.get("mode", "grid") == "random":
+        rng = random.Random(spec.get("seed", 0))
+        combos = []
+        for _ in range(int(spec.get("n", 8))):
+            combo = []
+            for p in params:
+                if "values" in p:
+                    combo.append(rng.choice([float(v) for v in p["values"]]))
+                else:
+                    combo.append(rng.uniform(float(p["min"]), float(p["max"])))
+            combos.append(combo)
+    else:
+        combos = [list(c) for c in itertools.product(*[_candidate_values(p) for p in params])]
+    starts = []
+    for combo in combos:
+        start = []
+        for p, value in zip(params, combo):
+            start.append((p["line"], p["position"], value, p["name"]))
+            comp = p.get("complement")
+            if comp:
+                start.append((comp["line"], comp["position"], comp["total"] - value, comp["name"]))
+        starts.append(start)
+    return starts
+
+
+def _format_like(old, value):
+    """按原字段的小数位数写新值"""
+    decimals = len(old.split('.')[1]) if '.' in old and 'e' not in old.lower() else 5
+    return f"{value:.{decimals}f}"
+
+
+def _read_lines_autoenc(filepath, encodings=('utf-8', 'gbk', 'gb2312', 'latin1')):
+    """与主程序 read_text_autoenc 相同的编码顺序，同时返回识别到的编码；保留原换行符"""
+    last_exc = None
+    for enc in encodings:
+        try:
+            with open(filepath, 'r', encoding=enc, newline='') as f:
+                return f.readlines(), enc
+        except UnicodeDecodeError as e:
+            last_exc = e
+    raise ValueError(f"无法识别pcr文件编码，请尝试另存为UTF-8或GBK编码: {last_exc}")
+
+
+def write_start_template(base_pcr, start, out_path):
+    """把起点的各参数值写入pcr副本，只替换对应字段，保留其余排版和原文件编码"""
+    lines, encoding = _read_lines_autoenc(base_pcr)
+    for line_no, position, value, name in start:
+        idx = line_no - 1
+        tokens = list(_TOKEN.finditer(lines[idx]))
+        if position >= len(tokens):
+            raise ValueError(f"{name}: 第 {line_no} 行没有第 {position} 列")
+        m = tokens[position]
+        new = _format_like(m.group(), value)
+        lines[idx] = lines[idx][:m.start()] + new + lines[idx][m.end():]
+    with open(out_path, 'w', encoding=encoding, newline='') as f:
+        f.writelines(lines)
+
+
+class StartRace:
+    """前k步结束后比较各起点的Chi²，明显落后的起点标记为淘汰"""
+
+    def __init__(self, eliminate_after, factor):
+        self.k = int(eliminate_after)
+        self.factor = float(factor)
+        self.lock = threading.Lock()
+        self.chi_at_k = {}
+        self.eliminated = set()
+
+    def report(self, start_id, step_no, chi2):
+        """每步结束时调用，返回False表示该起点应停止"""
+        if self.k <= 0:
+            return True
+        with self.lock:
+            if step_no == self.k:
+                self.chi_at_k[start_id] = chi2 if chi2 is not None else float("inf")
+                finite = [c for c in self.chi_at_k.values() if c != float("inf")]
+                if finite:
+                    best = min(finite)
+                    for sid, c in self.chi_at_k.items():
+                        if c > self.factor * best:
+                            self.eliminated.add(sid)
+            return start_id not in self.eliminated
+
+
+def rank_results(results):
+    """完成的起点按最终Chi²、Rwp排序，淘汰/失败的排在后面"""
+    def key(r):
+        finished = r["status"] == "完成" and r["chi2"] is not None
+        rwp = (r.get("r_factors") or {}).get("Rwp", float("inf"))
+        return (0 if finished else 1, r["chi2"] if r["chi2"] is not None else float("inf"), rwp)
+    return sorted(results, key=key)
+
+
+def format_ranking(ranked):
+    lines = []
+    for rank, r in enumerate(ranked, 1):
+        values = ", ".join(f"{name}={value:.4f}" for _, _, value, name in r["start"])
+        chi = "-" if r["chi2"] is None else f"{r['chi2']:.4f}"
+        rf = r.get("r_factors") or {}
+        rstr = f"Rp={rf['Rp']:.2f} Rwp={rf['Rwp']:.2f}" if rf else "R因子: -"
+        lines.append(f"{rank:>3}. {r['id']} | {r['status']} | Chi²: {chi} | {rstr} | {values}")
+        if r.get("final_pcr"):
+            lines.append(f"     最终pcr: {r['final_pcr']}")
+    return "\n".join(lines)
+
+
+class MultiStartRunner(QThread):
+    log_signal = pyqtSignal(str, str)
+    finished_signal = pyqtSignal(str)
+
+    def __init__(self, worker_factory, base_config, steps, spec, rule_params, out_dir, max_parallel):
+        """worker_factory(config, steps, run_indices) 返回 RefinementWorker"""
+        super().__init__()
+        self.worker_factory = worker_factory
+        self.base_config = base_config
+        self.steps = steps
+        self.spec = spec
+        self.rule_params = rule_params
+        self.out_dir = out_dir
+        self.max_parallel = max(1, int(max_parallel))
+        self._workers = {}
+        self._stop = False
+
+    def stop(self):
+        self._stop = True
+        for worker in list(self._workers.values()):
+            worker.stop()
+            worker.skip_current_step()
+
+    def _run_start(self, start_id, start, race):
+        start_dir = os.path.join(self.out_dir, start_id)
+        template = os.path.join(self.out_dir, f"{start_id}_template.pcr")
+        write_start_template(self.base_config["pcr_path"], start, template)
+        config = dict(self.base_config, pcr_path=template, temp_dir=start_dir, job_id=start_id)
+        worker = self.worker_factory(config, self.steps, list(range(len(self.steps))))
+        state = {"eliminated": False}
+
+        def on_step(step_no, chi2):
+            if race.report(start_id, step_no, chi2):
+                return True
+            if not state["eliminated"]:
+                state["eliminated"] = True
+                self.log_signal.emit("warn", f"[{start_id}] ✂️ 第{step_no}步后Chi²明显落后，提前淘汰")
+            return False
+        worker.step_hook = on_step
+        # 只转发警告/错误/Chi²，FullProf输出太多
+        worker.log_signal.connect(
+            lambda t, m: self.log_signal.emit(t, f"[{start_id}] {m}") if t != "main" else None,
+            Qt.DirectConnection
+        )
+        self._workers[start_id] = worker
+        t0 = time.time()
+        worker.run()
+        self._workers.pop(start_id, None)
+
+        overview = worker._overview_list
+        last_ok = None
+        for entry in overview:
+            if entry.get("status") == "成功":
+                last_ok = entry
+        final_pcr = None
+        r_factors = None
+        if last_ok is not None:
+            step = self.steps[last_ok["index"] - 1]
+            safe_step_name = re.sub(r'[^a-zA-Z0-9_]', '_', step['name'])
+            base_name = f"step_{last_ok['index']:03d}_{safe_step_name}"
+            final_pcr = os.path.join(start_dir, f"{base_name}.pcr")
+            r_factors = parse_r_factors(os.path.join(start_dir, f"{base_name}.out"))
+        if state["eliminated"]:
+            status = "淘汰"
+        elif self._stop:
+            status = "已终止"
+        elif last_ok is None:
+            status = "失败"
+        else:
+            status = "完成"
+        return {
+            "id": start_id,
+            "start": start,
+            "status": status,
+            "chi2": last_ok.get("chi2") if last_ok else None,
+            "r_factors": r_factors,
+            "final_pcr": final_pcr,
+            "success_steps": sum(1 for e in overview if e.get("status") == "成功"),
+            "duration": time.time() - t0
+        }
+
+    def run(self):
+        try:
+            params = resolve_locations(self.spec, self.rule_params)
+            starts = generate_starts(self.spec, params)
+        except Exception as e:
+            self.finished_signal.emit(f"起点配置错误: {e}")
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        race = StartRace(self.spec.get("eliminate_after", 0), self.spec.get("eliminate_factor", 1.5))
+        self.log_signal.emit("main", f"🎯 多起点精修: {len(starts)} 个起点，最多并行 {self.max_parallel} 个")
+        results = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_parallel) as pool:
+            futures = {
+                pool.submit(self._run_start, f"start_{i:03d}", start, race): i
+                for i, start in enumerate(starts, 1)
+            }
+            for fut in concurrent.futures.as_completed(futures):
+                try:
+                    r = fut.result()
+                except Exception as e:
+                    self.log_signal.emit("err", f"起点 {futures[fut]} 运行失败: {e}")
+                    continue
+                results.append(r)
+                chi = "-" if r["chi2"] is None else f"{r['chi2']:.4f}"
+                self.log_signal.emit("main", f"[{r['id']}] {r['status']}，最终Chi²: {chi}（{len(results)}/{len(starts)}）")
+        ranked = rank_results(results)
+        report = format_ranking(ranked)
+        try:
+            with open(os.path.join(self.out_dir, MULTI_START_SUMMARY), 'w', encoding='utf-8') as f:
+                f.write(report + "\n")
+            with open(os.path.join(self.out_dir, "multi_start_summary.json"), 'w', encoding='utf-8') as f:
+                json.dump(ranked, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            self.log_signal.emit("err", f"无法写入多起点汇总: {e}")
+        self.finished_signal.emit(report)
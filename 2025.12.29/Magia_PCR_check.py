@@ -1,11 +1,21 @@
+'''2026.01
+导出格式改为声明式规则文件（JSON，见 Magia_Limit_Rules.py），不再生成Python代码；
+新增“关系约束”文本框，支持占位率之和、B值大小关系及按phase检查，例如：
+    sum(li1_occ, ni1_occ) in [0.99, 1.01] @ phase 1
+    o1_biso <= li1_biso @ phase *
+新增“导入规则”，可重新编辑已导出的规则文件
+'''
 import sys
 import json
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
-    QCheckBox, QPushButton, QFileDialog, QScrollArea, QMessageBox, QGroupBox, QTabWidget
+    QCheckBox, QPushButton, QFileDialog, QScrollArea, QMessageBox, QGroupBox, QTabWidget, QTextEdit
 )
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont
+from Magia_Limit_Rules import (
+    CompiledLimits, LimitRuleError, parse_rule_text, format_rule_text, load_rules, save_rules
+)
 
 class ParamRow(QWidget):
     def __init__(self, name, line, pos, group=None, phase=None, parent=None):
@@ -29,6 +39,11 @@ class ParamRow(QWidget):
         layout.addWidget(self.checkbox)
         self.setLayout(layout)
 
+    def set_setting(self, minv, maxv):
+        self.min_edit.setText(f"{minv:g}")
+        self.max_edit.setText(f"{maxv:g}")
+        self.checkbox.setChecked(True)
+
     def get_setting(self):
         if self.checkbox.isChecked():
             try:
@@ -56,8 +71,10 @@ class MainWindow(QWidget):
         main_layout = QVBoxLayout()
         btn_layout = QHBoxLayout()
         self.load_btn = QPushButton("加载JSON文件")
+        self.import_rules_btn = QPushButton("导入规则")
         self.export_btn = QPushButton("导出监控配置")
         btn_layout.addWidget(self.load_btn)
+        btn_layout.addWidget(self.import_rules_btn)
         btn_layout.addWidget(self.export_btn)
         main_layout.addLayout(btn_layout)
 
@@ -74,9 +91,24 @@ class MainWindow(QWidget):
         self.scroll.setWidget(self.param_widget)
         main_layout.addWidget(self.scroll)
 
+        # 关系约束（占位率之和、B值大小关系、按phase的通配符范围）
+        constraint_box = QGroupBox("关系约束（每行一条，# 为注释）")
+        constraint_layout = QVBoxLayout()
+        self.constraint_edit = QTextEdit()
+        self.constraint_edit.setPlaceholderText(
+            "sum(li1_occ, ni1_occ) in [0.99, 1.01] @ phase 1\n"
+            "o1_biso <= li1_biso @ phase *\n"
+            "*_biso in [0, 3] @ phase 2"
+        )
+        self.constraint_edit.setFixedHeight(100)
+        constraint_layout.addWidget(self.constraint_edit)
+        constraint_box.setLayout(constraint_layout)
+        main_layout.addWidget(constraint_box)
+
         self.setLayout(main_layout)
 
         self.load_btn.clicked.connect(self.load_json)
+        self.import_rules_btn.clicked.connect(self.import_rules)
         self.export_btn.clicked.connect(self.export_config)
 
     def load_json(self):
@@ -154,80 +186,54 @@ class MainWindow(QWidget):
             tab_scroll.setWidget(tab_content)
             self.tab_widget.addTab(tab_scroll, f"phase{phase}")
 
+    def import_rules(self):
+        if not self.param_rows:
+            QMessageBox.warning(self, "提示", "请先加载参数库JSON文件")
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "选择规则文件", "", "JSON Files (*.json)")
+        if not path:
+            return
+        try:
+            doc = load_rules(path)
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"无法读取规则文件: {e}")
+            return
+        rows = {row.name: row for row in self.param_rows}
+        others = []
+        for rule in doc.get("rules", []):
+            row = rows.get(rule.get("param")) if rule.get("type") == "range" and rule.get("phase") is None else None
+            if row is not None:
+                row.set_setting(rule["min"], rule["max"])
+            else:
+                others.append(rule)
+        self.constraint_edit.setPlainText(format_rule_text(others))
+
     def export_config(self):
-        settings = []
+        rules = []
         for row in self.param_rows:
             setting = row.get_setting()
             if setting is not None:
-                settings.append(setting)
-        if not settings:
+                rules.append({"type": "range", "param": setting["name"], "min": setting["min"], "max": setting["max"]})
+        try:
+            rules.extend(parse_rule_text(self.constraint_edit.toPlainText()))
+        except LimitRuleError as e:
+            QMessageBox.warning(self, "关系约束错误", str(e))
+            return
+        if not rules:
             QMessageBox.warning(self, "提示", "没有启用任何参数监控！")
             return
-        path, _ = QFileDialog.getSaveFileName(self, "导出为py文件", "PCR_check_gui_export.py", "Python Files (*.py)")
+        # 参数表包含全部参数，关系约束可引用未单独设置上下限的参数
+        params = {row.name: {"line": row.line, "position": row.pos, "phase": row.phase} for row in self.param_rows}
+        doc = {"params": params, "rules": rules}
+        try:
+            CompiledLimits(doc)  # 导出前先编译一次，提前发现写错的参数名
+        except LimitRuleError as e:
+            QMessageBox.warning(self, "规则错误", str(e))
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "导出规则文件", "PCR_limits.json", "JSON Files (*.json)")
         if not path:
             return
-        # 生成py文件
-        with open(path, "w", encoding="utf-8") as f:
-            f.write("# 由PCR_check_gui.py自动生成\n")
-            f.write("import sys\n\n")
-            f.write("PARAM_LIMITS = [\n")
-            for s in settings:
-                f.write(f"    {repr(s)},\n")
-            f.write("]\n\n")
-            f.write('''\
-def check_pcr_limits(pcr_file):
-            """
-            检查pcr文件中PARAM_LIMITS中所有参数是否超出范围
-            返回: 错误信息列表（如无超限则返回空列表）
-            """
-            try:
-                with open(pcr_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-            except Exception as e:
-                return [f"无法读取pcr文件: {e}"]
-            errors = []
-            for param in PARAM_LIMITS:
-                # 说明：导出时 line 使用的是 1-based 行号，这里转换为 0-based 索引
-                idx = param['line']
-                pos = param['position']
-                name = param['name']
-                minv = param['min']
-                maxv = param['max']
-                idx0 = idx - 1
-                if idx0 < 0 or idx0 >= len(lines):
-                    errors.append(f"{name} 参数所在行 {idx} 超出pcr文件范围")
-                    continue
-                line = lines[idx0]
-                if line.strip().startswith("!"):
-                    errors.append(f"{name} 参数所在行 {idx} 是注释行")
-                    continue
-                parts = line.strip().split()
-                if pos < 0 or pos >= len(parts):
-                    errors.append(f"{name} 参数在第 {idx} 行的第 {pos} 列不存在")
-                    continue
-                try:
-                    value = float(parts[pos])
-                except Exception:
-                    errors.append(f"{name} 参数在第 {idx} 行的第 {pos} 列无法转换为数值")
-                    continue
-                if not (minv <= value <= maxv):
-                    errors.append(f"{name} 参数的值为 {value}，超出范围 {minv}~{maxv}")
-            return errors
-        
-if __name__ == "__main__":
-            if len(sys.argv) < 2:
-                print("Usage: PCR_check_gui_export.py <pcr_file>")
-                sys.exit(1)
-            errs = check_pcr_limits(sys.argv[1])
-            if errs:
-                print("ERROR")
-                for e in errs:
-                    print(e)
-                sys.exit(2)
-            else:
-                print("所有参数ok")
-                sys.exit(0)
-        ''')
+        save_rules(path, params, rules)
         QMessageBox.information(self, "导出成功", f"已导出到 {path}")
 
 if __name__ == "__main__":
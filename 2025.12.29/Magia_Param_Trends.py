@@ -0,0 +1,217 @@
+'''2026.01
+批量精修的参数趋势矩阵：每个dat精修结束后追加一行（dat × 参数），记录参数值、ESD、Chi²和R因子，
+保存为 AAA_param_trends.npz（numpy压缩格式，含dat名、参数名和phase标签），批量进行中即可随时导出/作图。
+- 参数值和ESD来自每个成功步骤 .out 中FullProf最后一个循环的参数表（后面步骤的值覆盖前面步骤）
+- PCRcheck规则中的参数（如占位率、B值）取最终pcr中的值，没有ESD
+趋势矩阵需要numpy，没有numpy时精修照常进行，只是不生成趋势文件。
+命令行：
+python Magia_Param_Trends.py AAA_param_trends.npz --csv trends.csv
+python Magia_Param_Trends.py AAA_param_trends.npz --plot trends.png [参数名或通配符 ...]
+'''
+import os
+import re
+import sys
+import fnmatch
+from Magia_Limit_Rules import FULLPROF_PARAM_LINE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TRENDS_FILE = "AAA_param_trends.npz"
+R_FACTOR_PATTERN = re.compile(r'Rp:\s*([\d.]+)\s+Rwp:\s*([\d.]+)\s+Rexp:\s*([\d.]+)')
+PHASE_PATTERN = re.compile(r'_ph(\d+)', re.IGNORECASE)
+STAT_NAMES = ("chi2", "Rp", "Rwp", "Rexp")
+
+
+def _to_float(text):
+    return float(text.replace("D", "E").replace("d", "e"))
+
+
+def parse_r_factors(out_path):
+    """读取 .out 中最后一次的 Rp/Rwp/Rexp，读不到返回None"""
+    try:
+        with open(out_path, 'r', encoding='utf-8', errors='ignore') as f:
+            found = R_FACTOR_PATTERN.findall(f.read())
+    except Exception:
+        return None
+    if not found:
+        return None
+    rp, rwp, rexp = found[-1]
+    return {"Rp": float(rp), "Rwp": float(rwp), "Rexp": float(rexp)}
+
+
+def parse_refined_params(out_path):
+    """读取 .out 中最后一个循环的参数表，返回 {FullProf符号名: (值, ESD)}"""
+    result = {}
+    try:
+        with open(out_path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                m = FULLPROF_PARAM_LINE.match(line)
+                if m and m.group("sigma") is not None:
+                    try:
+                        result[m.group("name")] = (_to_float(m.group("new")), _to_float(m.group("sigma")))
+                    except ValueError:
+                        pass
+    except Exception:
+        pass
+    return result
+
+
+class TrendMatrix:
+    """dat × 参数 的稠密矩阵，行和列按容量倍增，追加一行为均摊O(参数数)"""
+
+    def __init__(self, row_capacity=64, col_capacity=32):
+        if np is None:
+            raise ImportError("参数趋势矩阵需要numpy")
+        self.dats = []
+        self.names = []
+        self.phases = []
+        self.col_index = {}
+        self.values = np.full((row_capacity, col_capacity), np.nan)
+        self.esds = np.full((row_capacity, col_capacity), np.nan)
+        self.stats = np.full((row_capacity, len(STAT_NAMES)), np.nan)
+
+    @property
+    def n_rows(self):
+        return len(self.dats)
+
+    def _grow(self, rows, cols):
+        r_cap, c_cap = self.values.shape
+        if rows <= r_cap and cols <= c_cap:
+            return
+        new_r, new_c = r_cap, c_cap
+        while new_r < rows:
+            new_r *= 2
+        while new_c < cols:
+            new_c *= 2
+        for attr, width in (("values", new_c), ("esds", new_c), ("stats", len(STAT_NAMES))):
+            old = getattr(self, attr)
+            grown = np.full((new_r, width), np.nan)
+            grown[:old.shape[0], :old.shape[1]] = old
+            setattr(self, attr, grown)
+
+    def _column(self, name, phase=None):
+        col = self.col_index.get(name)
+        if col is None:
+            col = len(self.names)
+            self.col_index[name] = col
+            self.names.append(name)
+            if phase is None:
+                m = PHASE_PATTERN.search(name)
+                phase = int(m.group(1)) if m else 0
+            self.phases.append(int(phase))
+        return col
+
+    def add_row(self, dat, params, chi2=None, r_factors=None, phases=None):
+        """params: {参数名: 值 或 (值, ESD)}；phases: {参数名: phase}（没有时从 _phN 推断，0表示非phase参数）
+        同一个dat再次加入时覆盖原来的行"""
+        phases = phases or {}
+        if dat in self.dats:
+            row = self.dats.index(dat)
+        else:
+            row = len(self.dats)
+            self.dats.append(dat)
+        cols = [self._column(name, phases.get(name)) for name in params]
+        self._grow(row + 1, len(self.names))
+        self.values[row, :] = np.nan
+        self.esds[row, :] = np.nan
+        if cols:
+            items = [v if isinstance(v, (tuple, list)) else (v, np.nan) for v in params.values()]
+            arr = np.array(items, dtype=float)
+            self.values[row, cols] = arr[:, 0]
+            self.esds[row, cols] = arr[:, 1]
+        r_factors = r_factors or {}
+        self.stats[row] = [np.nan if chi2 is None else chi2] + [r_factors.get(k, np.nan) for k in STAT_NAMES[1:]]
+        return row
+
+    # ---- 读写 ----
+    def save(self, path):
+        n, m = self.n_rows, len(self.names)
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp,
+            dats=np.array(self.dats, dtype=str),
+            names=np.array(self.names, dtype=str),
+            phases=np.array(self.phases, dtype=np.int32),
+            values=self.values[:n, :m],
+            esds=self.esds[:n, :m],
+            stats=self.stats[:n],
+            stat_names=np.array(STAT_NAMES, dtype=str)
+        )
+        os.replace(tmp, path)  # 作图/导出时不会读到写了一半的文件
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            tm = cls(max(1, len(data["dats"])), max(1, len(data["names"])))
+            tm.dats = [str(d) for d in data["dats"]]
+            tm.names = [str(n) for n in data["names"]]
+            tm.phases = [int(p) for p in data["phases"]]
+            tm.col_index = {n: i for i, n in enumerate(tm.names)}
+            n, m = len(tm.dats), len(tm.names)
+            tm.values[:n, :m] = data["values"]
+            tm.esds[:n, :m] = data["esds"]
+            tm.stats[:n] = data["stats"]
+        return tm
+
+    def select(self, patterns=None):
+        """按参数名或通配符选列，返回列索引数组"""
+        if not patterns:
+            return np.arange(len(self.names))
+        cols = [i for i, n in enumerate(self.names) if any(fnmatch.fnmatch(n.lower(), p.lower()) for p in patterns)]
+        return np.array(cols, dtype=int)
+
+    def export_csv(self, path, patterns=None):
+        n = self.n_rows
+        cols = self.select(patterns)
+        header = ["dat"] + list(STAT_NAMES)
+        for c in cols:
+            header += [self.names[c], f"{self.names[c]}_esd"]
+        # 值和ESD交错排列，一次写出
+        body = np.empty((n, len(STAT_NAMES) + 2 * len(cols)))
+        body[:, :len(STAT_NAMES)] = self.stats[:n]
+        body[:, len(STAT_NAMES)::2] = self.values[:n][:, cols]
+        body[:, len(STAT_NAMES) + 1::2] = self.esds[:n][:, cols]
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(",".join(header) + "\n")
+            for dat, row in zip(self.dats, body):
+                f.write(dat + "," + ",".join("" if np.isnan(v) else f"{v:.8g}" for v in row) + "\n")
+
+    def plot(self, path, patterns=None, x=None):
+        """每个参数一张子图（带ESD误差棒），x默认为dat序号"""
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        n = self.n_rows
+        cols = self.select(patterns)
+        x = np.arange(1, n + 1) if x is None else np.asarray(x)[:n]
+        panels = [("chi2", self.stats[:n, 0], None)] + [
+            (f"{self.names[c]} (phase {self.phases[c]})" if self.phases[c] else self.names[c],
+             self.values[:n, c], self.esds[:n, c]) for c in cols
+        ]
+        ncol = 3
+        nrow = (len(panels) + ncol - 1) // ncol
+        fig, axes = plt.subplots(nrow, ncol, figsize=(4 * ncol, 2.6 * nrow), squeeze=False, sharex=True)
+        for ax, (title, y, err) in zip(axes.flat, panels):
+            ax.errorbar(x, y, yerr=err, fmt='o-', ms=2, lw=0.8, capsize=1)
+            ax.set_title(title, fontsize=8)
+            ax.tick_params(labelsize=7)
+        for ax in list(axes.flat)[len(panels):]:
+            ax.set_visible(False)
+        fig.tight_layout()
+        fig.savefig(path, dpi=120)
+        plt.close(fig)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: Magia_Param_Trends.py <AAA_param_trends.npz> --csv <out.csv> | --plot <out.png> [参数 ...]")
+        sys.exit(1)
+    tm = TrendMatrix.load(sys.argv[1])
+    if sys.argv[2] == "--csv":
+        tm.export_csv(sys.argv[3], sys.argv[4:])
+    elif sys.argv[2] == "--plot":
+        tm.plot(sys.argv[3], sys.argv[4:])
+    print(f"{tm.n_rows} 个dat，{len(tm.names)} 个参数")
@@ -0,0 +1,236 @@
+'''2026.01
+精修前预检：在启动FullProf之前检查pcr模板、dat和参数库，能确定跑不通的情况直接报错，不再每一步都启动一次FullProf才发现。
+检查内容：
+- dat能否读取、格式是否与pcr的Ins一致（Ins=0 / Ins=10），Job为角度模式时数据X不应超过180°
+- dat的X范围与pcr的 Thmin/Thmax（或TOF范围）是否有重叠
+- 参数库中每个参数的 line/position 是否存在且为数值（modify_pcr_template遇到越界位置会静默跳过）
+- 同一phase中原子名是否重复
+- 由晶胞参数和数据范围估算衍射峰数（不考虑消光，只用于发现“NO REFLECTIONS FOUND”这类必然失败的情况）
+返回 [(级别, 信息)]，级别为 "err"（必然失败）或 "warn"（可能有问题）。
+'''
+import os
+import re
+import math
+from Magia_Dat_Reader import read_dat
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PHASE_HEADER = re.compile(r'!\s*Data for PHASE number:\s*(\d+)', re.IGNORECASE)
+ATOM_HEADER = re.compile(r'!Atom\s+Typ\s+X\s+Y\s+Z\s+Biso\s+Occ')
+ENUMERATE_BELOW = 1000  # 体积估算小于此值时再精确枚举hkl
+TOF_JOBS = (-1, -3)  # Job值：-1 TOF中子精修，-3 TOF中子模拟计算（2为X射线模拟计算，不是TOF）
+
+
+def _is_number(text):
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+
+def header_values(lines, key, start=0, end=None):
+    """查找含 key 的 "!" 注释表头，返回 {表头名: 下一行对应列的值}（按空白分列一一对应）"""
+    end = len(lines) if end is None else end
+    for idx in range(start, end):
+        line = lines[idx]
+        if not line.lstrip().startswith('!'):
+            continue
+        names = line.strip().lstrip('!').split()
+        if key not in names:
+            continue
+        for nxt in range(idx + 1, end):
+            if lines[nxt].strip() and not lines[nxt].lstrip().startswith('!'):
+                values = lines[nxt].split()
+                return {n: v for n, v in zip(names, values)}
+        return None
+    return None
+
+
+def _float(values, *names):
+    if not values:
+        return None
+    for n in names:
+        if n in values and _is_number(values[n]):
+            return float(values[n])
+    return None
+
+
+def phase_blocks(lines):
+    """返回 [(phase号, 起始行, 结束行)]"""
+    starts = [(i, int(m.group(1))) for i, l in enumerate(lines) for m in [PHASE_HEADER.match(l.strip())] if m]
+    blocks = []
+    for k, (i, ph) in enumerate(starts):
+        end = starts[k + 1][0] if k + 1 < len(starts) else len(lines)
+        blocks.append((ph, i, end))
+    return blocks
+
+
+def atom_names(lines, start, end):
+    """phase块中的原子名（按出现顺序，保留重复），判定方式与PCR_Reader的extract_atom_names_from_pcr相同"""
+    names = []
+    in_atoms = False
+    for line in lines[start:end]:
+        s = line.strip()
+        if ATOM_HEADER.match(s):
+            in_atoms = True
+            continue
+        if not in_atoms:
+            continue
+        if s == "" or s.startswith("!"):
+            if s == "" or not s.startswith("!    beta"):
+                break
+            continue
+        parts = s.split()
+        if len(parts) >= 2 and re.match(r'^[A-Za-z]', parts[0]) and re.match(r'^[A-Za-z]', parts[1]):
+            names.append(parts[0])
+    return names
+
+
+def _reciprocal_metric(a, b, c, alpha, beta, gamma):
+    ca, cb, cg = (math.cos(math.radians(v)) for v in (alpha, beta, gamma))
+    g = np.array([[a * a, a * b * cg, a * c * cb],
+                  [a * b * cg, b * b, b * c * ca],
+                  [a * c * cb, b * c * ca, c * c]])
+    return np.linalg.inv(g), math.sqrt(max(np.linalg.det(g), 0.0))
+
+
+def estimate_reflections(cell, dmin, dmax):
+    """d在[dmin, dmax]内的倒易点数（不含000，不考虑对称和消光）；点数少时精确枚举，多时用球壳体积估算"""
+    gstar, volume = _reciprocal_metric(*cell)
+    if volume <= 0 or dmin <= 0:
+        return 0
+    shell = 4.0 / 3.0 * math.pi * volume * (dmin ** -3 - (dmax ** -3 if dmax and math.isfinite(dmax) else 0.0))
+    if shell >= ENUMERATE_BELOW:
+        return int(shell)
+    hmax = [int(math.ceil(L / dmin)) + 1 for L in cell[:3]]
+    grids = np.meshgrid(*[np.arange(-m, m + 1) for m in hmax], indexing='ij')
+    hkl = np.stack([g.ravel() for g in grids], axis=1).astype(float)
+    inv_d2 = np.einsum('ij,jk,ik->i', hkl, gstar, hkl)
+    upper = 1.0 / dmin ** 2
+    lower = 1.0 / dmax ** 2 if dmax and math.isfinite(dmax) else 0.0
+    return int(np.count_nonzero((inv_d2 > max(lower, 1e-12)) & (inv_d2 <= upper)))
+
+
+def _d_range(job, xmin, xmax, inst):
+    """数据范围 -> d范围 (dmin, dmax)，取不到仪器参数时返回None"""
+    if job in TOF_JOBS:
+        dtt1 = _float(inst.get("tof"), "Dtt1")
+        zero = _float(inst.get("tof"), "Zero") or 0.0
+        if not dtt1:
+            return None
+        return max((xmin - zero) / dtt1, 1e-6), (xmax - zero) / dtt1
+    lam = _float(inst.get("lambda"), "Lambda1", "Lambda")
+    if not lam:
+        return None
+    th_max = math.radians(min(xmax, 179.9) / 2)
+    th_min = math.radians(max(xmin, 1e-3) / 2)
+    return lam / (2 * math.sin(th_max)), lam / (2 * math.sin(th_min))
+
+
+def preflight_check(pcr_path, dat_path, param_lib=None):
+    issues = []
+    try:
+        with open(pcr_path, 'r', encoding='utf-8', errors='ignore') as f:
+            lines = f.readlines()
+    except Exception as e:
+        return [("err", f"无法读取pcr模板: {e}")]
+
+    job_vals = header_values(lines, "Job")
+    job = int(_float(job_vals, "Job")) if _float(job_vals, "Job") is not None else None
+    ins = _float(header_values(lines, "Ins"), "Ins")
+
+    # ---- 参数库坐标 ----
+    for pid, p in (param_lib or {}).items():
+        line_no, pos = p.get("line"), p.get("position")
+        name = p.get("name", str(pid))
+        if p.get("phase") is not None:
+            name = f"{name}_{p['phase']}"
+        if line_no is None or pos is None:
+            issues.append(("err", f"参数库 {name} 缺少line/position"))
+            continue
+        if not 1 <= line_no <= len(lines):
+            issues.append(("err", f"参数库 {name}: pcr只有 {len(lines)} 行，第 {line_no} 行不存在"))
+            continue
+        parts = lines[line_no - 1].split()
+        if pos >= len(parts):
+            issues.append(("err", f"参数库 {name}: 第 {line_no} 行只有 {len(parts)} 列，位置 {pos} 越界（精修时会被静默跳过）"))
+        elif not _is_number(parts[pos]):
+            issues.append(("err", f"参数库 {name}: 第 {line_no} 行第 {pos} 列为 '{parts[pos]}'，不是数值"))
+
+    # ---- 原子名 ----
+    blocks = phase_blocks(lines)
+    for ph, start, end in blocks:
+        names = atom_names(lines, start, end)
+        dup = sorted({n for n in names if names.count(n) > 1})
+        if dup:
+            issues.append(("err", f"phase {ph} 中原子名重复: {', '.join(dup)}"))
+
+    # ---- dat ----
+    if not os.path.isfile(dat_path):
+        issues.append(("err", f"dat文件不存在: {dat_path}"))
+        return issues
+    try:
+        dat = read_dat(dat_path)
+    except ImportError as e:
+        issues.append(("warn", f"跳过dat检查: {e}"))
+        return issues
+    except Exception as e:
+        issues.append(("err", f"dat文件无法读取: {e}"))
+        return issues
+    s = dat.summary()
+    if s["npoints"] < 10:
+        issues.append(("err", f"dat中只有 {s['npoints']} 个数据点"))
+        return issues
+    if ins == 10 and dat.fmt != "xye":
+        issues.append(("err", f"pcr为Ins=10（X Y Sigma格式），dat被识别为 {dat.fmt} 格式"))
+    elif ins == 0 and dat.fmt != "ins0":
+        issues.append(("err", f"pcr为Ins=0（起始 步长 终止 + 强度），dat被识别为 {dat.fmt} 格式"))
+    if not s["monotonic"]:
+        issues.append(("warn", "dat的X不是严格递增"))
+    if s["nonfinite"]:
+        issues.append(("err", f"dat中有 {s['nonfinite']} 个非数值强度"))
+    xmin, xmax = s["xmin"], s["xmax"]
+    if job is not None and job not in TOF_JOBS and xmax > 180:
+        issues.append(("err", f"pcr为角度模式（Job={job}），但dat的X最大为 {xmax:.1f}，像是TOF数据"))
+
+    range_vals = header_values(lines, "Thmin") or header_values(lines, "Tof-min")
+    pmin = _float(range_vals, "Thmin", "Tof-min")
+    pmax = _float(range_vals, "Thmax", "Tof-max")
+    if pmin is not None and pmax is not None and pmax > pmin:
+        lo, hi = max(xmin, pmin), min(xmax, pmax)
+        if hi <= lo:
+            issues.append(("err", f"dat范围 {xmin:.3f}~{xmax:.3f} 与pcr范围 {pmin:.3f}~{pmax:.3f} 没有重叠"))
+            return issues
+        if lo > xmin or hi < xmax:
+            issues.append(("warn", f"dat范围 {xmin:.3f}~{xmax:.3f} 只有 {lo:.3f}~{hi:.3f} 在pcr范围内"))
+        xmin, xmax = lo, hi
+
+    # ---- 衍射峰数估算 ----
+    inst = {"lambda": header_values(lines, "Lambda1") or header_values(lines, "Lambda"),
+            "tof": header_values(lines, "Dtt1")}
+    d_range = _d_range(job, xmin, xmax, inst)
+    if d_range is None or np is None:
+        return issues
+    for ph, start, end in blocks:
+        cell_vals = header_values(lines, "alpha", start, end)
+        cell = [_float(cell_vals, k) for k in ("a", "b", "c", "alpha", "beta", "gamma")] if cell_vals else None
+        if not cell or any(v is None for v in cell):
+            continue
+        try:
+            n = estimate_reflections(cell, *d_range)
+        except Exception:
+            continue
+        if n == 0:
+            issues.append(("err", f"phase {ph}: 数据范围内（d = {d_range[0]:.3f}~{d_range[1]:.3f} Å）没有衍射峰，"
+                                  f"FullProf会报 NO REFLECTIONS FOUND"))
+        elif n < 5:
+            issues.append(("warn", f"phase {ph}: 数据范围内估计只有约 {n} 个衍射峰"))
+    return issues
+
+
+def format_issues(issues):
+    return "\n".join(("❌ " if level == "err" else "⚠️ ") + msg for level, msg in issues)
@@ -0,0 +1,145 @@
+'''2026.01
+步骤结果缓存：以改写后的pcr内容、dat内容、fp2k.exe标识为键，保存FullProf输出文件和运行结果。
+再次运行相同的步骤时直接恢复输出文件，不再启动fp2k（例如只修改了步骤配置末尾的几步、程序崩溃后重跑、
+更换PCR_check后重跑）。PCR_check在恢复后的pcr上重新执行，因此不影响缓存键。
+只缓存精修成功或FullProf报出确定性错误（负峰宽、奇异矩阵等）的结果，超时、阻塞、用户跳过不缓存。
+默认缓存目录为每个用户固定的位置（default_cache_dir()），不随启动时的工作目录变化，GUI和任务服务共用。
+'''
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+CACHE_VERSION = 1
+CACHED_EXTS = ['.out', '.prf', '.pcr', '.mic', '.fst', '.sum', '.log']
+TMP_MAX_AGE = 6 * 3600  # 秒：超过此时间的 .tmp 目录视为中断遗留，新的可能正在被其他线程写入
+
+
+def default_cache_dir():
+    """Windows: %LOCALAPPDATA%\\Magia\\step_cache；其他系统: $XDG_CACHE_HOME（默认 ~/.cache）/magia/step_cache"""
+    if os.name == 'nt':
+        base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+        return os.path.join(base, "Magia", "step_cache")
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "magia", "step_cache")
+
+
+def _file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class StepCache:
+    def __init__(self, cache_dir=None, max_entries=5000):
+        self.cache_dir = os.path.abspath(cache_dir or default_cache_dir())
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._hash_memo = {}  # (path, size, mtime_ns) -> sha256，dat在整个精修过程中只计算一次
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _memo_hash(self, path):
+        st = os.stat(path)
+        sig = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        with self.lock:
+            digest = self._hash_memo.get(sig)
+        if digest is None:
+            digest = _file_sha256(path)
+            with self.lock:
+                self._hash_memo[sig] = digest
+        return digest
+
+    def make_key(self, pcr_path, dat_path, fullprof_path):
+        """缓存键：pcr全文 + dat内容哈希 + fp2k路径/大小/修改时间 + 缓存版本"""
+        fp_st = os.stat(fullprof_path)
+        h = hashlib.sha256()
+        h.update(json.dumps({
+            "version": CACHE_VERSION,
+            "dat": self._memo_hash(dat_path),
+            "fp2k": [os.path.abspath(fullprof_path), fp_st.st_size, fp_st.st_mtime_ns]
+        }, sort_keys=True).encode('utf-8'))
+        with open(pcr_path, 'rb') as f:
+            h.update(f.read())
+        return h.hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def restore(self, key, temp_dir, base_name):
+        """命中时把输出文件复制为 temp_dir/base_name.* 并返回 (success, error_info)，未命中返回None"""
+        entry = self._entry_dir(key)
+        meta_path = os.path.join(entry, "meta.json")
+        if not os.path.isfile(meta_path):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            for ext in meta.get("files", []):
+                shutil.copyfile(os.path.join(entry, "output" + ext), os.path.join(temp_dir, base_name + ext))
+            os.utime(meta_path)  # 记录最近使用时间，清理时优先删除最久未用的
+        except Exception:
+            return None
+        return meta["success"], meta["error_info"]
+
+    def store(self, key, temp_dir, base_name, success, error_info):
+        entry = self._entry_dir(key)
+        if os.path.isfile(os.path.join(entry, "meta.json")):
+            return
+        tmp = f"{entry}.tmp{os.getpid()}_{threading.get_ident()}"
+        try:
+            os.makedirs(tmp, exist_ok=True)
+            files = []
+            for ext in CACHED_EXTS:
+                src = os.path.join(temp_dir, base_name + ext)
+                if os.path.isfile(src):
+                    shutil.copyfile(src, os.path.join(tmp, "output" + ext))
+                    files.append(ext)
+            with open(os.path.join(tmp, "meta.json"), 'w', encoding='utf-8') as f:
+                json.dump({
+                    "success": success,
+                    "error_info": error_info,
+                    "files": files,
+                    "base_name": base_name,
+                    "created": time.strftime("%Y-%m-%d %H:%M:%S")
+                }, f, ensure_ascii=False, indent=2)
+            # 整个目录一次性改名，避免其他进程读到写了一半的缓存
+            os.replace(tmp, entry)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def prune(self):
+        """超过 max_entries 时删除最久未使用的缓存项；同时删除超过 TMP_MAX_AGE 的写入中断遗留目录"""
+        entries = []
+        now = time.time()
+        for sub in os.listdir(self.cache_dir):
+            sub_dir = os.path.join(self.cache_dir, sub)
+            if not os.path.isdir(sub_dir):
+                continue
+            for key in os.listdir(sub_dir):
+                if ".tmp" in key:
+                    # 上次中断时遗留的半成品；较新的可能是同一进程中其他worker正在写入的，不能删除
+                    path = os.path.join(sub_dir, key)
+                    try:
+                        if now - os.path.getmtime(path) > TMP_MAX_AGE:
+                            shutil.rmtree(path, ignore_errors=True)
+                    except OSError:
+                        pass
+                    continue
+                meta_path = os.path.join(sub_dir, key, "meta.json")
+                if os.path.isfile(meta_path):
+                    entries.append((os.path.getmtime(meta_path), os.path.join(sub_dir, key)))
+        if len(entries) <= self.max_entries:
+            return 0
+        entries.sort()
+        removed = entries[:len(entries) - self.max_entries]
+        for _, path in removed:
+            shutil.rmtree(path, ignore_errors=True)
+        return len(removed)
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
@@ -0,0 +1,214 @@
+'''2026.01
+根据历史批量精修的 AAA_step_overview.txt 统计每个步骤的表现，给出精简/调整顺序后的步骤方案：
+- 总是失败的步骤：删除
+- 总是超时/阻塞的步骤：删除
+- 从未改变Chi²的步骤：删除
+- 成功率较低的步骤：移到最后执行（前面的参数稳定后更容易成功）
+可在精修GUI中点击“优化步骤”使用，也可命令行运行：
+python Magia_Step_Optimizer.py 步骤配置.json 历史目录 [--apply]
+'''
+import os
+import re
+import sys
+import json
+from collections import OrderedDict
+
+OVERVIEW_FILE = "AAA_step_overview.txt"
+
+STEP_LINE_PATTERN = re.compile(r'^步骤\s+(\d+):\s*(.*?)(?:\s*\|\s*参数:\s*(.*?))?\s*\|\s*状态:\s*(\S+)\s*\|\s*耗时:\s*(\d+)s(.*)$')
+CHI_PATTERN = re.compile(r'Chi²:\s*([-\d.eE+]+)')
+TIMEOUT_KEYWORDS = ("超时", "阻塞")
+USER_SKIP_REASON = "用户主动跳过"
+PREFLIGHT_REASON = "预检失败"
+
+
+def parse_overview_file(path):
+    """解析 AAA_step_overview.txt，返回步骤列表
+    [{index, name, params, status, duration, reason, chi2, coarse}]，原因跨多行时（如PCR_check的多条报错）合并到同一步骤"""
+    entries = []
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        lines = f.read().splitlines()
+    current = None
+    for line in lines:
+        m = STEP_LINE_PATTERN.match(line)
+        if m:
+            index, name, params, status, duration, tail = m.groups()
+            reason = ""
+            chi2 = None
+            coarse = False
+            for part in tail.split(" | "):
+                part = part.strip()
+                if part.startswith("原因:"):
+                    reason = part[len("原因:"):].strip()
+                if part == "粗化数据":
+                    coarse = True
+                chi_m = CHI_PATTERN.match(part)
+                if chi_m:
+                    chi2 = float(chi_m.group(1))
+            current = {
+                "index": int(index),
+                "name": name.strip(),
+                "params": [p.strip() for p in params.split(",")] if params else [],
+                "status": status,
+                "duration": int(duration),
+                "reason": reason,
+                "chi2": chi2,
+                "coarse": coarse
+            }
+            entries.append(current)
+        elif line.startswith("-" * 10) or line.startswith("+" * 10) or line.startswith("本dat文件总耗时") or line.startswith("最后一次精修成功"):
+            current = None
+        elif current is not None and line.strip():
+            current["reason"] += "\n" + line.strip()
+    return entries
+
+
+def collect_history(root_dirs):
+    """递归查找目录下所有 AAA_step_overview.txt，每个文件对应一次dat精修"""
+    if isinstance(root_dirs, str):
+        root_dirs = [root_dirs]
+    runs = []
+    for root in root_dirs:
+        for dirpath, _, filenames in os.walk(root):
+            if OVERVIEW_FILE in filenames:
+                try:
+                    entries = parse_overview_file(os.path.join(dirpath, OVERVIEW_FILE))
+                except Exception as e:
+                    print(f"[概览读取错误] {dirpath}: {e}")
+                    continue
+                if entries:
+                    runs.append(entries)
+    return runs
+
+
+def _outcome(entry):
+    """归类单个步骤结果：success / timeout / fail / user / None（未运行）"""
+    status = entry["status"]
+    reason = entry.get("reason", "")
+    if status == "成功":
+        return "success"
+    if USER_SKIP_REASON in reason or reason.startswith(PREFLIGHT_REASON):
+        return "user"  # 预检失败的dat没有运行任何步骤，同样不计入
+    if status in ("失败", "跳过"):
+        return "timeout" if any(k in reason for k in TIMEOUT_KEYWORDS) else "fail"
+    return None
+
+
+def analyze_history(runs, chi_rel_tol=1e-3):
+    """按步骤名统计历史表现
+    返回 OrderedDict: 步骤名 -> {runs, success, fail, timeout, duration, wasted, chi_checked, chi_unchanged}"""
+    stats = OrderedDict()
+    for entries in runs:
+        prev_chi = None
+        prev_coarse = False
+        for entry in entries:
+            outcome = _outcome(entry)
+            if outcome is None or outcome == "user":
+                continue  # 用户主动跳过不代表步骤本身的好坏
+            s = stats.setdefault(entry["name"], {
+                "runs": 0, "success": 0, "fail": 0, "timeout": 0,
+                "duration": 0, "wasted": 0, "chi_checked": 0, "chi_unchanged": 0
+            })
+            s["runs"] += 1
+            s[outcome] += 1
+            s["duration"] += entry["duration"]
+            if outcome != "success":
+                s["wasted"] += entry["duration"]
+                continue
+            chi = entry.get("chi2")
+            if chi is None:
+                continue
+            if prev_coarse != entry.get("coarse", False):
+                prev_chi = None  # 粗化数据与完整数据的Chi²不可比
+            prev_coarse = entry.get("coarse", False)
+            if prev_chi is not None:
+                s["chi_checked"] += 1
+                if abs(chi - prev_chi) <= chi_rel_tol * max(abs(prev_chi), 1e-12):
+                    s["chi_unchanged"] += 1
+            prev_chi = chi
+    return stats
+
+
+def optimize_plan(steps, stats, min_runs=3, defer_below=0.5, chi_rel_tol=1e-3, n_runs=None):
+    """根据统计结果精简步骤
+    steps: 步骤配置中的 steps 列表
+    min_runs: 至少有这么多次历史记录才做判断
+    defer_below: 成功率低于此值（但不为0）的步骤移到最后
+    返回 (新步骤列表, 报告字典)"""
+    kept, deferred, removed = [], [], []
+    for step in steps:
+        name = step.get("name")
+        s = stats.get(name)
+        if not s or s["runs"] < min_runs:
+            kept.append(step)
+            continue
+        mean_duration = s["duration"] / s["runs"]
+        if s["timeout"] == s["runs"]:
+            removed.append((step, "总是超时/阻塞", mean_duration))
+        elif s["success"] == 0:
+            removed.append((step, "总是失败", mean_duration))
+        elif s["chi_checked"] >= min_runs and s["chi_unchanged"] == s["chi_checked"]:
+            removed.append((step, f"Chi²从未变化（相对变化≤{chi_rel_tol:g}）", mean_duration))
+        elif s["success"] / s["runs"] < defer_below:
+            deferred.append(step)
+        else:
+            kept.append(step)
+
+    if n_runs is None:
+        n_runs = max((s["runs"] for s in stats.values()), default=0)
+    total_per_run = sum(s["duration"] for s in stats.values()) / n_runs if n_runs else 0
+    saved_per_run = sum(d for _, _, d in removed)
+    report = {
+        "removed": [{"name": st.get("name"), "reason": r, "mean_duration": d} for st, r, d in removed],
+        "deferred": [st.get("name") for st in deferred],
+        "runs": n_runs,
+        "saved_per_run": saved_per_run,
+        "total_per_run": total_per_run,
+        "saved_ratio": saved_per_run / total_per_run if total_per_run else 0.0
+    }
+    return kept + deferred, report
+
+
+def format_report(report):
+    lines = [f"历史记录: {report['runs']} 个dat"]
+    if report["removed"]:
+        lines.append("删除的步骤:")
+        for r in report["removed"]:
+            lines.append(f"  - {r['name']}: {r['reason']}，平均耗时 {r['mean_duration']:.1f}s")
+    if report["deferred"]:
+        lines.append("移到最后的步骤（成功率较低）:")
+        for name in report["deferred"]:
+            lines.append(f"  - {name}")
+    if not report["removed"] and not report["deferred"]:
+        lines.append("没有需要调整的步骤")
+    lines.append(
+        f"预计每个dat节省 {report['saved_per_run']:.1f}s / {report['total_per_run']:.1f}s"
+        f"（{report['saved_ratio'] * 100:.1f}%）"
+    )
+    return "\n".join(lines)
+
+
+def optimize_step_file(stepcfg_path, history_dirs, apply=False, **kwargs):
+    """读取步骤配置并根据历史目录优化；apply=True 时保存为 *_optimized.json，返回 (新步骤, 报告, 保存路径或None)"""
+    with open(stepcfg_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    runs = collect_history(history_dirs)
+    stats = analyze_history(runs, chi_rel_tol=kwargs.get("chi_rel_tol", 1e-3))
+    new_steps, report = optimize_plan(data.get("steps", []), stats, n_runs=len(runs), **kwargs)
+    out_path = None
+    if apply:
+        out_path = os.path.splitext(stepcfg_path)[0] + "_optimized.json"
+        data["steps"] = new_steps
+        with open(out_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    return new_steps, report, out_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: Magia_Step_Optimizer.py <步骤配置.json> <历史目录> [--apply]")
+        sys.exit(1)
+    _, report, saved = optimize_step_file(sys.argv[1], sys.argv[2], apply="--apply" in sys.argv[3:])
+    print(format_report(report))
+    if saved:
+        print(f"已保存到 {saved}")
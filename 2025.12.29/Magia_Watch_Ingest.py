@@ -0,0 +1,137 @@
+'''2026.01
+批量精修的持续监视模式：实验过程中数据不断写入精修目录，批量精修跑完已有的dat后继续等待新的dat，
+写完后按自然排序加入队列依次精修（同一pcr模板/递归pcr模板两种策略都适用）。
+- 有watchdog时用Observer监听目录（与FP_Magia_Monitor相同），没有时每次poll扫描目录
+- 只监听精修目录本身（不递归，子目录中是各dat的步骤文件）
+- 文件大小和修改时间连续 SETTLE_SECONDS 秒不变、且能打开读取时才认为已经写完
+'''
+import os
+import time
+import threading
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+SETTLE_SECONDS = 5
+POLL_INTERVAL_MS = 2000
+
+
+class _DatEventHandler(FileSystemEventHandler):
+    def __init__(self, ingest):
+        self.ingest = ingest
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.ingest.notify(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.ingest.notify(event.src_path)
+
+    def on_moved(self, event):
+        # 采集软件常先写临时文件再改名为 .dat
+        if not event.is_directory:
+            self.ingest.notify(event.dest_path)
+
+
+class DatIngest:
+    def __init__(self, directory, known=(), sort_key=None, settle=SETTLE_SECONDS):
+        self.directory = os.path.abspath(directory)
+        self.seen = set(known)      # 已在队列中或已精修的文件名
+        self.sort_key = sort_key
+        self.settle = settle
+        self.lock = threading.Lock()
+        self._candidates = {}       # 文件名 -> None 或 ((大小, 修改时间), 该状态首次出现的时间)
+        self.observer = None
+        self.stopped = False
+
+    def start(self):
+        """开始监视，返回监视方式（watchdog/轮询）"""
+        if Observer is not None:
+            try:
+                observer = Observer()
+                observer.schedule(_DatEventHandler(self), self.directory, recursive=False)
+                observer.start()
+                self.observer = observer
+            except Exception:
+                self.observer = None
+        self._scan()  # 开始监视前已经出现、但不在known中的文件
+        return "watchdog" if self.observer is not None else "轮询"
+
+    def notify(self, path):
+        path = os.path.abspath(path)
+        if os.path.dirname(path) != self.directory:
+            return
+        name = os.path.basename(path)
+        if not name.lower().endswith('.dat'):
+            return
+        with self.lock:
+            if name not in self.seen and name not in self._candidates:
+                self._candidates[name] = None
+
+    def _scan(self):
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.is_file():
+                        self.notify(entry.path)
+        except Exception:
+            pass
+
+    @staticmethod
+    def _readable(path):
+        try:
+            with open(path, 'rb') as f:
+                f.read(1)
+            return True
+        except OSError:
+            return False  # Windows上正在写入的文件可能被独占
+
+    def poll(self):
+        """由GUI定时调用：返回新近写完的文件名（自然排序）"""
+        if self.stopped:
+            return []
+        if self.observer is None:
+            self._scan()
+        now = time.time()
+        ready = []
+        with self.lock:
+            items = list(self._candidates.items())
+        for name, state in items:
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                with self.lock:
+                    self._candidates.pop(name, None)  # 已被删除或改名
+                continue
+            sig = (st.st_size, st.st_mtime_ns)
+            if st.st_size == 0 or state is None or state[0] != sig:
+                with self.lock:
+                    self._candidates[name] = (sig, now)
+                continue
+            if now - state[1] >= self.settle and self._readable(path):
+                ready.append(name)
+        with self.lock:
+            for name in ready:
+                self._candidates.pop(name, None)
+                self.seen.add(name)
+        return sorted(ready, key=self.sort_key)
+
+    def pending_count(self):
+        with self.lock:
+            return len(self._candidates)
+
+    def stop(self):
+        self.stopped = True
+        if self.observer is not None:
+            try:
+                self.observer.stop()
+                self.observer.join(timeout=2)
+            except Exception:
+                pass
+            self.observer = None
@@ -0,0 +1,63 @@
+'''2026.01
+RunawayDetector 回归测试：python -m pytest test_limit_rules.py
+'''
+from Magia_Limit_Rules import CompiledLimits, RunawayDetector
+
+DOC = {
+    "params": {
+        "li1_occ_1": {"line": 1, "position": 0, "phase": 1},
+        "ni1_occ_1": {"line": 1, "position": 1, "phase": 1},
+    },
+    "rules": [
+        {"type": "sum", "params": ["li1_occ", "ni1_occ"], "min": 0.99, "max": 1.01, "phase": 1},
+        {"type": "range", "param": "*_occ", "min": 0, "max": 1},
+    ],
+}
+HEADER = "   No.      Code-Name      Old-Value      Change      New-Value      Sigma"
+
+
+def _detector():
+    limits = CompiledLimits(DOC)
+    baseline = [None] * len(limits.slot_names)
+    baseline[limits.slot_index["li1_occ_1"]] = 0.5
+    baseline[limits.slot_index["ni1_occ_1"]] = 0.5
+    return RunawayDetector(limits, baseline)
+
+
+def _cycle(li, ni):
+    return [
+        HEADER,
+        f"    1      Occ_Li1_ph1     0.5      {li - 0.5:.3f}      {li:.3f}      0.01",
+        f"    2      Occ_Ni1_ph1     0.5      {ni - 0.5:.3f}      {ni:.3f}      0.01",
+        "",
+        " => Cycle finished",
+    ]
+
+
+def test_coupled_occupancy_not_runaway():
+    # Li 0.5 -> 0.6 先于 Ni 0.5 -> 0.4 输出，中间的和为1.1，不应判定失控
+    detector = _detector()
+    assert not any(detector.feed(line) for line in _cycle(0.6, 0.4))
+    assert detector.reason is None
+
+
+def test_sum_violation_after_cycle():
+    detector = _detector()
+    results = [detector.feed(line) for line in _cycle(0.6, 0.5)]
+    assert results[-1] and not any(results[:-1])
+    assert "sum(" in detector.reason
+
+
+def test_range_checked_per_line():
+    detector = _detector()
+    assert detector.feed(_cycle(1.2, -0.2)[1])
+    assert "li1_occ_1" in detector.reason
+
+
+def test_sources_do_not_interrupt_each_other():
+    detector = _detector()
+    lines = _cycle(0.6, 0.4)
+    assert not detector.feed(lines[1], source="a.out")
+    assert not detector.feed(" Some console output")
+    assert not detector.feed(lines[2], source="a.out")
+    assert not detector.finish()
@@ -1,8 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from threading import Thread
+import queue
 from watchdog.observers import Observer
-from core_EnhancedHandler import EnhancedHandler
+from core_EnhancedHandler import EnhancedHandler, BatchEnhancedHandler
 from config_parameters import OPTIMIZED_RULES
 import os
 import time
@@ -20,6 +21,10 @@ class MonitorGUI(tk.Tk):
         self.handler = None
         self.monitor_thread = None
         self.running = False
+        self.closing_thread = None
+        # 日志可能来自watchdog/处理线程，先放入队列，由主线程定时取出写入界面（tkinter不是线程安全的）
+        self._log_queue = queue.Queue()
+        self.after(100, self._drain_log)
 
     def _create_widgets(self):
         # 新增时间间隔设置
@@ -32,6 +37,14 @@ class MonitorGUI(tk.Tk):
         self.interval_entry.grid(row=0, column=1, padx=5, sticky=tk.W)
         ttk.Button(config_frame, text="设置间隔", command=self.set_interval).grid(row=0, column=2, padx=5)
 
+        # 批量目录模式：递归监控批量精修输出目录，每个子目录独立记录
+        self.batch_mode = tk.BooleanVar(value=False)
+        ttk.Checkbutton(config_frame, text="批量目录模式（递归监控子目录）", variable=self.batch_mode).grid(row=0, column=3, padx=5, sticky=tk.W)
+        ttk.Label(config_frame, text="并行处理数:").grid(row=0, column=4, padx=5, sticky=tk.W)
+        self.workers_spin = ttk.Spinbox(config_frame, from_=1, to=64, width=5)
+        self.workers_spin.set(16)
+        self.workers_spin.grid(row=0, column=5, padx=5, sticky=tk.W)
+
         """创建界面组件"""
         # 输入区域
         input_frame = ttk.LabelFrame(self, text="参数设置")
@@ -48,7 +61,10 @@ class MonitorGUI(tk.Tk):
         3. 点击【开始监控】启动精修数据抓取。
         4. 执行FullProf精修操作，结果将自动记录。
         5. 点击【停止监控】结束程序，可能有些卡顿，强制结束也行....
-        6. 日志文件保存在监控目录下的refinement_log.txt
+        6. 抓取结果逐步写入监控目录下的refinement_log.jsonl（每行一个步骤的JSON记录），
+           停止监控时自动导出同名的refinement_log.csv（每列一个参数，便于绘制趋势图）
+        7. 勾选【批量目录模式】后选择批量精修的根目录，将递归监控每个dat的子目录，
+           每个子目录独立计步，结果保存在各自子目录下的refinement_log.jsonl/.csv
         
         注意事项：
 
@@ -58,7 +74,7 @@ class MonitorGUI(tk.Tk):
 
         - 根据运行Fullprof的实际情况设置抓取时间间隔（5-15s）太短会重复抓取，太长等待时间较久。
 
-        - 监控目录下原有的的refinement_log.txt文件会被覆盖！运行前务必先保存数据！
+        - 监控目录下原有的的refinement_log.jsonl/.csv文件会被覆盖！运行前务必先保存数据！
 
         - 目前功能只能监控单相TOF文件。
         """
@@ -145,17 +161,34 @@ class MonitorGUI(tk.Tk):
             return
 
         try:
-            output_path = os.path.join(self.current_dir, "refinement_log.txt")
-            self.handler = EnhancedHandler(
-                output_path=output_path,
-                param_rules=OPTIMIZED_RULES,
-                atom_names=self.atom_names,
-                log_callback=self.log,  # 新增日志回调
-                check_interval=self.check_interval
-            )
+            recursive = self.batch_mode.get()
+            if recursive:
+                try:
+                    max_workers = max(1, int(self.workers_spin.get()))
+                except ValueError:
+                    max_workers = 16
+                self.handler = BatchEnhancedHandler(
+                    root_dir=self.current_dir,
+                    output_name="refinement_log.jsonl",
+                    param_rules=OPTIMIZED_RULES,
+                    atom_names=self.atom_names,
+                    log_callback=self.log,
+                    check_interval=self.check_interval,
+                    max_workers=max_workers
+                )
+            else:
+                output_path = os.path.join(self.current_dir, "refinement_log.jsonl")
+                self.handler = EnhancedHandler(
+                    output_path=output_path,
+                    param_rules=OPTIMIZED_RULES,
+                    atom_names=self.atom_names,
+                    log_callback=self.log,  # 新增日志回调
+                    check_interval=self.check_interval,
+                    run_name=os.path.basename(os.path.normpath(self.current_dir))
+                )
             
             self.observer = Observer()
-            self.observer.schedule(self.handler, self.current_dir, recursive=False)
+            self.observer.schedule(self.handler, self.current_dir, recursive=recursive)
             
             self.monitor_thread = Thread(target=self._start_observer)
             self.monitor_thread.daemon = True
@@ -164,7 +197,7 @@ class MonitorGUI(tk.Tk):
             self.running = True
             self.start_btn.config(state=tk.DISABLED)
             self.stop_btn.config(state=tk.NORMAL)
-            self.log("监控已启动！")
+            self.log("监控已启动！" + ("（批量目录模式）" if recursive else ""))
         except Exception as e:
             self.log(f"启动失败：{str(e)}")
             messagebox.showerror("错误", f"监控启动失败：{str(e)}")
@@ -181,19 +214,51 @@ class MonitorGUI(tk.Tk):
             self.observer.join()
 
     def stop_monitoring(self):
-        """停止监控"""
+        """停止监控：等待排队结果写入和导出CSV在后台线程中完成，界面不卡顿"""
         if self.observer:
             self.observer.stop()
         self.running = False
-        self.start_btn.config(state=tk.NORMAL)
         self.stop_btn.config(state=tk.DISABLED)
+        handler, self.handler = self.handler, None
+        self.log("正在停止监控，等待已排队的结果写入...")
+        # 非守护线程：直接关闭窗口时解释器也会等写入完成
+        self.closing_thread = Thread(target=self._close_handler, args=(handler,))
+        self.closing_thread.start()
+        self.after(200, self._finish_stop)
+
+    def _close_handler(self, handler):
+        if handler is None:
+            return
+        try:
+            handler.close()  # 落盘并导出CSV
+        except Exception as e:
+            self.log(f"关闭失败：{str(e)}")
+
+    def _finish_stop(self):
+        if self.closing_thread is not None and self.closing_thread.is_alive():
+            self.after(200, self._finish_stop)
+            return
+        self.closing_thread = None
+        self.start_btn.config(state=tk.NORMAL)
         self.log("监控已停止")
 
 
     def log(self, message):
-        """记录日志信息"""
+        """记录日志信息（任意线程均可调用）"""
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        self.status_text.config(state=tk.NORMAL)
-        self.status_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.status_text.see(tk.END)
-        self.status_text.config(state=tk.DISABLED)
+        self._log_queue.put(f"[{timestamp}] {message}\n")
+
+    def _drain_log(self):
+        """主线程中把队列里的日志写入界面"""
+        lines = []
+        try:
+            while True:
+                lines.append(self._log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if lines:
+            self.status_text.config(state=tk.NORMAL)
+            self.status_text.insert(tk.END, "".join(lines))
+            self.status_text.see(tk.END)
+            self.status_text.config(state=tk.DISABLED)
+        self.after(100, self._drain_log)
@@ -1,54 +1,96 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from watchdog.events import FileSystemEventHandler
 from core_RefinementProcessor import RefinementProcessor
-from background_extract import BackgroundExtractor
+from core_resultsink import ResultSink
 
 class EnhancedHandler(FileSystemEventHandler):
-    def __init__(self, output_path, param_rules, atom_names, log_callback, check_interval):
+    def __init__(self, output_path, param_rules, atom_names, log_callback, check_interval, run_name=""):
         self.output_path = output_path
-        if os.path.exists(output_path):
-            os.remove(output_path)
+        self.sink = ResultSink(output_path, run=run_name)  # 结构化输出，旧文件会被覆盖
         self.processor = RefinementProcessor(param_rules, atom_names, check_interval)
         self.log_callback = log_callback
+        self.closed = False
 
     def on_modified(self, event):
-        if event.src_path.endswith(".sum"):
+        if self.closed:
+            return  # 停止监控后observer可能还会送来事件
+        if not event.is_directory and event.src_path.endswith(".sum"):
             if result := self.processor.process_sum_file(event.src_path):
                 self._write_log(result)
                 self.log_callback(f"✅ Step {result['step']} 抓取成功 (含{len(result['atoms'])}种原子参数)")
 
     def _write_log(self, data):
         try:
-            with open(self.output_path, 'a', encoding='utf-8') as f:
-                f.write(f"\n{'='*50}\nStep: {data['step']}\n")
-                f.write(f"Chi² = {data['chi2']}, Rwp = {data['rwp']}%\n\n")
-                
-                f.write("【常规参数】\n")
-                for param, values in data['params'].items():
-                    f.write(f"{param:<10}  {', '.join(map(str, values))}\n")
-                
-                f.write("\n【原子参数】\n")
-                for atom, instances in data['atoms'].items():
-                    if not instances:
-                        continue
-                    f.write(f"● {atom}\n")
-                    for idx, values in enumerate(instances, 1):
-                        f.write(f"")
-                        for k, v in values.items():
-                            parts = v.split()
-                            if len(parts) > 1 and float(parts[1]) != 0:
-                                f.write(f"  {k:<8}  {v}\n")
-                            else:
-                                f.write(f"")
-                    f.write("\n")
-                # 新增背底数据写入
-                if data.get('background'):
-                    f.write("\n【背底参数】\n")
-                    #f.write("手动插值背底点个数：{number_of_background}，修正个数：{refinement_background}\n")
-                    for row in data['background']:
-                        f.write(f"{row[0]:>12}  {row[1]:>12}  {row[2]:>12}\n")
-                
-                f.write(f"{'='*50}\n")
-        
+            self.sink.write(data)
         except Exception as e:
-            print(f"[日志错误] {str(e)}")
\ No newline at end of file
+            print(f"[日志错误] {str(e)}")
+
+    def close(self):
+        """落盘并导出CSV"""
+        self.closed = True
+        self.sink.close()
+
+
+class BatchEnhancedHandler(FileSystemEventHandler):
+    """批量目录监控：递归监控批量精修根目录，每个子目录（一个dat的精修）独立一个处理器、步骤序号和日志文件"""
+
+    def __init__(self, root_dir, output_name, param_rules, atom_names, log_callback, check_interval, max_workers=16):
+        self.root_dir = os.path.abspath(root_dir)
+        self.output_name = output_name
+        self.param_rules = param_rules
+        self.atom_names = atom_names
+        self.log_callback = log_callback
+        self.check_interval = check_interval
+        self.runs = {}          # 运行目录 -> (EnhancedHandler, 串行锁)
+        self._pending = set()   # 已排队尚未开始处理的 .sum 路径，避免重复事件堆积
+        self._lock = threading.Lock()
+        self._closed = False
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def on_modified(self, event):
+        if event.is_directory or not event.src_path.endswith(".sum"):
+            return
+        sum_path = os.path.abspath(event.src_path)
+        with self._lock:
+            if self._closed:
+                return  # 已停止监控，线程池已关闭，不再提交
+            if sum_path in self._pending:
+                return
+            self._pending.add(sum_path)
+            handler, run_lock = self._get_run(os.path.dirname(sum_path))
+        self.pool.submit(self._process, handler, run_lock, event, sum_path)
+
+    def _get_run(self, run_dir):
+        if run_dir not in self.runs:
+            run_name = os.path.relpath(run_dir, self.root_dir)
+            handler = EnhancedHandler(
+                output_path=os.path.join(run_dir, self.output_name),
+                param_rules=self.param_rules,
+                atom_names=self.atom_names,
+                log_callback=lambda msg, name=run_name: self.log_callback(f"[{name}] {msg}"),
+                check_interval=self.check_interval,
+                run_name=run_name
+            )
+            self.runs[run_dir] = (handler, threading.Lock())
+            self.log_callback(f"发现新的精修目录：{run_name}")
+        return self.runs[run_dir]
+
+    def _process(self, handler, run_lock, event, sum_path):
+        # 同一目录的步骤串行处理，保证步骤序号与写入顺序一致
+        with run_lock:
+            with self._lock:
+                self._pending.discard(sum_path)
+            try:
+                handler.on_modified(event)
+            except Exception as e:
+                self.log_callback(f"处理失败：{sum_path}：{str(e)}")
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        # 等待已排队的 .sum 全部处理完再落盘导出，否则最后几步会丢失
+        self.pool.shutdown(wait=True)
+        for handler, _ in list(self.runs.values()):
+            handler.close()
@@ -1,8 +1,63 @@
 import re
 from core_enhancedfilevalidator import EnhancedFileValidator
-from core_parasparser import extract_atom_parameters
+import os
+from core_parasparser import extract_atom_parameters, parse_out_esds
 from config_parameters import PARAM_MAP, OPTIMIZED_RULES
 from background_extract import BackgroundExtractor
+from core_tailreader import TailReader
+
+CHI2_PATTERN = re.compile(r"Global user-weigthed Chi2 \(Bragg contrib\.\):\s+(\d+\.?\d*)")
+RWP_PATTERN = re.compile(r"Rwp:\s+(\d+\.\d+)")
+
+class RuleMatcher:
+    """将参数规则表编译为单个正则，一次扫描整个pcr文本，按行号输出(规则, 行号)命中"""
+
+    def __init__(self, param_rules):
+        self.keys = list(param_rules)
+        self.order = {key: i for i, key in enumerate(self.keys)}
+        # 长的关键字优先，同一位置只能命中一个分支，前缀关键字在 prefixes 中补齐
+        alternation = '|'.join(re.escape(k) for k in sorted(self.keys, key=len, reverse=True))
+        self.pattern = re.compile(alternation) if self.keys else None
+        self.prefixes = {
+            key: [other for other in self.keys if other != key and key.startswith(other)]
+            for key in self.keys
+        }
+        # 预筛选：每个关键字取一个标志字符，只有含标志字符的行才可能命中，纯数值行直接跳过
+        marks = sorted({self._mark_char(k) for k in self.keys})
+        self.candidate_lines = re.compile(
+            rf"^.*[{''.join(re.escape(c) for c in marks)}].*$", re.M
+        ) if marks else None
+
+    @staticmethod
+    def _mark_char(key):
+        # 优先取字母（排除科学计数法中的E/e），其次取第一个非空白字符
+        for ch in key:
+            if ch.isalpha() and ch not in 'Ee':
+                return ch
+        stripped = key.strip()
+        return stripped[0] if stripped else key[0]
+
+    def iter_hits(self, content):
+        """按 (行号, 规则表顺序) 返回 (规则, 行号) 列表，与逐行逐规则的 `param in line` 结果一致"""
+        if self.pattern is None:
+            return []
+        hits = []
+        line_num, last_pos = 0, 0
+        for cand in self.candidate_lines.finditer(content):
+            line_num += content.count('\n', last_pos, cand.start())
+            last_pos = cand.start()
+            line = cand.group(0)
+            found = set()
+            # 逐个起始位置重新搜索，保证相邻/重叠的关键字（如 " a " 与 " b "）都能命中
+            m = self.pattern.search(line)
+            while m:
+                key = m.group(0)
+                found.add(self.order[key])
+                found.update(self.order[other] for other in self.prefixes[key])
+                m = self.pattern.search(line, m.start() + 1)
+            hits.extend((line_num, rule_idx) for rule_idx in sorted(found))
+        return [(self.keys[rule_idx], line_num) for line_num, rule_idx in hits]
+
 
 class RefinementProcessor:
     def __init__(self, param_rules, atom_names, check_interval):
@@ -10,21 +65,34 @@ class RefinementProcessor:
         self.param_rules = param_rules
         self.atom_names = atom_names
         self.validator = EnhancedFileValidator(check_interval)
+        self.matcher = RuleMatcher(param_rules)
+        self.tail = TailReader()
+        self.sum_results = {}  # .sum路径 -> 已解析到的 chi2/rwp
     
     def process_sum_file(self, sum_path):
         if not self.validator.is_valid_modification(sum_path):
             return None
         
         try:
-            with open(sum_path, 'r', errors='ignore') as f:
-                content = f.read()
+            # 只读取新追加的部分；校验器已确认大小和修改时间稳定，最后一行没有换行符也读出
+            content, full = self.tail.read(sum_path, settled=True)
         except Exception as e:
             print(f"[错误] 文件读取失败: {str(e)}")
             return None
         
-        chi2_match = re.search(r"Global user-weigthed Chi2 \(Bragg contrib\.\):\s+(\d+\.?\d*)", content)
-        rwp_match = re.search(r"Rwp:\s+(\d+\.\d+)", content)
-        if not chi2_match or not rwp_match:
+        # 与全量 re.search 一致：记录文件中首次出现的值，文件被重写时重新解析
+        found = self.sum_results.get(sum_path)
+        if full or found is None:
+            found = self.sum_results[sum_path] = {"chi2": None, "rwp": None}
+        if found["chi2"] is None:
+            chi2_match = CHI2_PATTERN.search(content)
+            if chi2_match:
+                found["chi2"] = chi2_match.group(1)
+        if found["rwp"] is None:
+            rwp_match = RWP_PATTERN.search(content)
+            if rwp_match:
+                found["rwp"] = rwp_match.group(1)
+        if found["chi2"] is None or found["rwp"] is None:
             return None
         
         pcr_path = sum_path.replace(".sum", ".pcr")
@@ -37,14 +105,25 @@ class RefinementProcessor:
         except Exception as e:
             print(f"[警告] 原子参数提取失败: {str(e)}")
         
+        # ESD只在 .out 的参数表中（pcr中只有数值和精修码）
+        esds = {}
+        out_path = sum_path.replace(".sum", ".out")
+        if os.path.exists(out_path):
+            try:
+                with open(out_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    esds = parse_out_esds(f.read())
+            except Exception as e:
+                print(f"[警告] ESD读取失败: {str(e)}")
+
         # 生成结果后递增step计数器
         result = {
             "step": self.step_counter,
-            "chi2": chi2_match.group(1),
-            "rwp": rwp_match.group(1),
+            "chi2": found["chi2"],
+            "rwp": found["rwp"],
             "params": self._extract_parameters(pcr_content),
             "atoms": atom_params,
-            "background": background  # 新增背底数据
+            "background": background,  # 新增背底数据
+            "esds": esds
         }
         self.step_counter += 1  # 正确递增计数器
         return result
@@ -52,23 +131,25 @@ class RefinementProcessor:
     def _extract_parameters(self, pcr_content):
         params = {}
         lines = pcr_content.split('\n')
-        
-        for line_num, line in enumerate(lines):
-            for param, rules in self.param_rules.items():
-                if param in line:
-                    values = []
-                    for rule in rules:
-                        try:
-                            target_line = line_num + rule['row_offset']
-                            cols = re.split(r'\s+', lines[target_line].strip())
-                            value = cols[rule['col_offset']]
-                            if self._is_valid_value(value):
-                                values.append(float(value))
-                        except (IndexError, ValueError):
-                            continue
-                    
-                    if len(values) >= rule.get('min_values', 2):
-                        params[param] = values
+        split_cache = {}  # 行号 -> 已拆分的列，同一行只拆分一次
+
+        for param, line_num in self.matcher.iter_hits(pcr_content):
+            rules = self.param_rules[param]
+            values = []
+            for rule in rules:
+                try:
+                    target_line = line_num + rule['row_offset']
+                    cols = split_cache.get(target_line)
+                    if cols is None:
+                        cols = split_cache[target_line] = lines[target_line].split()
+                    value = cols[rule['col_offset']]
+                    if self._is_valid_value(value):
+                        values.append(float(value))
+                except (IndexError, ValueError):
+                    continue
+
+            if len(values) >= rules[-1].get('min_values', 2):
+                params[param] = values
         return params
 
     @staticmethod
@@ -1,7 +1,6 @@
 #文件解析与验证
 import os
 import time
-import hashlib
 import threading
 
 class EnhancedFileValidator:
@@ -21,28 +20,28 @@ class EnhancedFileValidator:
                 if stat.st_size == 0:
                     return False
 
-                hashes = []
-                with open(file_path, 'rb') as f:
-                    for _ in range(5):
-                        f.seek(0)
-                        hashes.append(hashlib.md5(f.read()).hexdigest())
-                        time.sleep(1)
+                # 用 (大小, 修改时间) 判断写入是否稳定，不再反复全量读取文件计算哈希
+                signatures = []
+                for _ in range(5):
+                    stat = os.stat(file_path)
+                    signatures.append((stat.st_size, stat.st_mtime_ns))
+                    time.sleep(1)
                 
-                if len(set(hashes)) != 1:
+                if len(set(signatures)) != 1:
                     return False
 
-                current_hash = hashes[0]
+                current_sig = signatures[0]
                 
                 if file_path not in self.file_versions:
-                    self.file_versions[file_path] = (current_hash, time.time())
+                    self.file_versions[file_path] = (current_sig, time.time())
                     return True
                 
-                last_hash, last_time = self.file_versions[file_path]
+                last_sig, last_time = self.file_versions[file_path]
                 if (time.time() - last_time) < 5:
                     return False
                 
-                if current_hash != last_hash:
-                    self.file_versions[file_path] = (current_hash, time.time())
+                if current_sig != last_sig:
+                    self.file_versions[file_path] = (current_sig, time.time())
                     return True
                 
                 return False
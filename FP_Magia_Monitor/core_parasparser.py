@@ -3,6 +3,14 @@ import re
 from collections import defaultdict
 from config_parameters import PARAM_MAP
 
+PHASE_PATTERN = re.compile(r'!\s*Data for PHASE number:\s*(\d+)', re.IGNORECASE)
+# .out 中每个精修循环的参数表行：序号  符号名  旧值  变化量  新值  sigma
+_NUM = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[EeDd][-+]?\d+)?'
+OUT_PARAM_LINE = re.compile(
+    r'^\s*\d+\s+(?P<name>[A-Za-z][\w\-.()]*)\s+' + _NUM + r'\s+' + _NUM + r'\s+(?P<new>' + _NUM + r')\s+(?P<sigma>' + _NUM + r')',
+    re.M
+)
+
 def parse_atom_block(block):
     """解析并过滤无效参数"""
     results = {}
@@ -23,29 +31,101 @@ def parse_atom_block(block):
     
     return results if has_valid else None  # 返回None表示无效数据
 
+def _header_nt_column(line):
+    """从 !Atom Typ X Y Z Biso Occ In Fin N_t ... 表头中定位 N_t 列，找不到返回None"""
+    tokens = line.lstrip('!').split()
+    if len(tokens) < 2 or tokens[0] != 'Atom' or tokens[1] != 'Typ':
+        return None
+    return tokens.index('N_t') if 'N_t' in tokens else -1
+
+def _is_anisotropic(tokens, nt_col, rows):
+    """N_t=2 表示该原子使用各向异性beta，记录占4行；表头缺少N_t时退回检查第3行是否为6个数值"""
+    if nt_col is not None and nt_col >= 0 and nt_col < len(tokens):
+        try:
+            return int(float(tokens[nt_col])) == 2
+        except ValueError:
+            pass
+    if len(rows) > 2:
+        beta = rows[2].split()
+        if len(beta) == 6:
+            try:
+                [float(x) for x in beta]
+                return True
+            except ValueError:
+                return False
+    return False
+
 def extract_atom_parameters(pcr_content, atom_names):
+    """单次遍历：按行首词查原子名，按所属phase及表头N_t区分各向同性(2行)/各向异性(4行)记录"""
     lines = [line.strip() for line in pcr_content.split('\n') if line.strip()]
-    atom_patterns = {name: re.compile(rf"^{re.escape(name)}\s+") for name in atom_names}
-    
+    atom_set = set(atom_names)
+
     results = defaultdict(list)
+    phase = None
+    nt_col = None  # 当前phase原子表头中N_t所在列
     current_line = 0
-    
+
     while current_line < len(lines):
-        matched = False
-        for atom, pattern in atom_patterns.items():
-            if pattern.match(lines[current_line]):
-                block = []
-                for offset in range(4):
-                    idx = current_line + offset
-                    block.append(re.split(r'\s+', lines[idx]) if idx < len(lines) else [])
-                
-                parsed = parse_atom_block(block)
-                if parsed:  # 只保留有效数据
-                    results[atom].append(parsed)
-                current_line += 4
-                matched = True
-                break
-        if not matched:
+        line = lines[current_line]
+        if line.startswith('!'):
+            m = PHASE_PATTERN.match(line)
+            if m:
+                phase = int(m.group(1))
+                nt_col = None
+            else:
+                col = _header_nt_column(line)
+                if col is not None:
+                    nt_col = col
             current_line += 1
-    
-    return dict(results)
\ No newline at end of file
+            continue
+
+        tokens = line.split()
+        if tokens[0] not in atom_set:
+            current_line += 1
+            continue
+
+        # 记录的后续行跳过夹在中间的注释行
+        row_indices = [current_line]
+        idx = current_line + 1
+        while len(row_indices) < 4 and idx < len(lines):
+            if not lines[idx].startswith('!'):
+                row_indices.append(idx)
+            idx += 1
+        n_rows = 4 if _is_anisotropic(tokens, nt_col, [lines[i] for i in row_indices]) else 2
+        row_indices = row_indices[:n_rows]
+        block = [tokens] + [lines[i].split() for i in row_indices[1:]]
+
+        parsed = parse_atom_block(block)
+        if parsed:  # 只保留有效数据
+            parsed['phase'] = phase
+            results[tokens[0]].append(parsed)
+        current_line = row_indices[-1] + 1
+
+    return dict(results)
+
+def parse_out_esds(out_content):
+    """读取 .out 参数表中的ESD，返回 {FullProf符号名: ESD}，后面循环的值覆盖前面的（即最后一个循环）"""
+    esds = {}
+    for m in OUT_PARAM_LINE.finditer(out_content):
+        try:
+            esds[m.group('name')] = float(m.group('sigma').replace('D', 'E').replace('d', 'e'))
+        except ValueError:
+            continue
+    return esds
+
+def split_symbol(symbol):
+    """FullProf符号名 -> (参数名小写, 原子名, phase)，如 Biso_Li1_ph1 -> ('biso', 'Li1', 1)，
+    Cell_A_ph1_pat1 -> ('a', None, 1)，Scale_ph1_pat1 -> ('scale', None, 1)"""
+    phase = None
+    rest = []
+    for token in symbol.split('_'):
+        m = re.fullmatch(r'ph(\d+)', token, re.IGNORECASE)
+        if m:
+            phase = int(m.group(1))
+        elif not re.fullmatch(r'pat\d+', token, re.IGNORECASE):
+            rest.append(token)
+    if not rest:
+        return symbol.lower(), None, phase
+    if rest[0].lower() == 'cell' and len(rest) > 1:
+        return rest[1].lower(), None, phase
+    return rest[0].lower(), (rest[1] if len(rest) > 1 else None), phase
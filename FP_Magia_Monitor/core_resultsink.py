@@ -0,0 +1,213 @@
+#结构化抓取结果输出（JSON Lines + 列式CSV导出）
+import os
+import csv
+import json
+import time
+import threading
+from core_parasparser import split_symbol
+
+BASE_COLUMNS = ["run", "step", "time", "chi2", "rwp"]
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _value_code(text, esd=None):
+    """原子参数 'value code' 字符串 -> {"value", "esd", "code"}，N/A 返回None"""
+    parts = str(text).split()
+    if not parts or parts[0] == 'N/A':
+        return None
+    return {
+        "value": _to_float(parts[0]),
+        "esd": esd,
+        "code": _to_float(parts[1]) if len(parts) > 1 else None
+    }
+
+
+def _index_esds(esds):
+    """{FullProf符号名: ESD} -> ({参数名: ESD}, {(原子名, 参数名, phase): ESD})"""
+    by_param, by_atom = {}, {}
+    for symbol, esd in (esds or {}).items():
+        name, atom, phase = split_symbol(symbol)
+        if atom is None:
+            by_param.setdefault(name, esd)  # 多个phase同名参数时取第一个（pcr中的参数也只抓取一个值）
+        else:
+            by_atom[(atom.lower(), name, phase)] = esd
+    return by_param, by_atom
+
+
+def make_record(result, run=""):
+    """将 RefinementProcessor 的抓取结果转换为固定结构的记录
+    数值与精修码（code）来自pcr，ESD来自同名 .out 最后一个循环的参数表（未精修的参数ESD为None），
+    .out 中全部参数的ESD按FullProf符号名另存于 esds"""
+    esds = result.get('esds') or {}
+    esd_param, esd_atom = _index_esds(esds)
+    params = {}
+    for name, values in (result.get('params') or {}).items():
+        name = name.strip()
+        params[name] = {
+            "value": values[0] if len(values) > 0 else None,
+            "esd": esd_param.get(name.lower()),
+            "code": values[1] if len(values) > 1 else None
+        }
+
+    atoms = {}
+    for atom, instances in (result.get('atoms') or {}).items():
+        rows = []
+        for inst in instances:
+            row = {"phase": inst.get('phase')}
+            for key, text in inst.items():
+                if key == 'phase':
+                    continue
+                row[key] = _value_code(text, esd_atom.get((atom.lower(), key.lower().replace('beta', 'b'), inst.get('phase')))
+                                       or esd_atom.get((atom.lower(), key.lower(), inst.get('phase'))))
+            rows.append(row)
+        atoms[atom] = rows
+
+    background = [
+        {"pos": _to_float(r[0]), "intensity": _to_float(r[1]), "code": _to_float(r[2])}
+        for r in (result.get('background') or [])
+    ]
+
+    return {
+        "run": run,
+        "step": result.get('step'),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "chi2": _to_float(result.get('chi2')),
+        "rwp": _to_float(result.get('rwp')),
+        "params": params,
+        "atoms": atoms,
+        "background": background,
+        "esds": esds
+    }
+
+
+def flatten_record(record):
+    """记录展开为一行：参数 -> name / name_esd / name_code，
+    原子 -> atom_ph<phase>_param / _esd / _code（同名原子在不同phase中不会互相覆盖），
+    背底 -> bg_<pos>，没有位置的背底点为 bg_#<序号>"""
+    row = {key: record.get(key) for key in BASE_COLUMNS}
+    for name, vc in record.get('params', {}).items():
+        row[name] = vc.get('value')
+        row[f"{name}_esd"] = vc.get('esd')
+        row[f"{name}_code"] = vc.get('code')
+    for atom, instances in record.get('atoms', {}).items():
+        for inst in instances:
+            phase = inst.get('phase')
+            prefix = f"{atom}_ph{phase}" if phase is not None else atom
+            for key, vc in inst.items():
+                if key == 'phase' or vc is None:
+                    continue
+                row[f"{prefix}_{key}"] = vc.get('value')
+                row[f"{prefix}_{key}_esd"] = vc.get('esd')
+                row[f"{prefix}_{key}_code"] = vc.get('code')
+    for i, bg in enumerate(record.get('background', [])):
+        pos = bg.get('pos')
+        row[f"bg_{pos:.4f}" if pos is not None else f"bg_#{i + 1}"] = bg.get('intensity')
+    return row
+
+
+def load_columns(jsonl_path):
+    """读取JSON Lines为列式字典 {列名: [值...]}，缺失处为None，便于直接绘制趋势图"""
+    columns = {key: [] for key in BASE_COLUMNS}
+    n_rows = 0
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 跳过写入一半的行
+            try:
+                row = flatten_record(record)
+            except (KeyError, TypeError, AttributeError) as e:
+                print(f"[导出警告] 第 {n_rows + 1} 条记录格式异常，已跳过: {str(e)}")
+                continue
+            for key in row:
+                if key not in columns:
+                    columns[key] = [None] * n_rows
+            for key, col in columns.items():
+                col.append(row.get(key))
+            n_rows += 1
+    return columns
+
+
+def export_csv(jsonl_path, csv_path):
+    columns = load_columns(jsonl_path)
+    names = list(columns)
+    n_rows = len(columns[BASE_COLUMNS[0]])
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for i in range(n_rows):
+            writer.writerow(["" if columns[n][i] is None else columns[n][i] for n in names])
+    return csv_path
+
+
+class ResultSink:
+    """带缓冲的JSON Lines输出：累计 flush_every 条或超过 flush_interval 秒才落盘，关闭时导出同名CSV"""
+
+    def __init__(self, path, run="", flush_every=20, flush_interval=30.0):
+        self.path = path
+        self.run = run
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self._fh = None
+        self._unflushed = 0
+        self._last_flush = time.time()
+        self._timer = None
+        for old in (path, self.csv_path):
+            if os.path.exists(old):
+                os.remove(old)
+
+    @property
+    def csv_path(self):
+        return os.path.splitext(self.path)[0] + ".csv"
+
+    def write(self, result):
+        record = make_record(result, self.run)
+        with self.lock:
+            if self._fh is None:
+                self._fh = open(self.path, 'a', encoding='utf-8', buffering=64 * 1024)
+            self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every or time.time() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+            elif self._timer is None:
+                # 写入停顿时也保证在 flush_interval 内落盘
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return record
+
+    def _flush_locked(self):
+        if self._fh is not None:
+            self._fh.flush()
+        self._unflushed = 0
+        self._last_flush = time.time()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def close(self, export=True):
+        with self.lock:
+            self._flush_locked()
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+        if export and os.path.exists(self.path):
+            try:
+                export_csv(self.path, self.csv_path)
+            except Exception as e:
+                print(f"[导出错误] {str(e)}")
@@ -0,0 +1,60 @@
+#增量读取（tail）：只解析文件新追加的部分
+import os
+import threading
+
+
+class TailReader:
+    """按文件记录上次读取到的字节偏移，只读取新追加的完整行；
+    文件变小、开头或偏移处内容变化（被重写）时退回全量读取。
+    最后一行没有换行符时，文件大小和修改时间不再变化（与上次读取时相同，或调用方已确认写入稳定）后也读出"""
+
+    def __init__(self, head_bytes=4096, anchor_bytes=256, encoding='utf-8'):
+        self.head_bytes = head_bytes
+        self.anchor_bytes = anchor_bytes
+        self.encoding = encoding
+        self.states = {}  # path -> (offset, head, anchor, (大小, 修改时间))
+        self.lock = threading.Lock()
+
+    def read(self, path, settled=False):
+        """返回 (新文本, 是否为全量读取)；settled=True 表示调用方已确认文件写入稳定"""
+        with self.lock:
+            st = os.stat(path)
+            sig = (st.st_size, st.st_mtime_ns)
+            size = st.st_size
+            with open(path, 'rb') as f:
+                state = self.states.get(path)
+                full = state is None or not self._unchanged(f, size, state)
+                offset = 0 if full else state[0]
+                f.seek(offset)
+                data = f.read(size - offset)
+                # 只消费到最后一个换行符，未写完的行留到下次；
+                # 文件已不再变化时（如FullProf已退出）最后一行没有换行符也读出
+                end = data.rfind(b'\n') + 1
+                if end < len(data):
+                    stable = settled or (state is not None and state[3] == sig)
+                    st = os.stat(path)
+                    if stable and (st.st_size, st.st_mtime_ns) == sig:
+                        end = len(data)
+                data = data[:end]
+                new_offset = offset + end
+                f.seek(0)
+                head = f.read(min(self.head_bytes, new_offset))
+                anchor_start = max(0, new_offset - self.anchor_bytes)
+                f.seek(anchor_start)
+                anchor = f.read(new_offset - anchor_start)
+            self.states[path] = (new_offset, head, anchor, sig)
+        return data.decode(self.encoding, errors='ignore'), full
+
+    def _unchanged(self, f, size, state):
+        offset, head, anchor, _ = state
+        if size < offset:
+            return False
+        f.seek(0)
+        if f.read(len(head)) != head:
+            return False
+        f.seek(offset - len(anchor))
+        return f.read(len(anchor)) == anchor
+
+    def forget(self, path):
+        with self.lock:
+            self.states.pop(path, None)